@@ -1,7 +1,21 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 from search_engine import PropertySearchEngine
+from report_cache import ReportCache, make_cache_key
+from single_flight import SingleFlight
+from batch_analyze import BatchRunner
+from listing_store import ListingStore
+from gazetteer import Gazetteer
+from report_sections import REPORT_SECTIONS, SectionCleaner, plan_sections, clean_section, assemble_report, report_intro
+from retrieval import build_context, collect_snippets, encoder_loaded, estimate_tokens, get_encoder
+from rate_limiter import DEFAULT_LIMITS, RateLimiter, call_with_backoff, is_rate_limit_error, retry_after_seconds
+from warmer import RefreshAheadWarmer, parse_windows
+from report_render import render_report, assemble_report_html
+from http_cache import StaticAssets, build_response, compression_cache
+from metrics import (REGISTRY, CONTENT_TYPE, TRACE_HEADER, OPENAI_TOKENS, OPENAI_COST, CACHE_REQUESTS,
+                     track_upstream, start_request, finish_request, stats_collector, new_trace_id,
+                     current_trace_id, bind_context, install_trace_logging)
+from concurrent.futures import ThreadPoolExecutor
 import os
-from openai import OpenAI
 import time
 import re
 from dotenv import load_dotenv
@@ -9,64 +23,229 @@ import logging
 import sys
 from datetime import datetime, timedelta
 import json
+import sqlite3
+import threading
+import contextvars
 
-# 配置日志
+# 加载环境变量
+load_dotenv()
+
+# 配置日志；LOG_TRACE_ID 为true时每行日志带上请求的 trace ID（响应头 X-Trace-Id 中返回同一ID）
+LOG_TRACE_ID = os.getenv('LOG_TRACE_ID', 'true').lower() == 'true'
+install_trace_logging()
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(name)s - %(levelname)s - ' + ('[%(trace_id)s] ' if LOG_TRACE_ID else '') + '%(message)s',
     stream=sys.stdout
 )
 logger = logging.getLogger(__name__)
 
-# 加载环境变量
-load_dotenv()
-
-# 检查 OpenAI API key
+# 检查 OpenAI API key；缺失时服务仍可启动（缓存命中、/ready 可用），调用OpenAI时才报错
 api_key = os.getenv('OPENAI_API_KEY')
 if not api_key:
     logger.error("未找到 OPENAI_API_KEY 环境变量")
-    raise ValueError("未找到 OPENAI_API_KEY 环境变量")
 
-# 配置OpenAI API
-client = OpenAI(api_key=api_key)
+# OpenAI客户端按需创建：导入 openai 包和建立客户端（加载证书）需要数百毫秒，不应计入冷启动时间
+client = None
+client_lock = threading.Lock()
+
+def get_openai_client():
+    """获取共享的 OpenAI 客户端，未配置 API key 时抛出 ValueError"""
+    global client
+    with client_lock:
+        if client is None:
+            if not api_key:
+                raise ValueError("未找到 OPENAI_API_KEY 环境变量")
+            from openai import OpenAI
+            # 重试统一由 call_with_backoff 负责，关闭SDK自带的重试，避免重试次数相乘、绕过共享配额
+            client = OpenAI(api_key=api_key, max_retries=0)
+        return client
 
 # API使用量跟踪
 MONTHLY_BUDGET = 5.0  # 每月预算（美元）
 COST_PER_1K_INPUT_TOKENS = 0.0015  # GPT-3.5-turbo 输入价格
 COST_PER_1K_OUTPUT_TOKENS = 0.002   # GPT-3.5-turbo 输出价格
+OPENAI_MODEL = "gpt-3.5-turbo"
+
+# 报告缓存配置
+REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR', 'cache/reports')
+REPORT_CACHE_TTL = int(os.getenv('REPORT_CACHE_TTL', 7 * 24 * 3600))  # 秒，默认7天
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', 128))  # 内存LRU条目上限
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', 50 * 1024 * 1024))  # 磁盘缓存字节上限
+
+# 请求合并配置：thread 仅进程内合并，file 额外通过文件锁跨 worker 合并
+SINGLE_FLIGHT_MODE = os.getenv('SINGLE_FLIGHT_MODE', 'thread')
+SINGLE_FLIGHT_LOCK_DIR = os.getenv('SINGLE_FLIGHT_LOCK_DIR', 'cache/locks')
+SINGLE_FLIGHT_TIMEOUT = int(os.getenv('SINGLE_FLIGHT_TIMEOUT', 120))  # 等待同区域生成的最长秒数
+
+# 批量分析接口限制
+BATCH_MAX_SUBURBS = int(os.getenv('BATCH_MAX_SUBURBS', 100))  # 单次请求的区域数上限
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 4))  # 单次请求的并发上限
+
+# 使用量日志配置：按月分文件的SQLite（WAL模式）
+# 报告生成方式（sectioned: 按一级标题分段并行生成、分段缓存；single: 整篇一次生成）
+REPORT_MODE = os.getenv('REPORT_MODE', 'sectioned')
+REPORT_SECTION_WORKERS = int(os.getenv('REPORT_SECTION_WORKERS', 6))  # 分段并行生成的线程数
+# 各分段缓存有效期（秒），可用 REPORT_SECTION_TTL_<分段名> 覆盖，如 REPORT_SECTION_TTL_PRICES=604800
+REPORT_SECTION_TTLS = {
+    section['name']: int(os.getenv(f"REPORT_SECTION_TTL_{section['name'].upper()}", section['ttl']))
+    for section in REPORT_SECTIONS
+}
+
+# 检索增强：生成报告前搜索区域资料，去重排序后按token预算写入提示词
+RETRIEVAL_ENABLED = os.getenv('RETRIEVAL_ENABLED', 'true').lower() == 'true'
+RETRIEVAL_TIMEOUT = float(os.getenv('RETRIEVAL_TIMEOUT', 8))  # 搜索最长等待秒数，超时的分类不提供资料
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', 400))  # 每次OpenAI请求中参考资料的token上限
+
+# 上游限流：令牌桶状态保存在SQLite中，所有worker共享配额；配额应与账户的实际限额一致
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', 'cache/rate_limits.db')
+OPENAI_RPM = int(os.getenv('OPENAI_RPM', DEFAULT_LIMITS['openai']['requests']))  # 每分钟请求数
+OPENAI_TPM = int(os.getenv('OPENAI_TPM', DEFAULT_LIMITS['openai']['tokens']))  # 每分钟token数
+DDGS_RPM = int(os.getenv('DDGS_RPM', DEFAULT_LIMITS['ddgs']['requests']))  # DuckDuckGo每分钟请求数
+OPENAI_MAX_WAIT = float(os.getenv('OPENAI_MAX_WAIT', 10))  # 单次调用最多排队秒数，超过时返回429
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 2))  # OpenAI返回429时的重试次数
+
+# 缓存预热：热门区域的报告和搜索结果在过期前由后台重新生成（warmer.py）
+# 后台预热会持续消耗OpenAI预算，默认关闭，需要运维显式开启
+WARMER_ENABLED = os.getenv('WARMER_ENABLED', 'false').lower() == 'true'
+WARMER_TOP_N = int(os.getenv('WARMER_TOP_N', 20))  # 预热的热门区域数
+WARMER_MIN_REQUESTS = int(os.getenv('WARMER_MIN_REQUESTS', 3))  # 统计期内请求次数达到该值才算热门
+WARMER_POPULARITY_DAYS = int(os.getenv('WARMER_POPULARITY_DAYS', 7))  # 热度统计的天数
+WARMER_INTERVAL = float(os.getenv('WARMER_INTERVAL', 900))  # 两轮预热的间隔（秒）
+WARMER_LEAD_TIME = float(os.getenv('WARMER_LEAD_TIME', 600))  # 额外提前量（秒），覆盖生成本身的耗时
+WARMER_WINDOWS = parse_windows(os.getenv('WARMER_WINDOWS', ''))  # 低峰时段，如 01:00-06:00；为空时不限
+WARMER_BUDGET_SHARE = float(os.getenv('WARMER_BUDGET_SHARE', 0.2))  # 预热费用占月度预算的上限比例
+WARMER_LOCK_PATH = os.getenv('WARMER_LOCK_PATH', 'cache/locks/warmer.lock')  # 多worker部署时只有一个在预热
+
+# 冷启动：OpenAI客户端、使用量数据库、区域索引和搜索会话都在第一次使用时初始化，导入本模块不做这些工作；
+# PREWARM_ON_START 为true时在服务启动后（gunicorn 下为第一个请求时）由后台线程提前初始化
+PREWARM_ON_START = os.getenv('PREWARM_ON_START', 'true').lower() == 'true'
+
+# 本地房源数据（由 crawler.py 写入），存在时用于为分析报告提供价格数据
+LISTING_STORE_DB = os.getenv('LISTING_STORE_DB', 'cache/listing_store.db')
+
+USAGE_DB_DIR = os.getenv('USAGE_DB_DIR', 'usage_logs')
+USAGE_REFRESH_INTERVAL = float(os.getenv('USAGE_REFRESH_INTERVAL', 5))  # 从数据库刷新月度总额的间隔（秒）
+LEGACY_USAGE_FILE = 'demo_api_usage.json'  # 旧版JSON格式的使用量文件，启动时自动迁移
+
+USAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    day TEXT NOT NULL,
+    suburb TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_totals (
+    day TEXT NOT NULL,
+    suburb TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, suburb)
+);
+CREATE TABLE IF NOT EXISTS source_totals (
+    day TEXT NOT NULL,
+    source TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, source)
+);
+CREATE TABLE IF NOT EXISTS lookups (
+    day TEXT NOT NULL,
+    suburb TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, suburb)
+);
+"""
+
+# 费用归属：user 为用户请求，后台预热期间为 warmer；分段线程通过 bind_context 继承
+usage_source = contextvars.ContextVar('usage_source', default='user')
 
 class APIUsageTracker:
-    def __init__(self, budget_limit=MONTHLY_BUDGET):
+    """API使用量跟踪
+
+    每次请求以追加方式写入当月的SQLite日志（WAL模式，多个gunicorn worker可安全并发写入），
+    同一事务内更新按天、按区域和按费用来源（用户请求或预热）的汇总表。月度总费用保存在内存中，启动时从汇总表重建，
+    并按 refresh_interval 定期刷新以包含其他worker的写入。每个月使用单独的数据库文件，
+    跨月时自动切换到新文件，旧文件即为归档。
+
+    每次报告查询（含缓存命中）另外计入 lookups 表，作为预热挑选热门区域的依据。
+    """
+
+    def __init__(self, budget_limit=MONTHLY_BUDGET, db_dir=USAGE_DB_DIR, refresh_interval=USAGE_REFRESH_INTERVAL):
         self.budget_limit = budget_limit
-        self.usage_file = 'demo_api_usage.json'  # 改为演示版本专用的文件
-        self.load_usage()
+        self.db_dir = db_dir
+        self.refresh_interval = refresh_interval
+        self.current_month = None
+        self.total_cost = 0.0
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self.ready = False
+
+    def ensure_ready(self):
+        """首次使用时创建目录、加载当月总额并迁移旧版数据，不在导入时访问磁盘"""
+        if self.ready:
+            return
+        with self._init_lock:
+            if self.ready:
+                return
+            os.makedirs(self.db_dir, exist_ok=True)
+            self._switch_month()
+            self.import_legacy_usage()
+            self.ready = True
 
-    def load_usage(self):
+    def db_path(self, month):
+        return os.path.join(self.db_dir, f"demo_api_usage_{month}.db")
+
+    def _connect(self, month):
+        """每个线程为每个月份保持一个连接"""
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(month)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path(month), timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(USAGE_SCHEMA)
+            conns[month] = conn
+        return conn
+
+    def refresh_total(self):
+        """从汇总表重建当月总费用"""
         try:
-            if os.path.exists(self.usage_file):
-                with open(self.usage_file, 'r') as f:
-                    self.usage_data = json.load(f)
-            else:
-                self.reset_usage_data()
+            row = self._connect(self.current_month).execute(
+                'SELECT COALESCE(SUM(cost), 0) FROM daily_totals'
+            ).fetchone()
+            with self._lock:
+                self.total_cost = row[0]
+                self._last_refresh = time.time()
         except Exception as e:
             logger.error(f"加载使用量数据失败: {str(e)}")
-            self.reset_usage_data()
-
-    def reset_usage_data(self):
-        """重置使用量数据"""
-        self.usage_data = {
-            'current_month': datetime.now().strftime('%Y-%m'),
-            'total_cost': 0.0,
-            'requests': [],
-            'api_key_last_4': api_key[-4:]  # 记录API key的最后4位以便识别
-        }
 
-    def save_usage(self):
+    def import_legacy_usage(self):
+        """将旧版 demo_api_usage.json 中当月的记录迁移到SQLite日志"""
+        if not os.path.exists(LEGACY_USAGE_FILE):
+            return
         try:
-            with open(self.usage_file, 'w') as f:
-                json.dump(self.usage_data, f, indent=2)
+            with open(LEGACY_USAGE_FILE, 'r') as f:
+                legacy = json.load(f)
+            if legacy.get('current_month') == self.current_month and self.total_cost == 0:
+                for item in legacy.get('requests', []):
+                    self._append(item['timestamp'], item.get('suburb', ''), item.get('input_tokens', 0),
+                                 item.get('output_tokens', 0), item.get('cost', 0.0))
+                self.refresh_total()
+            os.replace(LEGACY_USAGE_FILE, LEGACY_USAGE_FILE + '.migrated')
+            logger.info("已迁移旧版使用量数据")
         except Exception as e:
-            logger.error(f"保存使用量数据失败: {str(e)}")
+            logger.error(f"迁移旧版使用量数据失败: {str(e)}")
 
     def calculate_cost(self, input_tokens, output_tokens):
         input_cost = (input_tokens / 1000) * COST_PER_1K_INPUT_TOKENS
@@ -74,89 +253,728 @@ class APIUsageTracker:
         return input_cost + output_cost
 
     def check_and_update_month(self):
+        self.ensure_ready()
+        self._switch_month()
+
+    def _switch_month(self):
         current_month = datetime.now().strftime('%Y-%m')
-        if self.usage_data['current_month'] != current_month:
-            self.usage_data = {
-                'current_month': current_month,
-                'total_cost': 0.0,
-                'requests': []
-            }
-            self.save_usage()
+        if self.current_month != current_month:
+            if self.current_month is not None:
+                logger.info(f"进入新月份 {current_month}，切换使用量日志")
+            self.current_month = current_month
+            self.refresh_total()
 
     def can_make_request(self):
         self.check_and_update_month()
-        return self.usage_data['total_cost'] < self.budget_limit
+        if time.time() - self._last_refresh > self.refresh_interval:
+            self.refresh_total()
+        return self.total_cost < self.budget_limit
+
+    def month_cost(self):
+        """当月累计费用"""
+        self.check_and_update_month()
+        return self.total_cost
+
+    def _append(self, timestamp, suburb, input_tokens, output_tokens, cost, source='user'):
+        """在一个事务内追加请求记录并更新日汇总"""
+        day = timestamp[:10]
+        conn = self._connect(timestamp[:7])
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT INTO requests (timestamp, day, suburb, input_tokens, output_tokens, cost) VALUES (?, ?, ?, ?, ?, ?)',
+                (timestamp, day, suburb, input_tokens, output_tokens, cost)
+            )
+            conn.execute(
+                """INSERT INTO daily_totals (day, suburb, requests, input_tokens, output_tokens, cost)
+                   VALUES (?, ?, 1, ?, ?, ?)
+                   ON CONFLICT(day, suburb) DO UPDATE SET
+                       requests = requests + 1,
+                       input_tokens = input_tokens + excluded.input_tokens,
+                       output_tokens = output_tokens + excluded.output_tokens,
+                       cost = cost + excluded.cost""",
+                (day, suburb, input_tokens, output_tokens, cost)
+            )
+            conn.execute(
+                """INSERT INTO source_totals (day, source, requests, cost) VALUES (?, ?, 1, ?)
+                   ON CONFLICT(day, source) DO UPDATE SET
+                       requests = requests + 1,
+                       cost = cost + excluded.cost""",
+                (day, source, cost)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
 
     def track_request(self, input_tokens, output_tokens, suburb):
         cost = self.calculate_cost(input_tokens, output_tokens)
-        self.usage_data['total_cost'] += cost
-        self.usage_data['requests'].append({
-            'timestamp': datetime.now().isoformat(),
-            'suburb': suburb,
-            'input_tokens': input_tokens,
-            'output_tokens': output_tokens,
-            'cost': cost
-        })
-        self.save_usage()
+        self.check_and_update_month()
+        try:
+            self._append(datetime.now().isoformat(), suburb, input_tokens, output_tokens, cost, usage_source.get())
+        except Exception as e:
+            logger.error(f"保存使用量数据失败: {str(e)}")
+        with self._lock:
+            self.total_cost += cost
+        OPENAI_TOKENS.inc(input_tokens, kind='input')
+        OPENAI_TOKENS.inc(output_tokens, kind='output')
+        OPENAI_COST.inc(cost)
         return cost
 
-# 创建API使用量跟踪器
+    def record_lookup(self, suburb):
+        """记录一次区域报告查询（含缓存命中），单条UPSERT语句，失败只记录日志"""
+        self.check_and_update_month()
+        try:
+            self._connect(self.current_month).execute(
+                """INSERT INTO lookups (day, suburb, requests) VALUES (?, ?, 1)
+                   ON CONFLICT(day, suburb) DO UPDATE SET requests = requests + 1""",
+                (datetime.now().strftime('%Y-%m-%d'), suburb)
+            )
+        except Exception as e:
+            logger.error(f"记录区域查询失败: {str(e)}")
+
+    def popular_suburbs(self, days=7, limit=20, min_requests=1):
+        """最近 days 天请求次数最多的区域，返回 [(区域, 次数)]；统计期跨月时合并各月的数据库"""
+        self.check_and_update_month()
+        since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        months = [since[:7]]
+        while months[-1] < self.current_month:
+            year, mon = map(int, months[-1].split('-'))
+            months.append(f"{year + mon // 12:04d}-{mon % 12 + 1:02d}")
+        counts = {}
+        for month in months:
+            if month != self.current_month and not os.path.exists(self.db_path(month)):
+                continue
+            try:
+                rows = self._connect(month).execute(
+                    'SELECT suburb, SUM(requests) FROM lookups WHERE day >= ? GROUP BY suburb', (since,)
+                ).fetchall()
+            except Exception as e:
+                logger.error(f"读取区域热度失败: {str(e)}")
+                continue
+            for suburb, requests in rows:
+                counts[suburb] = counts.get(suburb, 0) + requests
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return [(suburb, requests) for suburb, requests in ranked if requests >= min_requests][:limit]
+
+    def source_cost(self, source):
+        """当月某一费用来源（user / warmer）的累计费用"""
+        self.check_and_update_month()
+        row = self._connect(self.current_month).execute(
+            'SELECT COALESCE(SUM(cost), 0) FROM source_totals WHERE source = ?', (source,)
+        ).fetchone()
+        return row[0]
+
+    def breakdown(self, by='suburb', month=None):
+        """按区域或按天汇总使用量，只读取汇总表"""
+        self.check_and_update_month()
+        month = month or self.current_month
+        if not re.fullmatch(r'\d{4}-\d{2}', month):
+            return []
+        if month != self.current_month and not os.path.exists(self.db_path(month)):
+            return []
+        column = 'day' if by == 'day' else 'suburb'
+        order = 'day' if by == 'day' else 'cost DESC'
+        rows = self._connect(month).execute(
+            f"""SELECT {column}, SUM(requests), SUM(input_tokens), SUM(output_tokens), SUM(cost)
+                FROM daily_totals GROUP BY {column} ORDER BY {order}"""
+        ).fetchall()
+        return [
+            {
+                column: row[0],
+                'requests': row[1],
+                'input_tokens': row[2],
+                'output_tokens': row[3],
+                'cost': round(row[4], 4)
+            }
+            for row in rows
+        ]
+
+# 创建API使用量跟踪器（数据库在第一次使用时才打开）
 usage_tracker = APIUsageTracker()
 
-app = Flask(__name__)
+# 创建报告缓存
+report_cache = ReportCache(
+    cache_dir=REPORT_CACHE_DIR,
+    ttl=REPORT_CACHE_TTL,
+    max_memory_entries=REPORT_CACHE_MAX_ENTRIES,
+    max_disk_bytes=REPORT_CACHE_MAX_BYTES
+)
+
+# 创建请求合并器，同一区域的并发请求只调用一次OpenAI
+report_flight = SingleFlight(
+    lock_dir=SINGLE_FLIGHT_LOCK_DIR if SINGLE_FLIGHT_MODE == 'file' else None,
+    timeout=SINGLE_FLIGHT_TIMEOUT
+)
+
+# 创建上游限流器，OpenAI 和 DuckDuckGo 的配额在所有worker之间共享
+rate_limiter = RateLimiter(RATE_LIMIT_DB, {
+    'openai': {'requests': OPENAI_RPM, 'tokens': OPENAI_TPM},
+    'ddgs': {'requests': DDGS_RPM},
+} if RATE_LIMIT_ENABLED else {})
+
+# 分段生成共用的线程池
+section_executor = ThreadPoolExecutor(max_workers=REPORT_SECTION_WORKERS, thread_name_prefix='section')
+
+# 静态文件由 send_static 提供（内容哈希URL、压缩），不使用 Flask 自带的静态路由
+app = Flask(__name__, static_folder=None)
 # 确保JSON输出中文不被转义
 app.config['JSON_AS_ASCII'] = False
 
+static_assets = StaticAssets(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+# 模板中用 static_url('style.css') 生成带内容哈希的URL
+app.jinja_env.globals['static_url'] = static_assets.url
+
+@app.before_request
+def begin_request_metrics():
+    """记录请求开始时间和并发数，并设置本请求的 trace ID"""
+    new_trace_id(request.headers.get(TRACE_HEADER) or request.headers.get('X-Request-ID'))
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'other'
+    g.metrics_started_at = start_request(g.metrics_route)
+    start_background_tasks()
+
+@app.after_request
+def end_request_metrics(response):
+    """响应结束（流式响应发送完毕）时记录耗时和状态码"""
+    started_at = g.get('metrics_started_at')
+    if started_at is not None:
+        route, method, status = g.metrics_route, request.method, response.status_code
+        response.call_on_close(lambda: finish_request(route, method, status, started_at))
+    response.headers[TRACE_HEADER] = current_trace_id()
+    return response
+
 @app.route('/static/<path:path>')
 def send_static(path):
-    return send_from_directory('static', path)
+    """静态文件：URL带当前内容哈希时允许浏览器永久缓存，按 Accept-Encoding 压缩，支持304"""
+    result = static_assets.response(path, request.args.get('v'), request.headers.get('Accept-Encoding', ''),
+                                    request.headers.get('If-None-Match'))
+    if result is None:
+        return jsonify({'error': '请求的页面不存在'}), 404
+    status, headers, body = result
+    return Response(body, status=status, headers=headers)
+
+# 搜索引擎按需创建，只有批量分析等功能会用到
+search_engine = None
+search_engine_lock = threading.Lock()
+
+def get_search_engine():
+    """获取共享的 PropertySearchEngine 实例"""
+    global search_engine
+    with search_engine_lock:
+        if search_engine is None:
+            search_engine = PropertySearchEngine(rate_limiter=rate_limiter)
+        return search_engine
 
-# 暂时注释掉未使用的search_engine
-# search_engine = PropertySearchEngine()
+# 房源存储只在数据库文件存在时打开，避免为没有爬取数据的部署创建空库
+listing_store = None
+listing_store_lock = threading.Lock()
+
+def get_listing_store():
+    """获取共享的 ListingStore 实例，尚无房源数据时返回None"""
+    global listing_store
+    with listing_store_lock:
+        if listing_store is None and os.path.exists(LISTING_STORE_DB):
+            listing_store = ListingStore(LISTING_STORE_DB)
+        return listing_store
+
+def listing_context(suburb):
+    """本地房源数据摘要，用于让报告中的价格信息有据可依"""
+    store = get_listing_store()
+    if store is None:
+        return None
+    try:
+        return store.prompt_context(suburb)
+    except Exception as e:
+        logger.error(f"读取房源数据失败: {str(e)}")
+        return None
+
+# 区域索引按需加载（约三千个区域，加载约0.1秒），PREWARM_ON_START 时由预热线程提前加载
+gazetteer = None
+gazetteer_lock = threading.Lock()
+
+def get_gazetteer():
+    """获取共享的 Gazetteer 实例"""
+    global gazetteer
+    with gazetteer_lock:
+        if gazetteer is None:
+            gazetteer = Gazetteer.load()
+        return gazetteer
 
 def standardize_suburb(suburb):
-    """标准化区域名称，处理包含邮编的情况"""
-    # 移除多余空格并转小写
-    suburb = suburb.lower().strip()
-    
-    # 处理包含3030邮编的情况
-    if '3030' in suburb:
-        return 'point cook'
-        
-    # 如果输入就是3030
-    if suburb == '3030':
-        return 'point cook'
-        
-    return suburb
+    """标准化区域名称：别名、拼写错误、带邮编或仅邮编的输入都归并为规范的小写区域名
 
-def analyze_with_openai(suburb):
+    区域索引中找不到时退回为去除多余空格后的小写输入
+    """
+    canonical = get_gazetteer().resolve(suburb)
+    if canonical:
+        return canonical
+    return ' '.join(suburb.lower().split())
+
+def suggest_suburbs(query, limit=8):
+    """自动补全候选及输入对应的规范区域名"""
+    index = get_gazetteer()
+    return {
+        'query': query,
+        'canonical': index.resolve(query) if query.strip() else None,
+        'suggestions': index.suggest(query, limit) if query.strip() else []
+    }
+
+def retrieve_search_results(suburb):
+    """为报告生成搜索区域资料，返回去重后的资料列表；未启用或搜索失败时返回None"""
+    if not RETRIEVAL_ENABLED:
+        return None
+    try:
+        results = get_search_engine().search_suburb(suburb, timeout=RETRIEVAL_TIMEOUT)
+    except Exception as e:
+        logger.error(f"检索区域资料失败: {str(e)}")
+        return None
+    snippets = collect_snippets(results)
+    logger.info(f"检索到 {len(snippets)} 条去重后的参考资料")
+    return snippets
+
+def search_context(suburb, search_results, keywords=()):
+    """把检索资料按相关度排序并装入token预算，返回参考资料文本；没有可用资料时返回None"""
+    if not search_results:
+        return None
+    packed = build_context(search_results, suburb, keywords, RETRIEVAL_TOKEN_BUDGET, OPENAI_MODEL)
+    logger.info(f"参考资料: {packed['used']}条，{packed['tokens']} tokens（预算{RETRIEVAL_TOKEN_BUDGET}），"
+                f"未装入{packed['dropped']}条")
+    return packed['text'] or None
+
+def build_completion_params(suburb, search_results=None):
+    """构建分析报告的OpenAI请求参数"""
+    prompt = f"请分析{suburb}区域的购房因素"
+    context = listing_context(suburb)
+    if context:
+        prompt += f"\n\n以下是该区域的实际在售房源数据，价格相关内容请以此为准：\n{context}"
+    references = search_context(suburb, search_results)
+    if references:
+        prompt += f"\n\n{references}"
+    return {
+        'model': OPENAI_MODEL,
+        'messages': [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        'temperature': 0.2,  # 降低创造性，提高稳定性
+        'max_tokens': 2000,
+        'top_p': 0.8
+    }
+
+def openai_token_estimate(params):
+    """调用前预扣的token配额：提示词的估算token数加上输出上限"""
+    return sum(estimate_tokens(m['content']) for m in params['messages']) + params.get('max_tokens', 0)
+
+def create_completion(operation, params, **kwargs):
+    """在共享配额内调用OpenAI
+
+    先排队等待请求数和token配额（超过 OPENAI_MAX_WAIT 抛出 RateLimitTimeout），上游返回429时
+    按 Retry-After 或带抖动的指数退避重试，完成后按实际用量结算预扣的token，
+    任何失败（限流、超时、5xx）都全额退还本次预扣。
+    流式调用只在建立连接前重试，用量由调用方在流结束时结算。
+    """
+    reserved = openai_token_estimate(params)
+
+    def call():
+        rate_limiter.acquire('openai', tokens=reserved, max_wait=OPENAI_MAX_WAIT)
+        try:
+            with track_upstream('openai', operation):
+                return get_openai_client().chat.completions.create(**params, **kwargs)
+        except Exception:
+            # 限流、超时和5xx等失败的请求都按0结算，释放预扣的token
+            rate_limiter.settle('openai', reserved, 0)
+            raise
+
+    response = call_with_backoff(call, max_retries=OPENAI_MAX_RETRIES, max_delay=OPENAI_MAX_WAIT,
+                                 limiter=rate_limiter, upstream='openai', retry_queue_timeout=False)
+    if not kwargs.get('stream'):
+        rate_limiter.settle('openai', reserved, response.usage.total_tokens)
+    return response
+
+def analyze_with_openai(suburb, search_results=None):
     """使用OpenAI分析区域信息"""
     try:
         start_time = time.time()
         logger.info("开始生成分析报告...")
         
         # 调用OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"请分析{suburb}区域的购房因素"}
-            ],
-            temperature=0.2,  # 降低创造性，提高稳定性
-            max_tokens=2000,
-            top_p=0.8
-        )
+        response = create_completion('report', build_completion_params(suburb, search_results))
         
         # 记录API调用时间和token使用情况
         end_time = time.time()
         logger.info(f"分析报告生成完成，用时: {end_time - start_time:.2f}秒，使用tokens: {response.usage.total_tokens}")
+        usage_tracker.track_request(response.usage.prompt_tokens, response.usage.completion_tokens, suburb)
         
         return response.choices[0].message.content
         
     except Exception as e:
+        if is_rate_limit_error(e):
+            # 限流错误原样抛出，便于调用方返回429或退避重试
+            logger.error("OpenAI API限流")
+            raise
         logger.error(f"OpenAI API调用失败: {str(e)}")
         raise Exception("生成分析报告时出错，请稍后重试")
 
+def analyze_with_openai_stream(suburb, search_results=None):
+    """使用OpenAI流式接口分析区域信息，逐段产出生成的文本"""
+    logger.info("开始流式生成分析报告...")
+    yield from stream_completion('report_stream', build_completion_params(suburb, search_results), suburb)
+
+def stream_completion(operation, params, suburb):
+    """流式调用OpenAI，逐段产出生成的文本，流结束（或客户端断开）时记录token用量"""
+    start_time = time.time()
+    try:
+        # 流式调用的耗时记录到响应开始返回为止
+        stream = create_completion(operation, params,
+                                   stream=True,
+                                   stream_options={"include_usage": True})  # 最后一个分片返回token用量
+    except Exception as e:
+        if is_rate_limit_error(e):
+            logger.error("OpenAI API限流")
+            raise
+        logger.error(f"OpenAI API调用失败: {str(e)}")
+        raise Exception("生成分析报告时出错，请稍后重试")
+
+    usage = None
+    output_chunks = 0
+    first_token_time = None
+    try:
+        for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                    logger.info(f"首个token到达，用时: {first_token_time - start_time:.2f}秒")
+                output_chunks += 1
+                yield delta
+    finally:
+        stream.close()
+        # 客户端中途断开时拿不到最后的用量分片，按已产出的内容估算，保证预算统计不遗漏
+        if usage:
+            input_tokens, output_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            logger.warning("流式响应未返回token用量，使用估算值")
+            input_tokens = sum(estimate_tokens(m['content']) for m in params['messages'])
+            output_tokens = output_chunks
+        usage_tracker.track_request(input_tokens, output_tokens, suburb)
+        rate_limiter.settle('openai', openai_token_estimate(params), input_tokens + output_tokens)
+        logger.info(f"流式生成结束，用时: {time.time() - start_time:.2f}秒，使用tokens: {input_tokens + output_tokens}")
+
+def build_section_params(suburb, section, search_results=None):
+    """构建单个报告分段的OpenAI请求参数，参考资料按该分段的关键词筛选"""
+    prompt = f"请分析{suburb}区域的{'、'.join(section['titles'])}"
+    if section.get('grounded'):
+        context = listing_context(suburb)
+        if context:
+            prompt += f"\n\n以下是该区域的实际在售房源数据，价格相关内容请以此为准：\n{context}"
+    references = search_context(suburb, search_results, section.get('keywords', ()))
+    if references:
+        prompt += f"\n\n{references}"
+    return {
+        'model': OPENAI_MODEL,
+        'messages': [
+            {"role": "system", "content": section['prompt']},
+            {"role": "user", "content": prompt}
+        ],
+        'temperature': 0.2,
+        'max_tokens': section['max_tokens'],
+        'top_p': 0.8
+    }
+
+def section_cache_key(suburb, section):
+    """分段缓存键：区域名和分段名 + 分段提示词哈希 + 模型"""
+    return make_cache_key(f"{suburb}#{section['name']}", section['prompt'], OPENAI_MODEL)
+
+def get_cached_section(suburb, section):
+    return report_cache.get(section_cache_key(suburb, section))
+
+def store_section(suburb, section, text):
+    """写入分段缓存，有效期为该分段的TTL"""
+    return report_cache.set(section_cache_key(suburb, section), {
+        'suburb': suburb,
+        'section': section['name'],
+        'model': OPENAI_MODEL,
+        'analysis': text,
+        'html': render_report(text)
+    }, ttl=section['ttl'])
+
+def analyze_section(suburb, section, search_results=None):
+    """生成单个报告分段并写入缓存，返回分段文本"""
+    start_time = time.time()
+    response = create_completion('section', build_section_params(suburb, section, search_results))
+    usage_tracker.track_request(response.usage.prompt_tokens, response.usage.completion_tokens, suburb)
+    text = response.choices[0].message.content
+    if not text:
+        raise Exception(f"报告分段 {section['name']} 生成结果为空")
+    logger.info(f"报告分段 {section['name']} 生成完成，用时: {time.time() - start_time:.2f}秒，"
+                f"使用tokens: {response.usage.total_tokens}")
+    return store_section(suburb, section, clean_section(text, section))['analysis']
+
+def analyze_section_stream(suburb, section, search_results=None):
+    """流式生成单个报告分段，逐段产出文本，完整生成后写入分段缓存"""
+    cleaner = SectionCleaner(section)
+    parts = []
+    for delta in stream_completion('section_stream', build_section_params(suburb, section, search_results), suburb):
+        text = cleaner.feed(delta)
+        if text:
+            parts.append(text)
+            yield text
+    text = cleaner.close()
+    if text:
+        parts.append(text)
+        yield text
+    text = ''.join(parts)
+    if not text:
+        raise Exception(f"报告分段 {section['name']} 生成结果为空")
+    store_section(suburb, section, clean_section(text, section))
+
+def generate_sections(suburb, refresh=(), stream=False):
+    """分段生成报告，按模板顺序逐段产出文本，拼接后即为完整报告
+
+    未过期的分段直接复用缓存，其余分段（以及 refresh 中指定的分段）并行生成。
+    某段失败时其他分段仍会写入缓存，重试时只需重新生成失败的分段。
+    stream 为 True 时第一个待生成的分段改用流式接口逐token产出，首个token不必等整段生成完；
+    其余分段照常并行生成，轮到时整段产出。
+    """
+    sections = REPORT_PLAN['sections']
+    texts = {}
+    missing = []
+    for section in sections:
+        cached = None if section['name'] in refresh else get_cached_section(suburb, section)
+        if cached:
+            texts[section['name']] = cached['analysis']
+        else:
+            missing.append(section)
+    pending = {}
+    streamed = missing[0]['name'] if stream and missing else None
+    if missing:
+        logger.info(f"{suburb} 需要生成 {len(missing)}/{len(sections)} 个报告分段: "
+                    f"{', '.join(section['name'] for section in missing)}")
+        # 所有待生成分段共用一次搜索（搜索结果本身也有缓存）
+        search_results = retrieve_search_results(suburb)
+        for section in missing:
+            if section['name'] == streamed:
+                continue
+            pending[section['name']] = section_executor.submit(bind_context(analyze_section), suburb, section,
+                                                               search_results)
+
+    yield report_intro(REPORT_PLAN['intro'], suburb)
+    for section in sections:
+        if section['name'] == streamed:
+            yield '\n\n'
+            yield from analyze_section_stream(suburb, section, search_results)
+            continue
+        text = texts.get(section['name'])
+        if text is None:
+            text = pending[section['name']].result()
+        yield '\n\n' + text
+
+def report_stream(suburb):
+    """按当前报告生成方式逐段产出报告文本"""
+    if REPORT_MODE == 'sectioned':
+        return generate_sections(suburb, stream=True)
+    return analyze_with_openai_stream(suburb, retrieve_search_results(suburb))
+
+def report_cache_key(suburb):
+    """报告缓存键：标准化区域名 + 提示词哈希 + 模型；分段模式下也用作请求合并的键"""
+    return make_cache_key(suburb, SYSTEM_PROMPT, OPENAI_MODEL)
+
+def get_cached_report(suburb):
+    """查询报告缓存，命中返回缓存条目，否则返回None
+
+    分段模式下所有分段都未过期才算命中，返回拼接后的报告及HTML，created_at 取最早的分段；
+    没有 html 字段的旧条目在读取时补充渲染
+    """
+    if REPORT_MODE != 'sectioned':
+        entry = report_cache.get(report_cache_key(suburb))
+        CACHE_REQUESTS.inc(cache='report', result='hit' if entry else 'miss')
+        if entry and 'html' not in entry:
+            entry = dict(entry, html=render_report(entry['analysis']))
+        return entry
+    entries = []
+    for section in REPORT_PLAN['sections']:
+        entry = get_cached_section(suburb, section)
+        if entry is None:
+            CACHE_REQUESTS.inc(cache='report', result='miss')
+            return None
+        entries.append(entry)
+    CACHE_REQUESTS.inc(cache='report', result='hit')
+    return {
+        'suburb': suburb,
+        'model': OPENAI_MODEL,
+        'analysis': assemble_report(REPORT_PLAN['intro'], suburb, [entry['analysis'] for entry in entries]),
+        'html': assemble_report_html(REPORT_PLAN['intro'], suburb,
+                                     [entry.get('html') or render_report(entry['analysis']) for entry in entries]),
+        'created_at': min(entry['created_at'] for entry in entries)
+    }
+
+def store_report(suburb, analysis):
+    """将生成的报告及其HTML写入缓存；分段模式下各分段已在生成时分别缓存，这里只构造条目"""
+    entry = {
+        'suburb': suburb,
+        'model': OPENAI_MODEL,
+        'analysis': analysis,
+        'html': render_report(analysis)
+    }
+    if REPORT_MODE == 'sectioned':
+        entry['created_at'] = time.time()
+        return entry
+    return report_cache.set(report_cache_key(suburb), entry)
+
+def generate_report(suburb):
+    """生成报告并写入缓存；同一区域的并发请求合并为一次生成
+
+    返回 (缓存条目, 是否为共享结果)，报告为空时缓存条目为None
+    """
+    def generate():
+        if REPORT_MODE == 'sectioned':
+            analysis = ''.join(generate_sections(suburb))
+        else:
+            analysis = analyze_with_openai(suburb, retrieve_search_results(suburb))
+        if not analysis:
+            return None
+        return store_report(suburb, analysis)
+
+    return report_flight.do(report_cache_key(suburb), generate, recheck=lambda: get_cached_report(suburb))
+
+def get_or_generate_report(suburb):
+    """返回区域报告，优先使用缓存；供批量分析使用"""
+    cached = get_cached_report(suburb)
+    if cached:
+        return {'analysis': cached['analysis'], 'cached': True}
+    entry, shared = generate_report(suburb)
+    if not entry:
+        raise Exception("生成分析报告失败，请重试")
+    return {'analysis': entry['analysis'], 'cached': False, 'coalesced': shared}
+
+def stale_sections(suburb, horizon):
+    """在时间戳 horizon 之前会过期或尚未缓存的报告分段名；整篇模式下为 ['report']"""
+    if REPORT_MODE != 'sectioned':
+        entry = report_cache.peek(report_cache_key(suburb))
+        return [] if entry and report_cache.expires_at(entry) > horizon else ['report']
+    stale = []
+    for section in REPORT_PLAN['sections']:
+        entry = report_cache.peek(section_cache_key(suburb, section))
+        if entry is None or report_cache.expires_at(entry) <= horizon:
+            stale.append(section['name'])
+    return stale
+
+def warm_report(suburb, sections):
+    """预热：重新生成即将过期的报告分段（整篇模式下重新生成整篇报告），费用计入 warmer 来源
+
+    旧条目在新内容写入前仍然有效，预热期间的用户请求照常命中缓存；同一区域的并发生成照常合并。
+    """
+    def generate():
+        if REPORT_MODE == 'sectioned':
+            analysis = ''.join(generate_sections(suburb, refresh=sections))
+        else:
+            analysis = analyze_with_openai(suburb, retrieve_search_results(suburb))
+        return store_report(suburb, analysis) if analysis else None
+
+    token = usage_source.set('warmer')
+    try:
+        return report_flight.do(report_cache_key(suburb), generate)[0]
+    finally:
+        usage_source.reset(token)
+
+def warm_search(suburb, horizon):
+    """预热：重新搜索在 horizon 之前会过期的搜索结果，只在启用检索增强时执行"""
+    if not RETRIEVAL_ENABLED:
+        return
+    engine = get_search_engine()
+    if engine.cache is None:
+        return
+    engine.search_suburb(suburb, max_age=max(0, engine.cache.ttl - (horizon - time.time())))
+
+def warmer_budget_available():
+    """预热费用不超过月度预算的 WARMER_BUDGET_SHARE，且总费用未超出月度预算"""
+    return (usage_tracker.can_make_request()
+            and usage_tracker.source_cost('warmer') < MONTHLY_BUDGET * WARMER_BUDGET_SHARE)
+
+warmer = RefreshAheadWarmer(
+    popular=lambda limit: usage_tracker.popular_suburbs(WARMER_POPULARITY_DAYS, limit, WARMER_MIN_REQUESTS),
+    stale=stale_sections,
+    refresh=warm_report,
+    refresh_search=warm_search,
+    budget_check=warmer_budget_available,
+    top_n=WARMER_TOP_N,
+    interval=WARMER_INTERVAL,
+    lead_time=WARMER_LEAD_TIME,
+    windows=WARMER_WINDOWS,
+    lock_path=WARMER_LOCK_PATH
+)
+
+def warm_tokenizer():
+    """预先加载检索打包使用的 tiktoken 编码表（首次可能需要下载），加载失败时按字符估算"""
+    if RETRIEVAL_ENABLED and get_encoder(OPENAI_MODEL) is None:
+        raise RuntimeError("tiktoken编码表不可用，检索资料按估算的token数打包")
+
+# 按需初始化的组件：(名称, 是否为提供服务所必需, 是否已初始化, 初始化函数)
+LAZY_COMPONENTS = (
+    ('usage', True, lambda: usage_tracker.ready, usage_tracker.ensure_ready),
+    ('gazetteer', True, lambda: gazetteer is not None, get_gazetteer),
+    ('openai', True, lambda: client is not None, get_openai_client),
+    ('search', False, lambda: search_engine is not None and search_engine.ready,
+     lambda: get_search_engine().warm_up()),
+    ('tokenizer', False, lambda: not RETRIEVAL_ENABLED or encoder_loaded(OPENAI_MODEL), warm_tokenizer),
+)
+
+def warm_up(components=LAZY_COMPONENTS):
+    """依次初始化各组件，返回 {名称: 状态}；已初始化的组件直接返回，单个组件失败不影响其他组件"""
+    results = {}
+    for name, required, _, init in components:
+        start_time = time.perf_counter()
+        try:
+            init()
+            results[name] = {'initialized': True, 'required': required,
+                             'ms': round((time.perf_counter() - start_time) * 1000, 1)}
+        except Exception as e:
+            logger.error(f"初始化 {name} 失败: {str(e)}")
+            results[name] = {'initialized': False, 'required': required, 'error': str(e)}
+    return results
+
+def build_ready_payload(warm=False, extra_components=()):
+    """构建 /ready 接口的返回内容和状态码，同步与异步服务共用
+
+    warm 为True时先初始化全部组件，必需组件初始化失败时返回503；否则只报告各组件是否已初始化，
+    未初始化的组件会在第一次使用时初始化，不影响就绪状态。未配置 API key 时始终返回503。
+    """
+    components = tuple(LAZY_COMPONENTS) + tuple(extra_components)
+    if warm:
+        status = warm_up(components)
+    else:
+        status = {name: {'initialized': is_ready(), 'required': required}
+                  for name, required, is_ready, _ in components}
+    ready = bool(api_key) and not any(item['required'] and 'error' in item for item in status.values())
+    payload = {'ready': ready, 'components': status}
+    if not api_key:
+        payload['error'] = '未配置 OPENAI_API_KEY'
+    return payload, 200 if ready else 503
+
+prewarm_thread = None
+prewarm_lock = threading.Lock()
+
+def start_prewarm():
+    """在后台线程中初始化各组件，用户请求不必等待导入 openai 等开销"""
+    global prewarm_thread
+    if prewarm_thread is not None:
+        return
+    with prewarm_lock:
+        if prewarm_thread is None:
+            prewarm_thread = threading.Thread(target=warm_up, name='prewarm', daemon=True)
+            prewarm_thread.start()
+
+def start_background_tasks():
+    """启动后台预热线程；每个进程只启动一次，由第一个请求触发（gunicorn fork 之后）"""
+    if WARMER_ENABLED:
+        warmer.start()
+    if PREWARM_ON_START:
+        start_prewarm()
+
 @app.route('/')
 def home():
     return render_template('index.html')
@@ -264,14 +1082,56 @@ SYSTEM_PROMPT = """你是一个专业的澳大利亚房地产分析师。请针
 # 参考来源
 [列举数据来源]"""
 
+# 分段生成计划：每段的提示词、TTL和token上限
+REPORT_PLAN = plan_sections(SYSTEM_PROMPT, ttls=REPORT_SECTION_TTLS)
+
+def rate_limited_retry_after(error):
+    """限流错误对应的 Retry-After 秒数（取整，至少1秒）"""
+    return max(1, int(round(retry_after_seconds(error) or 1)))
+
+def rate_limited_response(error):
+    """上游限流或排队超时时返回429，并告知客户端多久后重试"""
+    response = jsonify({'error': '请求过于频繁，请稍后重试'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(rate_limited_retry_after(error))
+    return response
+
+DISCLAIMER = '注意：本报告中的数据仅供参考，具体信息请以官方发布为准。'
+
+def report_payload(entry, **flags):
+    """报告接口的返回内容：markdown原文、服务端渲染的HTML和状态标记"""
+    payload = {'analysis': entry['analysis'], 'html': entry.get('html') or render_report(entry['analysis'])}
+    payload.update(flags)
+    payload['disclaimer'] = DISCLAIMER
+    return payload
+
+def report_response(payload):
+    """报告JSON响应：强ETag、按 Accept-Encoding 压缩（br/gzip）；GET 请求内容未变时返回304"""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    status, headers, data = build_response(
+        body, 'application/json', request.headers.get('Accept-Encoding', ''), request.headers.get('If-None-Match'),
+        conditional=request.method in ('GET', 'HEAD'), cache_control='private, no-cache')
+    return Response(data, status=status, headers=headers)
+
+@app.route('/search', methods=['GET'])
+def search_cached():
+    """只读取已缓存的报告（GET /search?suburb=...），未缓存时返回404，不会触发生成
+
+    浏览器重复查看同一报告时带上 If-None-Match，内容未变只返回304
+    """
+    suburb = request.args.get('suburb', '')
+    if not suburb:
+        return jsonify({'error': '请输入区域名称或邮编'}), 400
+    suburb = standardize_suburb(suburb)
+    cached = get_cached_report(suburb)
+    if not cached:
+        return jsonify({'error': '该区域的报告尚未生成', 'cached': False}), 404
+    usage_tracker.record_lookup(suburb)
+    return report_response(report_payload(cached, cached=True))
+
 @app.route('/search', methods=['POST'])
 def search():
     try:
-        # 检查是否超出预算
-        if not usage_tracker.can_make_request():
-            logger.error("已达到本月API使用限额")
-            return jsonify({'error': '已达到本月使用限额，请下月再试'}), 429
-
         data = request.get_json()
         if data is None:
             logger.error("无效的JSON数据")
@@ -285,21 +1145,36 @@ def search():
         
         suburb = standardize_suburb(suburb)
         logger.info(f"开始分析区域: {suburb}")
+        usage_tracker.record_lookup(suburb)
+
+        # 命中缓存直接返回，不消耗API预算
+        cached = get_cached_report(suburb)
+        if cached:
+            logger.info(f"报告缓存命中: {suburb}")
+            return report_response(report_payload(cached, cached=True))
+
+        # 检查是否超出预算
+        if not usage_tracker.can_make_request():
+            logger.error("已达到本月API使用限额")
+            return jsonify({'error': '已达到本月使用限额，请下月再试'}), 429
         
         try:
-            # 直接使用OpenAI分析
-            analysis = analyze_with_openai(suburb)
+            # 使用OpenAI分析，并发的相同请求共享同一次生成
+            entry, shared = generate_report(suburb)
             
-            if not analysis:
+            if not entry:
                 logger.error("生成的分析报告为空")
                 return jsonify({'error': '生成分析报告失败，请重试'}), 500
+
+            if shared:
+                logger.info(f"合并请求共享报告: {suburb}")
             
-            return jsonify({
-                'analysis': analysis,
-                'disclaimer': '注意：本报告中的数据仅供参考，具体信息请以官方发布为准。'
-            })
-            
+            return report_response(report_payload(entry, cached=False, coalesced=shared))
+
         except Exception as api_error:
+            if is_rate_limit_error(api_error):
+                logger.error(f"OpenAI API限流: {str(api_error)}")
+                return rate_limited_response(api_error)
             logger.error(f"OpenAI API调用失败: {str(api_error)}")
             return jsonify({'error': '生成分析报告时出错，请稍后重试'}), 500
             
@@ -307,18 +1182,139 @@ def search():
         logger.error(f"处理请求时出错: {str(e)}")
         return jsonify({'error': '服务器内部错误，请稍后重试'}), 500
 
+def sse_event(event, data):
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/search/stream', methods=['POST'])
+def search_stream():
+    """以Server-Sent Events方式流式返回分析报告"""
+    data = request.get_json(silent=True)
+    if data is None:
+        logger.error("无效的JSON数据")
+        return jsonify({'error': '请求格式错误'}), 400
+
+    suburb = data.get('suburb', '')
+    if not suburb:
+        logger.error("未提供区域名称")
+        return jsonify({'error': '请输入区域名称或邮编'}), 400
+
+    suburb = standardize_suburb(suburb)
+    logger.info(f"开始流式分析区域: {suburb}")
+    usage_tracker.record_lookup(suburb)
+
+    cached = get_cached_report(suburb)
+    if not cached and not usage_tracker.can_make_request():
+        logger.error("已达到本月API使用限额")
+        return jsonify({'error': '已达到本月使用限额，请下月再试'}), 429
+
+    def generate():
+        if cached:
+            logger.info(f"报告缓存命中: {suburb}")
+            yield sse_event('meta', {'suburb': suburb, 'cached': True})
+            yield sse_event('delta', {'text': cached['analysis']})
+            yield sse_event('done', {'cached': True, 'html': cached['html'], 'disclaimer': DISCLAIMER})
+            return
+
+        key = report_cache_key(suburb)
+        call, leader = report_flight.begin(key)
+        if not leader:
+            # 同一区域正在生成，等待并共享结果
+            yield sse_event('meta', {'suburb': suburb, 'cached': False, 'coalesced': True})
+            try:
+                entry = report_flight.wait(key, call)
+            except Exception as e:
+                logger.error(f"等待合并请求失败: {str(e)}")
+                yield sse_event('error', {'error': '生成分析报告时出错，请稍后重试'})
+                return
+            if not entry:
+                yield sse_event('error', {'error': '生成分析报告失败，请重试'})
+                return
+            yield sse_event('delta', {'text': entry['analysis']})
+            yield sse_event('done', {'cached': False, 'coalesced': True, 'html': entry['html'],
+                                     'disclaimer': DISCLAIMER})
+            return
+
+        parts = []
+        entry = error = None
+        try:
+            yield sse_event('meta', {'suburb': suburb, 'cached': False})
+            for delta in report_stream(suburb):
+                parts.append(delta)
+                yield sse_event('delta', {'text': delta})
+            analysis = ''.join(parts)
+            if not analysis:
+                logger.error("生成的分析报告为空")
+                yield sse_event('error', {'error': '生成分析报告失败，请重试'})
+                return
+            entry = store_report(suburb, analysis)
+            yield sse_event('done', {'cached': False, 'html': entry['html'], 'disclaimer': DISCLAIMER})
+        except Exception as e:
+            error = e
+            logger.error(f"流式生成分析报告失败: {str(e)}")
+            yield sse_event('error', {'error': '生成分析报告时出错，请稍后重试'})
+        finally:
+            report_flight.finish(key, call, entry, error)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲，保证逐段到达浏览器
+        }
+    )
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """批量分析多个区域，按完成顺序以JSON Lines流式返回每个区域的结果"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('suburbs'), list):
+        logger.error("无效的批量请求数据")
+        return jsonify({'error': '请求格式错误，需要提供 suburbs 列表'}), 400
+
+    suburbs = [standardize_suburb(str(s)) for s in data['suburbs'] if str(s).strip()]
+    if not suburbs:
+        return jsonify({'error': '请输入区域名称或邮编'}), 400
+    if len(suburbs) > BATCH_MAX_SUBURBS:
+        return jsonify({'error': f'单次最多分析 {BATCH_MAX_SUBURBS} 个区域'}), 400
+    try:
+        concurrency = int(data.get('concurrency', BATCH_MAX_CONCURRENCY))
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({'error': 'concurrency 必须是整数'}), 400
+    concurrency = min(max(concurrency, 1), BATCH_MAX_CONCURRENCY)
+    if not usage_tracker.can_make_request():
+        logger.error("已达到本月API使用限额")
+        return jsonify({'error': '已达到本月使用限额，请下月再试'}), 429
+
+    runner = BatchRunner(
+        analyze=get_or_generate_report,
+        search=get_search_engine().search_suburb if data.get('include_search') else None,
+        budget_check=usage_tracker.can_make_request,
+        concurrency=concurrency
+    )
+
+    def generate():
+        for record in runner.run(suburbs, resume=False):
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+        if runner.budget_exhausted:
+            yield json.dumps({'status': 'budget_exhausted', 'error': '已达到本月使用限额，剩余区域未处理'}, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/test_api', methods=['GET'])
 def test_api():
     """测试OpenAI API连接"""
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "user", "content": "Hello, this is a test."}
-            ],
-            max_tokens=10,
-            temperature=0.2
-        )
+        with track_upstream('openai', 'test'):
+            response = get_openai_client().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "user", "content": "Hello, this is a test."}
+                ],
+                max_tokens=10,
+                temperature=0.2
+            )
         return jsonify({
             'status': 'success',
             'message': 'API连接正常',
@@ -331,22 +1327,84 @@ def test_api():
             'message': f'API连接失败: {str(e)}'
         }), 500
 
+def build_usage_payload(by=None, month=None):
+    """构建 /usage 接口的返回内容，同步与异步服务共用
+
+    by 为 suburb 或 day 时附带当月（或指定月份）的分项统计
+    """
+    usage_tracker.can_make_request()  # 顺便刷新其他worker写入的总额
+    payload = {
+        'current_month': usage_tracker.current_month,
+        'total_cost': round(usage_tracker.total_cost, 4),
+        'budget_limit': MONTHLY_BUDGET,
+        'remaining_budget': round(MONTHLY_BUDGET - usage_tracker.total_cost, 4),
+        'api_key_last_4': api_key[-4:] if api_key else None,  # 显示API key的最后4位
+        'report_cache': report_cache.stats(),  # 报告缓存命中统计
+        'single_flight': report_flight.stats(),  # 请求合并统计
+        'warmer': dict(warmer.stats(), enabled=WARMER_ENABLED,
+                       cost=round(usage_tracker.source_cost('warmer'), 4),
+                       budget=round(MONTHLY_BUDGET * WARMER_BUDGET_SHARE, 4)),  # 缓存预热统计
+        'version': 'demo'  # 标识这是演示版本
+    }
+    if by in ('suburb', 'day'):
+        payload['breakdown'] = usage_tracker.breakdown(by, month)
+    return payload
+
+def search_cache_stats():
+    """搜索缓存统计；搜索引擎尚未创建时不输出"""
+    engine = search_engine
+    return engine.cache.stats() if engine is not None and engine.cache else None
+
+# 抓取 /metrics 时读取各组件已有的统计
+REGISTRY.add_collector(stats_collector(
+    'report_cache', '报告缓存', report_cache.stats,
+    counters=('memory_hits', 'disk_hits', 'misses', 'expired', 'evictions'),
+    gauges=('memory_entries', 'hit_ratio')))
+REGISTRY.add_collector(stats_collector(
+    'search_cache', '搜索结果缓存', search_cache_stats,
+    counters=('hits', 'misses', 'expired', 'evictions'), gauges=('entries', 'hit_ratio')))
+REGISTRY.add_collector(stats_collector(
+    'single_flight', '请求合并', report_flight.stats,
+    counters=('leaders', 'shared', 'cross_process_hits'), gauges=('in_flight',)))
+REGISTRY.add_collector(stats_collector(
+    'warmer', '缓存预热', warmer.stats,
+    counters=('passes', 'refreshed_suburbs', 'refreshed_sections', 'budget_skips', 'failures')))
+REGISTRY.add_collector(stats_collector(
+    'compression_cache', '响应压缩缓存', compression_cache.stats, counters=('hits', 'misses'), gauges=('entries',)))
+REGISTRY.add_collector(rate_limiter.collect)
+REGISTRY.add_collector(lambda: [
+    ('openai_month_cost_dollars', 'gauge', '本月累计OpenAI费用（美元）', [({}, round(usage_tracker.month_cost(), 6))]),
+    ('openai_month_budget_dollars', 'gauge', '每月OpenAI预算（美元）', [({}, MONTHLY_BUDGET)]),
+])
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 格式的运行指标"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/suggest', methods=['GET'])
+def suggest():
+    """区域名自动补全"""
+    query = request.args.get('q', '')[:100]
+    limit = min(max(request.args.get('limit', 8, type=int), 1), 20)
+    return jsonify(suggest_suburbs(query, limit))
+
 @app.route('/usage', methods=['GET'])
 def get_usage():
     """获取API使用情况"""
     try:
-        return jsonify({
-            'current_month': usage_tracker.usage_data['current_month'],
-            'total_cost': round(usage_tracker.usage_data['total_cost'], 4),
-            'budget_limit': MONTHLY_BUDGET,
-            'remaining_budget': round(MONTHLY_BUDGET - usage_tracker.usage_data['total_cost'], 4),
-            'api_key_last_4': usage_tracker.usage_data.get('api_key_last_4', 'N/A'),  # 显示API key的最后4位
-            'version': 'demo'  # 标识这是演示版本
-        })
+        return jsonify(build_usage_payload(request.args.get('by'), request.args.get('month')))
     except Exception as e:
         logger.error(f"获取使用情况失败: {str(e)}")
         return jsonify({'error': '获取使用情况失败'}), 500
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """就绪检查：?warm=1 时先初始化OpenAI客户端、使用量数据库等按需加载的组件，部署后调用一次即可预热"""
+    warm = request.args.get('warm', '').lower() in ('1', 'true')
+    payload, status = build_ready_payload(warm)
+    return jsonify(payload), status
+
 @app.errorhandler(500)
 def internal_error(error):
     logger.error(f"服务器内部错误: {error}")
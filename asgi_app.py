@@ -0,0 +1,585 @@
+"""ASGI 异步服务入口
+
+与 app.py 提供相同的路由，但使用异步 OpenAI 客户端，大量进行中的报告生成
+共享同一个事件循环，不再占用 gunicorn 线程。
+
+运行方式：
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+或在 gunicorn 中使用 uvicorn worker：
+    gunicorn asgi_app:app -k uvicorn.workers.UvicornWorker --workers 1 --timeout 120
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import app as core
+from http_cache import build_response
+from metrics import (REGISTRY, CONTENT_TYPE, TRACE_HEADER, track_upstream, start_request, finish_request,
+                     new_trace_id, bind_context)
+from rate_limiter import call_with_backoff_async, is_rate_limit_error
+from single_flight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+# 每个路由的并发上限与请求超时（秒）
+SEARCH_CONCURRENCY = int(os.getenv('ASGI_SEARCH_CONCURRENCY', 1000))
+SEARCH_TIMEOUT = float(os.getenv('ASGI_SEARCH_TIMEOUT', 90))
+TEST_API_CONCURRENCY = int(os.getenv('ASGI_TEST_API_CONCURRENCY', 10))
+TEST_API_TIMEOUT = float(os.getenv('ASGI_TEST_API_TIMEOUT', 15))
+USAGE_CONCURRENCY = int(os.getenv('ASGI_USAGE_CONCURRENCY', 100))
+USAGE_TIMEOUT = float(os.getenv('ASGI_USAGE_TIMEOUT', 5))
+
+DISCLAIMER = core.DISCLAIMER
+
+# 异步OpenAI客户端与 core.client 一样在第一次调用时创建
+async_client = None
+async_client_lock = threading.Lock()
+report_flight = AsyncSingleFlight(timeout=core.SINGLE_FLIGHT_TIMEOUT)
+stream_semaphore = asyncio.Semaphore(SEARCH_CONCURRENCY)
+_index_html = None
+
+
+def get_async_client():
+    """获取共享的 AsyncOpenAI 客户端，未配置 API key 时抛出 ValueError"""
+    global async_client
+    with async_client_lock:
+        if async_client is None:
+            if not core.api_key:
+                raise ValueError("未找到 OPENAI_API_KEY 环境变量")
+            from openai import AsyncOpenAI
+            # 与同步客户端一致，重试只由 call_with_backoff_async 负责
+            async_client = AsyncOpenAI(api_key=core.api_key, max_retries=0)
+        return async_client
+
+
+def limited(concurrency, timeout):
+    """限制路由并发数与单次请求耗时，超时返回504"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            async def run():
+                async with semaphore:
+                    return await handler(request)
+            try:
+                return await asyncio.wait_for(run(), timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"请求超时: {request.url.path}")
+                return JSONResponse({'error': '请求超时，请稍后重试'}, status_code=504)
+        return wrapper
+    return decorator
+
+
+async def run_blocking(fn, *args):
+    """在线程池中执行阻塞的文件读写，避免卡住事件循环"""
+    loop = asyncio.get_running_loop()
+    # 在当前上下文的副本中执行，线程中的日志同样带有请求的 trace ID
+    return await loop.run_in_executor(None, functools.partial(bind_context(fn), *args))
+
+
+async def create_completion_async(operation, params, **kwargs):
+    """core.create_completion 的异步版本：排队等待共享配额，429时退避重试，完成后结算token"""
+    reserved = core.openai_token_estimate(params)
+
+    async def call():
+        await core.rate_limiter.acquire_async('openai', tokens=reserved, max_wait=core.OPENAI_MAX_WAIT)
+        try:
+            with track_upstream('openai', operation):
+                return await get_async_client().chat.completions.create(**params, **kwargs)
+        except Exception:
+            await run_blocking(core.rate_limiter.settle, 'openai', reserved, 0)
+            raise
+
+    response = await call_with_backoff_async(call, max_retries=core.OPENAI_MAX_RETRIES, max_delay=core.OPENAI_MAX_WAIT,
+                                             limiter=core.rate_limiter, upstream='openai', retry_queue_timeout=False)
+    if not kwargs.get('stream'):
+        await run_blocking(core.rate_limiter.settle, 'openai', reserved, response.usage.total_tokens)
+    return response
+
+
+async def analyze_with_openai_async(suburb, search_results=None):
+    """使用异步OpenAI客户端分析区域信息"""
+    try:
+        start_time = time.time()
+        logger.info("开始生成分析报告...")
+        response = await create_completion_async('report', core.build_completion_params(suburb, search_results))
+        logger.info(f"分析报告生成完成，用时: {time.time() - start_time:.2f}秒，使用tokens: {response.usage.total_tokens}")
+        await run_blocking(core.usage_tracker.track_request,
+                           response.usage.prompt_tokens, response.usage.completion_tokens, suburb)
+        return response.choices[0].message.content
+    except Exception as e:
+        if is_rate_limit_error(e):
+            logger.error("OpenAI API限流")
+            raise
+        logger.error(f"OpenAI API调用失败: {str(e)}")
+        raise Exception("生成分析报告时出错，请稍后重试")
+
+
+async def analyze_with_openai_stream_async(suburb):
+    """异步流式生成，逐段产出文本，结束时记录token用量"""
+    search_results = await run_blocking(core.retrieve_search_results, suburb)
+    async for delta in stream_completion_async('report_stream', core.build_completion_params(suburb, search_results),
+                                               suburb):
+        yield delta
+
+
+async def stream_completion_async(operation, params, suburb):
+    """core.stream_completion 的异步版本：逐段产出文本，流结束（或客户端断开）时记录token用量"""
+    start_time = time.time()
+    stream = await create_completion_async(operation, params,
+                                           stream=True,
+                                           stream_options={"include_usage": True})
+    usage = None
+    output_chunks = 0
+    try:
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                output_chunks += 1
+                yield delta
+    finally:
+        await stream.close()
+        if usage:
+            input_tokens, output_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            logger.warning("流式响应未返回token用量，使用估算值")
+            input_tokens = sum(core.estimate_tokens(m['content']) for m in params['messages'])
+            output_tokens = output_chunks
+        await run_blocking(core.usage_tracker.track_request, input_tokens, output_tokens, suburb)
+        await run_blocking(core.rate_limiter.settle, 'openai', core.openai_token_estimate(params),
+                           input_tokens + output_tokens)
+        logger.info(f"流式生成结束，用时: {time.time() - start_time:.2f}秒，使用tokens: {input_tokens + output_tokens}")
+
+
+async def analyze_section_async(suburb, section, search_results=None):
+    """异步生成单个报告分段并写入缓存，返回分段文本"""
+    start_time = time.time()
+    response = await create_completion_async('section', core.build_section_params(suburb, section, search_results))
+    await run_blocking(core.usage_tracker.track_request,
+                       response.usage.prompt_tokens, response.usage.completion_tokens, suburb)
+    text = response.choices[0].message.content
+    if not text:
+        raise Exception(f"报告分段 {section['name']} 生成结果为空")
+    logger.info(f"报告分段 {section['name']} 生成完成，用时: {time.time() - start_time:.2f}秒，"
+                f"使用tokens: {response.usage.total_tokens}")
+    entry = await run_blocking(core.store_section, suburb, section, core.clean_section(text, section))
+    return entry['analysis']
+
+
+async def analyze_section_stream_async(suburb, section, search_results=None):
+    """异步流式生成单个报告分段，逐段产出文本，完整生成后写入分段缓存"""
+    cleaner = core.SectionCleaner(section)
+    parts = []
+    params = core.build_section_params(suburb, section, search_results)
+    async for delta in stream_completion_async('section_stream', params, suburb):
+        text = cleaner.feed(delta)
+        if text:
+            parts.append(text)
+            yield text
+    text = cleaner.close()
+    if text:
+        parts.append(text)
+        yield text
+    text = ''.join(parts)
+    if not text:
+        raise Exception(f"报告分段 {section['name']} 生成结果为空")
+    await run_blocking(core.store_section, suburb, section, core.clean_section(text, section))
+
+
+async def generate_sections_async(suburb, refresh=(), stream=False):
+    """分段生成报告的异步版本，按模板顺序逐段产出文本，未过期的分段复用缓存
+
+    stream 为 True 时第一个待生成的分段逐token产出，其余分段并行生成
+    """
+    sections = core.REPORT_PLAN['sections']
+    texts = {}
+    missing = []
+    for section in sections:
+        cached = None if section['name'] in refresh else await run_blocking(core.get_cached_section, suburb, section)
+        if cached:
+            texts[section['name']] = cached['analysis']
+        else:
+            missing.append(section)
+    pending = {}
+    streamed = missing[0]['name'] if stream and missing else None
+    if missing:
+        logger.info(f"{suburb} 需要生成 {len(missing)}/{len(sections)} 个报告分段: "
+                    f"{', '.join(section['name'] for section in missing)}")
+        search_results = await run_blocking(core.retrieve_search_results, suburb)
+        for section in missing:
+            if section['name'] == streamed:
+                continue
+            pending[section['name']] = asyncio.ensure_future(analyze_section_async(suburb, section, search_results))
+
+    try:
+        yield core.report_intro(core.REPORT_PLAN['intro'], suburb)
+        for section in sections:
+            if section['name'] == streamed:
+                yield '\n\n'
+                async for delta in analyze_section_stream_async(suburb, section, search_results):
+                    yield delta
+                continue
+            text = texts.get(section['name'])
+            if text is None:
+                text = await pending[section['name']]
+            yield '\n\n' + text
+    finally:
+        # 客户端断开或某段失败时，其余分段继续生成并写入缓存，这里只取走未读取的异常
+        for task in pending.values():
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+def report_stream_async(suburb):
+    """按当前报告生成方式逐段产出报告文本"""
+    if core.REPORT_MODE == 'sectioned':
+        return generate_sections_async(suburb, stream=True)
+    return analyze_with_openai_stream_async(suburb)
+
+
+async def generate_report_async(suburb):
+    """生成报告并写入缓存，同一区域的并发请求合并为一次生成"""
+    async def generate():
+        if core.REPORT_MODE == 'sectioned':
+            analysis = ''.join([part async for part in generate_sections_async(suburb)])
+        else:
+            search_results = await run_blocking(core.retrieve_search_results, suburb)
+            analysis = await analyze_with_openai_async(suburb, search_results)
+        if not analysis:
+            return None
+        return await run_blocking(core.store_report, suburb, analysis)
+
+    return await report_flight.do(core.report_cache_key(suburb), generate,
+                                  recheck=lambda: run_blocking(core.get_cached_report, suburb))
+
+
+async def parse_suburb(request):
+    """解析并标准化请求中的区域名称，出错时返回 (None, 错误响应)"""
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    if not isinstance(data, dict):
+        logger.error("无效的JSON数据")
+        return None, JSONResponse({'error': '请求格式错误'}, status_code=400)
+    suburb = data.get('suburb', '')
+    if not suburb:
+        logger.error("未提供区域名称")
+        return None, JSONResponse({'error': '请输入区域名称或邮编'}, status_code=400)
+    return await run_blocking(core.standardize_suburb, suburb), None
+
+
+def report_response(request, payload):
+    """报告JSON响应：强ETag、按 Accept-Encoding 压缩（br/gzip）；GET 请求内容未变时返回304"""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    status, headers, data = build_response(
+        body, 'application/json', request.headers.get('accept-encoding', ''), request.headers.get('if-none-match'),
+        conditional=request.method in ('GET', 'HEAD'), cache_control='private, no-cache')
+    return Response(data, status_code=status, headers=headers)
+
+
+async def home(request):
+    global _index_html
+    if _index_html is None:
+        # 复用 Flask 模板渲染，保证两种模式的页面完全一致
+        with core.app.test_request_context('/'):
+            _index_html = core.render_template('index.html')
+    return HTMLResponse(_index_html)
+
+
+@limited(USAGE_CONCURRENCY, USAGE_TIMEOUT)
+async def search_cached(request):
+    """只读取已缓存的报告（GET /search?suburb=...），未缓存时返回404，不会触发生成"""
+    suburb = request.query_params.get('suburb', '')
+    if not suburb:
+        return JSONResponse({'error': '请输入区域名称或邮编'}, status_code=400)
+    suburb = await run_blocking(core.standardize_suburb, suburb)
+    cached = await run_blocking(core.get_cached_report, suburb)
+    if not cached:
+        return JSONResponse({'error': '该区域的报告尚未生成', 'cached': False}, status_code=404)
+    await run_blocking(core.usage_tracker.record_lookup, suburb)
+    return report_response(request, core.report_payload(cached, cached=True))
+
+
+@limited(SEARCH_CONCURRENCY, SEARCH_TIMEOUT)
+async def search(request):
+    try:
+        suburb, error_response = await parse_suburb(request)
+        if error_response:
+            return error_response
+        logger.info(f"开始分析区域: {suburb}")
+        await run_blocking(core.usage_tracker.record_lookup, suburb)
+
+        cached = await run_blocking(core.get_cached_report, suburb)
+        if cached:
+            logger.info(f"报告缓存命中: {suburb}")
+            return report_response(request, core.report_payload(cached, cached=True))
+
+        if not await run_blocking(core.usage_tracker.can_make_request):
+            logger.error("已达到本月API使用限额")
+            return JSONResponse({'error': '已达到本月使用限额，请下月再试'}, status_code=429)
+
+        try:
+            entry, shared = await generate_report_async(suburb)
+            if not entry:
+                logger.error("生成的分析报告为空")
+                return JSONResponse({'error': '生成分析报告失败，请重试'}, status_code=500)
+            return report_response(request, core.report_payload(entry, cached=False, coalesced=shared))
+        except Exception as api_error:
+            if is_rate_limit_error(api_error):
+                logger.error(f"OpenAI API限流: {str(api_error)}")
+                return JSONResponse({'error': '请求过于频繁，请稍后重试'}, status_code=429,
+                                    headers={'Retry-After': str(core.rate_limited_retry_after(api_error))})
+            logger.error(f"OpenAI API调用失败: {str(api_error)}")
+            return JSONResponse({'error': '生成分析报告时出错，请稍后重试'}, status_code=500)
+    except Exception as e:
+        logger.error(f"处理请求时出错: {str(e)}")
+        return JSONResponse({'error': '服务器内部错误，请稍后重试'}, status_code=500)
+
+
+async def search_stream(request):
+    """以Server-Sent Events方式流式返回分析报告
+
+    流式响应的总时长取决于生成速度，因此不套用 limited() 的超时，只限制并发
+    """
+    suburb, error_response = await parse_suburb(request)
+    if error_response:
+        return error_response
+    logger.info(f"开始流式分析区域: {suburb}")
+    await run_blocking(core.usage_tracker.record_lookup, suburb)
+
+    cached = await run_blocking(core.get_cached_report, suburb)
+    if not cached and not await run_blocking(core.usage_tracker.can_make_request):
+        logger.error("已达到本月API使用限额")
+        return JSONResponse({'error': '已达到本月使用限额，请下月再试'}, status_code=429)
+
+    async def generate():
+        async with stream_semaphore:
+            if cached:
+                yield core.sse_event('meta', {'suburb': suburb, 'cached': True})
+                yield core.sse_event('delta', {'text': cached['analysis']})
+                yield core.sse_event('done', {'cached': True, 'html': cached['html'], 'disclaimer': DISCLAIMER})
+                return
+
+            key = core.report_cache_key(suburb)
+            future, leader = report_flight.begin(key)
+            if not leader:
+                # 同一区域正在生成，等待并共享结果
+                yield core.sse_event('meta', {'suburb': suburb, 'cached': False, 'coalesced': True})
+                try:
+                    entry = await report_flight.wait(key, future)
+                except Exception as e:
+                    logger.error(f"等待合并请求失败: {str(e)}")
+                    yield core.sse_event('error', {'error': '生成分析报告时出错，请稍后重试'})
+                    return
+                if not entry:
+                    yield core.sse_event('error', {'error': '生成分析报告失败，请重试'})
+                    return
+                yield core.sse_event('delta', {'text': entry['analysis']})
+                yield core.sse_event('done', {'cached': False, 'coalesced': True, 'html': entry['html'],
+                                              'disclaimer': DISCLAIMER})
+                return
+
+            parts = []
+            entry = error = None
+            try:
+                yield core.sse_event('meta', {'suburb': suburb, 'cached': False})
+                async for delta in report_stream_async(suburb):
+                    parts.append(delta)
+                    yield core.sse_event('delta', {'text': delta})
+                analysis = ''.join(parts)
+                if not analysis:
+                    yield core.sse_event('error', {'error': '生成分析报告失败，请重试'})
+                    return
+                entry = await run_blocking(core.store_report, suburb, analysis)
+                yield core.sse_event('done', {'cached': False, 'html': entry['html'], 'disclaimer': DISCLAIMER})
+            except Exception as e:
+                error = e
+                logger.error(f"流式生成分析报告失败: {str(e)}")
+                yield core.sse_event('error', {'error': '生成分析报告时出错，请稍后重试'})
+            finally:
+                report_flight.finish(key, future, entry, error)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@limited(TEST_API_CONCURRENCY, TEST_API_TIMEOUT)
+async def test_api(request):
+    """测试OpenAI API连接"""
+    try:
+        with track_upstream('openai', 'test'):
+            response = await get_async_client().chat.completions.create(
+                model=core.OPENAI_MODEL,
+                messages=[
+                    {"role": "user", "content": "Hello, this is a test."}
+                ],
+                max_tokens=10,
+                temperature=0.2
+            )
+        return JSONResponse({
+            'status': 'success',
+            'message': 'API连接正常',
+            'response': response.choices[0].message.content
+        })
+    except Exception as e:
+        logger.error(f"API测试失败: {str(e)}")
+        return JSONResponse({
+            'status': 'error',
+            'message': f'API连接失败: {str(e)}'
+        }, status_code=500)
+
+
+@limited(USAGE_CONCURRENCY, USAGE_TIMEOUT)
+async def get_usage(request):
+    """获取API使用情况"""
+    try:
+        payload = await run_blocking(core.build_usage_payload,
+                                     request.query_params.get('by'), request.query_params.get('month'))
+        payload['async_single_flight'] = report_flight.stats()
+        return JSONResponse(payload)
+    except Exception as e:
+        logger.error(f"获取使用情况失败: {str(e)}")
+        return JSONResponse({'error': '获取使用情况失败'}, status_code=500)
+
+
+# 异步服务额外的按需初始化组件，格式同 core.LAZY_COMPONENTS
+ASYNC_COMPONENTS = (
+    ('openai_async', True, lambda: async_client is not None, get_async_client),
+)
+
+
+@limited(TEST_API_CONCURRENCY, TEST_API_TIMEOUT)
+async def ready(request):
+    """就绪检查：?warm=1 时先初始化按需加载的组件（含异步OpenAI客户端），初始化在线程池中进行"""
+    warm = request.query_params.get('warm', '').lower() in ('1', 'true')
+    payload, status = await run_blocking(core.build_ready_payload, warm, ASYNC_COMPONENTS)
+    return JSONResponse(payload, status_code=status)
+
+
+async def suggest(request):
+    """区域名自动补全，内存查询无需放入线程池"""
+    query = request.query_params.get('q', '')[:100]
+    try:
+        limit = min(max(int(request.query_params.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    return JSONResponse(core.suggest_suburbs(query, limit))
+
+
+async def static(request):
+    """静态文件：内容哈希URL可永久缓存，按 Accept-Encoding 压缩，支持304"""
+    result = core.static_assets.response(request.path_params['path'], request.query_params.get('v'),
+                                         request.headers.get('accept-encoding', ''),
+                                         request.headers.get('if-none-match'))
+    if result is None:
+        return JSONResponse({'error': '请求的页面不存在'}, status_code=404)
+    status, headers, body = result
+    return Response(body, status_code=status, headers=headers)
+
+
+async def metrics(request):
+    """Prometheus 格式的运行指标"""
+    return Response(REGISTRY.render(), headers={'Content-Type': CONTENT_TYPE})
+
+
+class MetricsMiddleware:
+    """记录每个请求的耗时、状态码和并发数，并设置 trace ID（响应头 X-Trace-Id 返回）
+
+    使用纯ASGI中间件而不是 BaseHTTPMiddleware，流式响应不受影响，耗时为完整响应时长。
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = set(routes)
+
+    def route_label(self, path):
+        if path in self.routes:
+            return path
+        return '/static' if path.startswith('/static/') else 'other'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get('headers') or [])
+        incoming = headers.get(TRACE_HEADER.lower().encode()) or headers.get(b'x-request-id')
+        trace_id = new_trace_id(incoming.decode('latin-1') if incoming else None)
+        route = self.route_label(scope['path'])
+        status = 500
+        started_at = start_request(route)
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message['headers'] = list(message.get('headers', [])) + [(TRACE_HEADER.lower().encode(), trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            finish_request(route, scope['method'], status, started_at)
+
+
+async def not_found_error(request, exc):
+    logger.error(f"页面未找到: {request.url.path}")
+    return JSONResponse({'error': '请求的页面不存在'}, status_code=404)
+
+
+async def internal_error(request, exc):
+    logger.error(f"服务器内部错误: {exc}")
+    return JSONResponse({'error': '服务器内部错误，请稍后重试'}, status_code=500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """服务启动时开始后台预热，退出时通知预热线程停止
+
+    PREWARM_ON_START 为true时异步OpenAI客户端也在后台线程中创建，首个请求不会因导入 openai 阻塞事件循环。
+    """
+    core.start_background_tasks()
+    if core.PREWARM_ON_START:
+        asyncio.get_running_loop().run_in_executor(None, core.warm_up, ASYNC_COMPONENTS)
+    yield
+    core.warmer.stop()
+
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/search', search_cached, methods=['GET']),
+        Route('/search', search, methods=['POST']),
+        Route('/search/stream', search_stream, methods=['POST']),
+        Route('/test_api', test_api, methods=['GET']),
+        Route('/usage', get_usage, methods=['GET']),
+        Route('/ready', ready, methods=['GET']),
+        Route('/suggest', suggest, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/static/{path:path}', static, methods=['GET']),
+    ],
+    exception_handlers={404: not_found_error, 500: internal_error},
+    lifespan=lifespan
+)
+app.add_middleware(MetricsMiddleware, routes=[route.path for route in app.routes if isinstance(route, Route)])
+
+if __name__ == '__main__':
+    import uvicorn
+    port = int(os.environ.get('PORT', 5000))
+    uvicorn.run(app, host='0.0.0.0', port=port)
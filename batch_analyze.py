@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""批量区域分析：在并发上限内为一组区域生成报告，结果逐行写入JSONL，可断点续跑
+
+用法：
+    python batch_analyze.py suburbs.txt -o results.jsonl
+    python batch_analyze.py --suburbs "point cook" werribee tarneit -c 2 --no-search
+    cat suburbs.txt | python batch_analyze.py - -o results.jsonl
+
+再次以相同的输出文件运行时，已成功的区域会被跳过。
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from rate_limiter import call_with_backoff
+
+logger = logging.getLogger(__name__)
+
+
+def read_suburbs(source: str) -> List[str]:
+    """从文件或标准输入（-）读取区域列表，每行一个，忽略空行和#注释"""
+    stream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    try:
+        return [line.strip() for line in stream if line.strip() and not line.strip().startswith('#')]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def load_checkpoint(output_path: str) -> set:
+    """读取已有输出文件中成功完成的区域"""
+    done = set()
+    if not output_path or not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 上次中断时可能留下不完整的最后一行
+            if record.get('status') == 'ok':
+                done.add(record['suburb'])
+    return done
+
+
+class BatchRunner:
+    """有界并发的批量分析
+
+    analyze(suburb) 返回报告字典；search(suburb) 返回搜索结果（可选）；
+    budget_check() 在每个区域派发前调用，返回False时停止派发剩余区域（它们不会写入输出，
+    下次续跑时会重新处理）。
+    """
+
+    def __init__(self, analyze: Callable[[str], Dict], search: Optional[Callable[[str], Dict]] = None,
+                 budget_check: Optional[Callable[[], bool]] = None, concurrency: int = 4,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.analyze = analyze
+        self.search = search
+        self.budget_check = budget_check
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_exhausted = False
+
+    def _retry(self, fn, suburb):
+        return call_with_backoff(fn, suburb, max_retries=self.max_retries,
+                                 base_delay=self.base_delay, max_delay=self.max_delay)
+
+    def process(self, suburb: str) -> Dict:
+        """处理单个区域，失败时返回 status=error 的记录而不抛出异常"""
+        start_time = time.time()
+        record = {'suburb': suburb}
+        try:
+            record.update(self._retry(self.analyze, suburb))
+            if self.search:
+                record['search'] = self._retry(self.search, suburb)
+            record['status'] = 'ok'
+        except Exception as e:
+            logger.error(f"批量分析 {suburb} 失败: {str(e)}")
+            record['status'] = 'error'
+            record['error'] = str(e)
+        record['elapsed'] = round(time.time() - start_time, 3)
+        record['timestamp'] = datetime.now().isoformat()
+        return record
+
+    def run(self, suburbs: Iterable[str], output_path: Optional[str] = None, resume: bool = True) -> Iterator[Dict]:
+        """按完成顺序逐个产出结果记录，同时追加写入 output_path"""
+        done = load_checkpoint(output_path) if resume else set()
+        pending = []
+        for suburb in suburbs:
+            if suburb not in done and suburb not in pending:
+                pending.append(suburb)
+        if done:
+            logger.info(f"从断点继续，跳过已完成的 {len(done)} 个区域")
+
+        output = open(output_path, 'a', encoding='utf-8') if output_path else None
+        write_lock = threading.Lock()
+        queue = iter(pending)
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='batch') as pool:
+                running = set()
+
+                def dispatch():
+                    while len(running) < self.concurrency and not self.budget_exhausted:
+                        suburb = next(queue, None)
+                        if suburb is None:
+                            return
+                        if self.budget_check and not self.budget_check():
+                            logger.error("已达到本月API使用限额，停止派发剩余区域")
+                            self.budget_exhausted = True
+                            return
+                        running.add(pool.submit(self.process, suburb))
+
+                dispatch()
+                while running:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        running.discard(future)
+                        record = future.result()
+                        if output:
+                            with write_lock:
+                                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                                output.flush()
+                        yield record
+                    dispatch()
+        finally:
+            if output:
+                output.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量区域分析')
+    parser.add_argument('source', nargs='?', help='区域列表文件，每行一个；- 表示从标准输入读取')
+    parser.add_argument('--suburbs', nargs='+', help='直接在命令行指定区域')
+    parser.add_argument('-o', '--output', default='batch_results.jsonl', help='JSONL输出文件（同时作为断点文件）')
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help='并发数（默认4）')
+    parser.add_argument('--no-search', action='store_true', help='不执行DuckDuckGo搜索，只生成报告')
+    parser.add_argument('--no-resume', action='store_true', help='忽略已有输出，全部重新处理')
+    args = parser.parse_args()
+
+    if not args.source and not args.suburbs:
+        parser.error('请提供区域列表文件或 --suburbs')
+
+    # 延迟导入，避免仅查看帮助时也初始化OpenAI客户端
+    import app
+
+    suburbs = list(args.suburbs or []) + (read_suburbs(args.source) if args.source else [])
+    suburbs = [app.standardize_suburb(s) for s in suburbs]
+
+    runner = BatchRunner(
+        analyze=app.get_or_generate_report,
+        search=None if args.no_search else app.get_search_engine().search_suburb,
+        budget_check=app.usage_tracker.can_make_request,
+        concurrency=args.concurrency
+    )
+    ok = failed = 0
+    for record in runner.run(suburbs, args.output, resume=not args.no_resume):
+        if record['status'] == 'ok':
+            ok += 1
+        else:
+            failed += 1
+        print(f"[{ok + failed}] {record['suburb']}: {record['status']} ({record['elapsed']}秒)")
+
+    print(f"完成：成功 {ok}，失败 {failed}，结果已写入 {args.output}")
+    if runner.budget_exhausted:
+        print("已达到本月API使用限额，剩余区域可在下月续跑")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""搜索结果去重基准：测量 Deduplicator 的单条耗时随结果数的变化（应保持基本不变，即线性时间），
+以及对合成重复结果的识别情况
+
+语料为合成的搜索摘要（词频服从齐夫分布），按比例混入三类重复：
+同一链接的不同URL写法、正文完全相同、截断位置不同或个别词不同的近似正文。
+
+用法：
+    python benchmarks/bench_dedup.py
+    python benchmarks/bench_dedup.py --results 1000 10000 50000 --json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rich.console import Console
+from rich.table import Table
+
+from dedup import Deduplicator
+
+VOCABULARY = [f"w{i}" for i in range(5000)]
+WEIGHTS = [1 / (i + 1) for i in range(len(VOCABULARY))]
+
+
+def synthetic_results(count, duplicate_ratio, words=70, seed=5):
+    """返回 [(url, 正文, 期望的重复类型)]"""
+    rng = random.Random(seed)
+    items = []
+    for i in range(count):
+        if items and rng.random() < duplicate_ratio:
+            url, text, _ = rng.choice(items)
+            kind = rng.choice(('url', 'exact', 'near'))
+            if kind == 'url':
+                url = url.replace('https://', 'http://www.') + '?utm_source=ddg'
+            elif kind == 'exact':
+                url = f"https://mirror.example.com/{i}"
+                text = text.upper()
+            else:
+                tokens = text.split()
+                tokens = tokens[3:] + rng.choices(VOCABULARY, WEIGHTS, k=3)
+                tokens[rng.randrange(len(tokens))] = rng.choice(VOCABULARY)
+                url = f"https://syndicated.example.com/{i}"
+                text = ' '.join(tokens)
+            items.append((url, text, kind))
+        else:
+            text = ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=words))
+            items.append((f"https://news.example.com/article/{i}", text, None))
+    return items
+
+
+def measure(count, duplicate_ratio):
+    items = synthetic_results(count, duplicate_ratio)
+    deduplicator = Deduplicator()
+    start = time.perf_counter()
+    verdicts = [deduplicator.check(url, text) for url, text, _ in items]
+    elapsed = time.perf_counter() - start
+    expected = sum(1 for _, _, kind in items if kind)
+    found = sum(1 for verdict in verdicts if verdict)
+    false_positives = sum(1 for (_, _, kind), verdict in zip(items, verdicts) if verdict and not kind)
+    return {
+        'results': count,
+        'total_ms': round(elapsed * 1000, 1),
+        'per_result_us': round(elapsed / count * 1e6, 1),
+        'expected_duplicates': expected,
+        'found_duplicates': found,
+        'false_positives': false_positives,
+        'stats': deduplicator.stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='搜索结果去重基准')
+    parser.add_argument('--results', type=int, nargs='+', default=[1000, 10000, 50000], help='结果条数')
+    parser.add_argument('--duplicates', type=float, default=0.2, help='重复结果比例（默认0.2）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    results = [measure(count, args.duplicates) for count in args.results]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    console = Console()
+    table = Table(show_header=True, title='搜索结果去重耗时')
+    for column in ['结果数', '总耗时(ms)', '单条耗时(µs)', '应识别重复', '识别重复', '误判', 'URL/正文/近似']:
+        table.add_column(column)
+    for r in results:
+        stats = r['stats']
+        table.add_row(str(r['results']), str(r['total_ms']), str(r['per_result_us']),
+                      str(r['expected_duplicates']), str(r['found_duplicates']), str(r['false_positives']),
+                      f"{stats['url']}/{stats['exact']}/{stats['near']}")
+    console.print(table)
+
+
+if __name__ == '__main__':
+    main()
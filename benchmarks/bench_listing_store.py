@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""房源存储基准：生成合成房源写入临时数据库，测量导入和中位数查询的耗时
+
+用法：
+    python benchmarks/bench_listing_store.py --listings 300000
+    python benchmarks/bench_listing_store.py --json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rich.console import Console
+from rich.table import Table
+
+from listing_store import ListingStore
+
+SUBURBS = [
+    ('Point Cook', '3030'), ('Werribee', '3030'), ('Tarneit', '3029'), ('Truganina', '3029'),
+    ('Hoppers Crossing', '3029'), ('Williams Landing', '3027'), ('Altona Meadows', '3028'),
+    ('Laverton', '3028'), ('Wyndham Vale', '3024'), ('Manor Lakes', '3024'),
+]
+PRICE_FORMATS = [
+    lambda p: f"${p:,}",
+    lambda p: f"${p:,} - ${int(p * 1.08):,}",
+    lambda p: f"Offers over ${p // 1000}k",
+    lambda p: f"${p / 1000000:.2f}m",
+    lambda p: "Contact agent",
+]
+
+
+def synthetic_listings(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(count):
+        suburb, postcode = rng.choice(SUBURBS)
+        beds = rng.choice([1, 2, 3, 3, 4, 4, 5])
+        price = int(rng.gauss(350000 + beds * 120000, 80000))
+        yield {
+            'key': f"id:{10000000 + i}",
+            'suburb': f"{suburb} {postcode}",
+            'price': rng.choice(PRICE_FORMATS)(max(price, 150000)),
+            'address': f"{rng.randint(1, 200)} Example Street, {suburb}, Vic {postcode}",
+            'details': f"{beds} {rng.randint(1, 3)} {rng.randint(0, 3)} House",
+        }
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 4), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='房源存储基准')
+    parser.add_argument('--listings', type=int, default=300000, help='合成房源数量（默认300000）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        store = ListingStore(os.path.join(workdir, 'listing_store.db'))
+        start = time.perf_counter()
+        store.upsert(synthetic_listings(args.listings))
+        import_s = round(time.perf_counter() - start, 3)
+
+        results = [{'operation': f'import {args.listings}', 'seconds': import_s, 'groups': None}]
+        for label, fn in [
+            ('median by suburb', lambda: store.median_price('suburb')),
+            ('median by beds', lambda: store.median_price('beds')),
+            ('median by beds (one suburb)', lambda: store.median_price('beds', 'point cook')),
+            ('summary (one suburb)', lambda: [store.summary('point cook')]),
+        ]:
+            seconds, rows = timed(fn)
+            results.append({'operation': label, 'seconds': seconds, 'groups': len(rows)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    console = Console()
+    table = Table(show_header=True, title="房源存储基准")
+    for column in ['操作', '耗时(s)', '分组数']:
+        table.add_column(column)
+    for r in results:
+        table.add_row(r['operation'], str(r['seconds']), str(r['groups'] if r['groups'] is not None else '-'))
+    console.print(table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""指标采集开销基准：测量每次记录指标、每个请求的埋点（trace ID + 开始/结束记录）以及渲染 /metrics 的耗时
+
+指标对象使用独立的注册表，不影响应用的 /metrics 输出。
+
+用法：
+    python benchmarks/bench_metrics.py
+    python benchmarks/bench_metrics.py --iterations 200000 --json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rich.console import Console
+from rich.table import Table
+
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def per_call_ns(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description='指标采集开销基准')
+    parser.add_argument('--iterations', type=int, default=100000, help='每项的重复次数（默认100000）')
+    parser.add_argument('--series', type=int, default=50, help='渲染测试中每个指标的标签组合数（默认50）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    registry = Registry()
+    counter = Counter('bench_total', '基准计数器', ('route', 'status'), registry=registry)
+    gauge = Gauge('bench_in_flight', '基准仪表', ('route',), registry=registry)
+    histogram = Histogram('bench_seconds', '基准直方图', ('route',), registry=registry)
+
+    logger = logging.getLogger('bench_metrics')
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(logging.INFO)
+
+    def request_cycle():
+        metrics.new_trace_id()
+        started_at = metrics.start_request('/bench')
+        metrics.finish_request('/bench', 'GET', 200, started_at)
+
+    def upstream_call():
+        with metrics.track_upstream('bench', 'call'):
+            pass
+
+    noop = lambda: None  # noqa: E731
+    baseline = per_call_ns(noop, args.iterations)
+    results = {
+        'counter_inc_ns': per_call_ns(lambda: counter.inc(route='/search', status='200'), args.iterations),
+        'gauge_inc_ns': per_call_ns(lambda: gauge.inc(route='/search'), args.iterations),
+        'histogram_observe_ns': per_call_ns(lambda: histogram.observe(0.42, route='/search'), args.iterations),
+        'track_upstream_ns': per_call_ns(upstream_call, args.iterations),
+        'request_cycle_ns': per_call_ns(request_cycle, args.iterations),
+    }
+    results = {name: round(value - baseline, 1) for name, value in results.items()}
+
+    logging.setLogRecordFactory(logging.LogRecord)
+    plain_log = per_call_ns(lambda: logger.info('message'), args.iterations)
+    metrics.install_trace_logging()
+    traced_log = per_call_ns(lambda: logger.info('message'), args.iterations)
+    results['log_trace_id_overhead_ns'] = round(traced_log - plain_log, 1)
+
+    for i in range(args.series):
+        counter.inc(route=f'/route{i}', status='200')
+        histogram.observe(i / 10, route=f'/route{i}')
+    start = time.perf_counter()
+    text = registry.render()
+    results['render_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    results['render_lines'] = text.count('\n')
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    console = Console()
+    table = Table(show_header=True, title='指标采集开销')
+    table.add_column('项目')
+    table.add_column('耗时')
+    labels = {
+        'counter_inc_ns': ('计数器 inc', 'ns'),
+        'gauge_inc_ns': ('仪表 inc', 'ns'),
+        'histogram_observe_ns': ('直方图 observe', 'ns'),
+        'track_upstream_ns': ('上游调用埋点 track_upstream', 'ns'),
+        'request_cycle_ns': ('每个HTTP请求的埋点（trace ID + 开始/结束）', 'ns'),
+        'log_trace_id_overhead_ns': ('每行日志附加 trace ID', 'ns'),
+        'render_ms': (f"渲染 /metrics（{results['render_lines']}行）", 'ms'),
+    }
+    for key, (label, unit) in labels.items():
+        table.add_row(label, f"{results[key]} {unit}")
+    console.print(table)
+
+
+if __name__ == '__main__':
+    main()
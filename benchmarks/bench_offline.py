@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""离线基准套件：回放录制的上游响应，测量各热点路径，结果输出为JSON便于对比回归
+
+不访问网络、不产生API费用：
+- OpenAI：本地替身服务（stub_openai.py）按分段回放 fixtures/openai_completions.json
+- DuckDuckGo：ReplayDDGS 回放 fixtures/ddgs_results.json
+- realestate.com.au：在无头浏览器中载入 fixtures/realestate_list.html 后执行提取脚本
+
+测量项：
+- search_suburb：三个分类并发搜索、过滤、去重的耗时
+- /search 端到端：未命中缓存（分段生成 + 检索增强）和命中缓存的单请求延迟
+- /search 并发吞吐：concurrency 个客户端同时请求不同区域
+- 爬虫提取：extract_listings 在列表页上的耗时（未安装 Chromium 时跳过并注明原因）
+- 内存：/search 并发阶段的 Python 分配峰值（tracemalloc）和进程最大常驻内存
+- 传输字节：缓存报告在不压缩、gzip、brotli 下的响应大小，以及条件请求（304）的大小
+
+用法：
+    python benchmarks/bench_offline.py
+    python benchmarks/bench_offline.py --requests 200 --concurrency 16 --output bench.json
+    python benchmarks/bench_offline.py --openai-delay 0.5 --ddgs-latency 0.2 --json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from rich.console import Console
+from rich.table import Table
+
+from replay import ReplayDDGS, completion_responder, load_fixture
+from report_sections import REPORT_SECTIONS
+from stub_openai import start_stub_server
+
+
+def summarize(timings_ms):
+    """中位数、P95 和最大值（毫秒）"""
+    ordered = sorted(timings_ms)
+    return {
+        'median_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+
+def replay_engine(latency):
+    from search_engine import PropertySearchEngine
+
+    engine = PropertySearchEngine(use_cache=False)
+    engine._session = ReplayDDGS(latency=latency)
+    return engine
+
+
+def bench_search_suburb(iterations, latency):
+    engine = replay_engine(latency)
+    try:
+        engine.search_suburb('point cook')  # 预热线程池
+        timings = []
+        results = None
+        for _ in range(iterations):
+            start = time.perf_counter()
+            results = engine.search_suburb('point cook')
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        engine.close()
+    return dict(summarize(timings), iterations=iterations,
+                results=sum(len(results[category]) for category in engine.category_searches),
+                duplicates=results['duplicates'])
+
+
+def post_search(client, suburb):
+    start = time.perf_counter()
+    response = client.post('/search', json={'suburb': suburb})
+    elapsed = (time.perf_counter() - start) * 1000
+    ok = response.status_code == 200
+    cached = ok and response.get_json().get('cached')
+    # 测试客户端的响应需要手动关闭，才会执行 call_on_close 中的指标收尾
+    response.close()
+    return ok, cached, elapsed
+
+
+def bench_transfer(client, suburb):
+    """同一份已缓存报告在不同压缩编码下的响应字节数，以及内容未变时条件请求（304）的字节数"""
+    sizes = {}
+    etag = None
+    for name, accept in (('identity', ''), ('gzip', 'gzip'), ('br', 'br, gzip')):
+        response = client.get('/search', query_string={'suburb': suburb}, headers={'Accept-Encoding': accept})
+        sizes[f'{name}_bytes'] = len(response.data)
+        sizes[f'{name}_encoding'] = response.headers.get('Content-Encoding', 'identity')
+        etag = response.headers.get('ETag')
+        response.close()
+    response = client.get('/search', query_string={'suburb': suburb}, headers={'If-None-Match': etag or ''})
+    sizes['not_modified_status'] = response.status_code
+    sizes['not_modified_bytes'] = len(response.data)
+    response.close()
+    return sizes
+
+
+def run_concurrent(core, suburbs, concurrency):
+    def task(suburb):
+        return post_search(core.app.test_client(), suburb)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(task, suburbs))
+    return outcomes, time.perf_counter() - start
+
+
+def bench_http(core, requests, concurrency):
+    client = core.app.test_client()
+    post_search(client, 'offline-warmup')  # 预热：区域索引、线程池、OpenAI连接
+
+    misses = [post_search(client, f'offline-seq-{i}') for i in range(requests)]
+    hits = [post_search(client, 'offline-seq-0') for _ in range(requests)]
+    transfer = bench_transfer(client, 'offline-seq-0')
+    outcomes, elapsed = run_concurrent(core, [f'offline-conc-{i}' for i in range(requests)], concurrency)
+
+    # 单独跑一轮测内存：tracemalloc 会显著拖慢执行，不能与计时混在一起
+    tracemalloc.start()
+    run_concurrent(core, [f'offline-mem-{i}' for i in range(requests)], concurrency)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    errors = sum(1 for ok, _, _ in misses + hits + outcomes if not ok)
+    return {
+        'search_miss': dict(summarize([ms for _, _, ms in misses]), requests=requests),
+        'search_hit': dict(summarize([ms for _, _, ms in hits]), requests=requests,
+                           cached=sum(1 for _, cached, _ in hits if cached)),
+        'search_concurrent': dict(summarize([ms for _, _, ms in outcomes]), requests=requests,
+                                  concurrency=concurrency, elapsed_s=round(elapsed, 3),
+                                  throughput_rps=round(sum(1 for ok, _, _ in outcomes if ok) / elapsed, 2)),
+        'memory': {'tracemalloc_peak_mb': round(peak / 1024 / 1024, 2), 'max_rss_mb': max_rss_mb()},
+        'transfer': transfer,
+        'errors': errors,
+    }
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以KB为单位
+    return round(usage / 1024 / 1024 if sys.platform == 'darwin' else usage / 1024, 2)
+
+
+async def bench_scraper(iterations):
+    from playwright.async_api import async_playwright
+    from web_scraper import extract_listings
+
+    html = load_fixture('realestate_list.html')
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            try:
+                page = await browser.new_page()
+                await page.set_content(html, wait_until='domcontentloaded')
+                await extract_listings(page)  # 预热
+                timings = []
+                records = []
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    records = await extract_listings(page)
+                    timings.append((time.perf_counter() - start) * 1000)
+            finally:
+                await browser.close()
+    except Exception as e:
+        return {'skipped': True, 'reason': str(e).strip().splitlines()[0]}
+    return dict(summarize(timings), skipped=False, iterations=iterations, listings=len(records))
+
+
+def configure_environment(workdir, stub_url):
+    """导入 app 之前设置环境变量：所有缓存和使用量数据写入临时目录，OpenAI请求发往本地替身"""
+    os.environ.update({
+        'OPENAI_API_KEY': 'sk-offline-0000',
+        'OPENAI_BASE_URL': stub_url,
+        'REPORT_CACHE_DIR': os.path.join(workdir, 'reports'),
+        'USAGE_DB_DIR': os.path.join(workdir, 'usage'),
+        'SINGLE_FLIGHT_LOCK_DIR': os.path.join(workdir, 'locks'),
+        'LISTING_STORE_DB': os.path.join(workdir, 'listing_store.db'),
+        'REPORT_MODE': 'sectioned',
+        'RETRIEVAL_ENABLED': 'true',
+        'RATE_LIMIT_ENABLED': 'false',  # 替身服务没有配额限制，测量的是应用自身的开销
+        'WARMER_ENABLED': 'false',  # 后台预热会与被测请求争用替身服务
+    })
+    # 先于 app 配置日志（app 中的 basicConfig 随之失效），只保留警告，避免刷屏和污染 --json 输出
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线基准套件（回放录制的上游响应）')
+    parser.add_argument('--iterations', type=int, default=50, help='search_suburb 的重复次数（默认50）')
+    parser.add_argument('--requests', type=int, default=50, help='/search 每项测试的请求数（默认50）')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发测试的客户端数（默认8）')
+    parser.add_argument('--openai-delay', type=float, default=0.0, help='替身OpenAI每次补全的模拟耗时（秒，默认0）')
+    parser.add_argument('--ddgs-latency', type=float, default=0.0, help='每次DDGS搜索的模拟网络延迟（秒，默认0）')
+    parser.add_argument('--scraper-iterations', type=int, default=20, help='爬虫提取的重复次数（默认20）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    parser.add_argument('--output', help='将JSON结果写入文件')
+    args = parser.parse_args()
+
+    stub = start_stub_server(delay=args.openai_delay, responder=completion_responder(REPORT_SECTIONS))
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(workdir, stub.base_url)
+        import app as core
+
+        core.search_engine = replay_engine(args.ddgs_latency)
+        core.usage_tracker.budget_limit = float('inf')  # 回放的用量不应触发月度预算限制
+
+        try:
+            search = bench_search_suburb(args.iterations, args.ddgs_latency)
+            http = bench_http(core, args.requests, args.concurrency)
+        finally:
+            core.search_engine.close()
+            stub.shutdown()
+        scraper = asyncio.run(bench_scraper(args.scraper_iterations))
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': {
+            'iterations': args.iterations, 'requests': args.requests, 'concurrency': args.concurrency,
+            'openai_delay_s': args.openai_delay, 'ddgs_latency_s': args.ddgs_latency,
+        },
+        'search_suburb': search,
+        'search_miss': http['search_miss'],
+        'search_hit': http['search_hit'],
+        'search_concurrent': http['search_concurrent'],
+        'scraper_extract': scraper,
+        'memory': http['memory'],
+        'transfer': http['transfer'],
+        'openai_requests': stub.request_count,
+        'errors': http['errors'],
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    console = Console()
+    table = Table(show_header=True, title="离线基准（回放录制的上游响应）")
+    for column in ['测试项', '中位(ms)', 'P95(ms)', '最慢(ms)', '备注']:
+        table.add_column(column)
+    concurrent = results['search_concurrent']
+    rows = [
+        ('search_suburb', search, f"{search['results']}条结果，去重{search['duplicates']}条"),
+        ('/search 未命中缓存', results['search_miss'], f"{args.requests}个请求"),
+        ('/search 命中缓存', results['search_hit'], f"命中{results['search_hit']['cached']}次"),
+        ('/search 并发', concurrent, f"并发{args.concurrency}，{concurrent['throughput_rps']} req/s"),
+        ('爬虫提取', scraper, f"{scraper['listings']}个房源" if not scraper['skipped'] else f"跳过：{scraper['reason']}"),
+    ]
+    for name, r, note in rows:
+        table.add_row(name, str(r.get('median_ms', '-')), str(r.get('p95_ms', '-')), str(r.get('max_ms', '-')), note)
+    console.print(table)
+    transfer = results['transfer']
+    console.print(f"报告响应字节数：不压缩 {transfer['identity_bytes']}，gzip {transfer['gzip_bytes']}，"
+                  f"{transfer['br_encoding']} {transfer['br_bytes']}，条件请求 {transfer['not_modified_status']} "
+                  f"{transfer['not_modified_bytes']}")
+    memory = results['memory']
+    console.print(f"内存：分配峰值 {memory['tracemalloc_peak_mb']} MB，最大常驻 {memory['max_rss_mb']} MB；"
+                  f"OpenAI请求 {results['openai_requests']} 次，失败 {results['errors']} 个")
+
+
+if __name__ == '__main__':
+    main()
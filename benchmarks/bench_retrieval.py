@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""检索打包基准：测量搜索结果去重、排序并按token预算打包（retrieval.build_context）的耗时
+
+搜索结果为合成数据，每个分类包含一定比例的重复链接；默认分别使用 tiktoken 和按字符估算计数各测一遍，
+并单独报告 tiktoken 编码表的首次加载耗时（服务中由启动预热承担）。
+
+用法：
+    python benchmarks/bench_retrieval.py
+    python benchmarks/bench_retrieval.py --results 10 50 200 --budget 400 --json
+    python benchmarks/bench_retrieval.py --tokenizer tiktoken
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rich.console import Console
+from rich.table import Table
+
+from retrieval import SEARCH_CATEGORIES, build_context, collect_snippets, get_encoder, tokenizer_name
+from report_sections import REPORT_SECTIONS
+
+MODEL = 'gpt-3.5-turbo'
+
+# 计数方式 -> 传给 retrieval 的 model（None 表示按字符估算）
+TOKENIZERS = {'tiktoken': MODEL, 'estimate': None}
+
+WORDS = ('school', 'train', 'station', 'hospital', 'crime', 'police', 'median', 'price', 'growth', 'council',
+         'funding', 'project', 'community', 'park', 'rent', 'market', 'clinic', 'road', 'upgrade', 'residents')
+
+
+def synthetic_results(per_category, suburb='point cook', seed=7):
+    rng = random.Random(seed)
+    results = {}
+    for category in SEARCH_CATEGORIES:
+        items = []
+        for i in range(per_category):
+            # 约五分之一的结果与其他结果链接相同，模拟不同搜索词返回的同一页面
+            page = rng.randint(0, per_category) if rng.random() < 0.2 else f"{category}-{i}"
+            body = ' '.join(rng.choice(WORDS) for _ in range(60))
+            items.append({
+                'title': f"{suburb.title()} {rng.choice(WORDS)} update {i}",
+                'link': f"https://www.example.com.au/{page}?utm_source=ddg",
+                'summary': f"{suburb.title()} {body}"[:500] + '...',
+                'date': str(rng.randint(2015, 2025)),
+            })
+        results[category] = items
+    return results
+
+
+def measure(per_category, budget, iterations, model=MODEL):
+    search_results = synthetic_results(per_category)
+    timings = []
+    packed = None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        # 与分段生成一致：去重一次，每个分段各排序打包一次
+        snippets = collect_snippets(search_results)
+        packed = [build_context(snippets, 'point cook', section['keywords'], budget, model)
+                  for section in REPORT_SECTIONS]
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'tokenizer': tokenizer_name(model) if model else 'estimate',
+        'results_per_category': per_category,
+        'budget': budget,
+        'sections': len(packed),
+        'median_ms': round(statistics.median(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'max_tokens': max(p['tokens'] for p in packed),
+        'used': sum(p['used'] for p in packed),
+        'duplicates': len(SEARCH_CATEGORIES) * per_category - len(snippets),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检索打包基准')
+    parser.add_argument('--results', type=int, nargs='+', default=[10, 50, 200], help='每个分类的搜索结果数')
+    parser.add_argument('--budget', type=int, default=400, help='每个分段的token预算（默认400）')
+    parser.add_argument('--iterations', type=int, default=20, help='重复次数（默认20）')
+    parser.add_argument('--tokenizer', nargs='+', choices=list(TOKENIZERS), default=list(TOKENIZERS),
+                        help='token计数方式（默认两种都测）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    # 编码表首次加载（可能需要下载）单独计时，不计入打包耗时
+    start = time.perf_counter()
+    encoder = get_encoder(MODEL) if 'tiktoken' in args.tokenizer else None
+    load_ms = round((time.perf_counter() - start) * 1000, 1)
+    tokenizers = list(args.tokenizer)
+    if 'tiktoken' in tokenizers and encoder is None:
+        print('tiktoken编码表不可用，跳过tiktoken计数', file=sys.stderr)
+        tokenizers.remove('tiktoken')
+
+    results = [measure(n, args.budget, args.iterations, TOKENIZERS[name])
+               for name in tokenizers for n in args.results]
+
+    if args.json:
+        print(json.dumps({'encoder_load_ms': load_ms if encoder else None, 'results': results}, indent=2))
+        return
+
+    console = Console()
+    if encoder is not None:
+        console.print(f"tiktoken编码表 {encoder.name} 首次加载: {load_ms} ms")
+    table = Table(show_header=True, title="检索打包耗时（6个分段合计）")
+    for column in ['tokenizer', '每类结果数', '预算', '中位耗时(ms)', '最慢(ms)', '最大tokens', '入选条数', '重复条数']:
+        table.add_column(column)
+    for r in results:
+        table.add_row(r['tokenizer'], str(r['results_per_category']), str(r['budget']), str(r['median_ms']),
+                      str(r['max_ms']), str(r['max_tokens']), str(r['used']), str(r['duplicates']))
+    console.print(table)
+
+
+if __name__ == '__main__':
+    main()
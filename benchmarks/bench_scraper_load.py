@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""爬虫页面加载基准：对比完整加载（旧行为）与快速加载模式的耗时和传输字节数
+
+使用本地服务器回放保存的 realestate.com.au 列表页（fixtures/realestate_list.html），
+图片、字体、样式、视频、广告和统计脚本由服务器按固定大小生成，并模拟网络延迟。
+传输字节数在服务器端统计。
+
+用法：
+    python benchmarks/bench_scraper_load.py --iterations 5
+    python benchmarks/bench_scraper_load.py --json --output scraper_load.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playwright.async_api import async_playwright
+from rich.console import Console
+from rich.table import Table
+
+from web_scraper import enable_fast_load, scrape_listing_page
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 按路径前缀生成的模拟资源：(Content-Type, 字节数)
+SYNTHETIC_ASSETS = [
+    ('/static/img/', 'image/jpeg', 120 * 1024),
+    ('/static/fonts/', 'font/woff2', 90 * 1024),
+    ('/static/css/', 'text/css', 40 * 1024),
+    ('/static/media/', 'video/mp4', 1024 * 1024),
+]
+
+# 广告/统计脚本：加载后持续发送信标请求，使页面迟迟达不到 networkidle
+TRACKER_SCRIPT = """
+(function () {
+  var sent = 0;
+  var timer = setInterval(function () {
+    fetch('%s?n=' + (sent++)).catch(function () {});
+    if (sent >= 8) { clearInterval(timer); }
+  }, 250);
+})();
+"""
+
+APP_SCRIPT = "window.__appReady = true;\n" + "/* bundle */\n" * 200
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        time.sleep(self.server.latency)
+
+        if path.startswith('/buy/'):
+            with open(os.path.join(FIXTURE_DIR, 'realestate_list.html'), 'rb') as f:
+                return self._send(200, 'text/html; charset=utf-8', f.read())
+        if path == '/static/js/app.js':
+            return self._send(200, 'application/javascript', APP_SCRIPT.encode('utf-8'))
+        if path == '/ads/gpt.js':
+            return self._send(200, 'application/javascript', (TRACKER_SCRIPT % '/ads/beacon').encode('utf-8'))
+        if path == '/analytics/tag.js':
+            return self._send(200, 'application/javascript', (TRACKER_SCRIPT % '/analytics/collect').encode('utf-8'))
+        if path in ('/ads/beacon', '/analytics/collect'):
+            return self._send(204, 'text/plain', b'')
+        for prefix, content_type, size in SYNTHETIC_ASSETS:
+            if path.startswith(prefix):
+                return self._send(200, content_type, b'\0' * size)
+        return self._send(404, 'text/plain', b'not found')
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
+            self.server.requests += 1
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), FixtureHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        self.requests = 0
+
+    def reset(self):
+        with self.lock:
+            self.bytes_sent = 0
+            self.requests = 0
+
+
+async def measure(browser, server, url, fast_load, iterations):
+    runs = []
+    for _ in range(iterations):
+        # 每次使用新的上下文，避免浏览器缓存影响结果
+        context = await browser.new_context()
+        if fast_load:
+            await enable_fast_load(context)
+        page = await context.new_page()
+        server.reset()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = await scrape_listing_page(page, url, fast_load)
+        elapsed = time.perf_counter() - start
+        runs.append({
+            'elapsed_s': elapsed,
+            'bytes': server.bytes_sent,
+            'requests': server.requests,
+            'listings': len(results)
+        })
+        await context.close()
+
+    return {
+        'mode': 'fast' if fast_load else 'full',
+        'iterations': iterations,
+        'median_s': round(statistics.median(r['elapsed_s'] for r in runs), 3),
+        'min_s': round(min(r['elapsed_s'] for r in runs), 3),
+        'bytes': int(statistics.median(r['bytes'] for r in runs)),
+        'requests': int(statistics.median(r['requests'] for r in runs)),
+        'listings': runs[-1]['listings']
+    }
+
+
+async def run(iterations, latency):
+    server = FixtureServer(latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/buy/in-point+cook,+vic+3030/list-1"
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            try:
+                return [
+                    await measure(browser, server, url, False, iterations),
+                    await measure(browser, server, url, True, iterations)
+                ]
+            finally:
+                await browser.close()
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='爬虫页面加载基准')
+    parser.add_argument('--iterations', type=int, default=5, help='每种模式的运行次数（默认5）')
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的模拟网络延迟（秒，默认0.05）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    parser.add_argument('--output', help='将JSON结果写入文件')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.iterations, args.latency))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    console = Console()
+    table = Table(show_header=True, title="页面加载对比")
+    for column in ['模式', '次数', '中位耗时(s)', '最快(s)', '传输字节', '请求数', '房产数']:
+        table.add_column(column)
+    for r in results:
+        table.add_row(r['mode'], str(r['iterations']), str(r['median_s']), str(r['min_s']),
+                      f"{r['bytes']:,}", str(r['requests']), str(r['listings']))
+    console.print(table)
+
+
+if __name__ == '__main__':
+    main()
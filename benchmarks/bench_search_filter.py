@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""搜索结果过滤基准：对比旧实现（每个关键词各做一次 text.lower() 子串查找、每次调用 re.search 查日期）
+与 KeywordClassifier + 按年份定位的日期解析的单条结果耗时。KeywordClassifier 分两种用法：
+matches 逐个分类判断（每个分类各转换一次小写），classify 一次遍历对全部分类打分（只转换一次小写，
+PropertySearchEngine 整理结果时使用）
+
+语料为合成的DuckDuckGo结果（正文长度、日期格式和相关比例可调），每条结果都要判断与三个分类是否相关。
+
+用法：
+    python benchmarks/bench_search_filter.py
+    python benchmarks/bench_search_filter.py --results 20000 --body-words 200 --json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rich.console import Console
+from rich.table import Table
+
+from search_engine import CATEGORY_KEYWORDS, KeywordClassifier, extract_date
+
+FILLER = ('residents', 'council', 'community', 'the', 'local', 'area', 'new', 'plans', 'for', 'west',
+          'melbourne', 'families', 'growth', 'access', 'near', 'with', 'and', 'suburb', 'year', 'latest')
+DATE_FORMATS = ('{y}-{m:02d}-{d:02d}', '{d}/{m:02d}/{y}', '{d} March {y}', 'March {d}, {y}', 'March {y}', '')
+
+
+def synthetic_corpus(count, body_words, relevant_ratio, seed=11):
+    rng = random.Random(seed)
+    keywords = [k for words in CATEGORY_KEYWORDS.values() for k in words]
+    corpus = []
+    for i in range(count):
+        words = [rng.choice(FILLER) for _ in range(body_words)]
+        if rng.random() < relevant_ratio:
+            # 关键词随机出现在正文任意位置，大小写不一
+            words[rng.randrange(body_words)] = rng.choice(keywords).title()
+        date = rng.choice(DATE_FORMATS).format(y=rng.randint(2015, 2025), m=rng.randint(1, 12), d=rng.randint(1, 28))
+        if date:
+            words.insert(rng.randrange(body_words), date)
+        corpus.append({'title': f"Result {i}", 'href': f"https://example.com/{i}", 'body': ' '.join(words)})
+    return corpus
+
+
+def shape(result, date):
+    body = result.get('body', '')
+    return {
+        'title': result.get('title', ''),
+        'link': result.get('href') or result.get('link', ''),
+        'summary': body[:500] + '...',
+        'date': date
+    }
+
+
+def legacy_filter(corpus):
+    """旧实现：每个分类、每个关键词都对整段正文做一次 lower()"""
+    kept = 0
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        for result in corpus:
+            text = result.get('body', '')
+            if any(keyword.lower() in text.lower() for keyword in keywords):
+                match = re.search(r'\d{4}[-/]\d{1,2}[-/]\d{1,2}', text)
+                shape(result, match.group(0) if match else '')
+                kept += 1
+    return kept
+
+
+def classifier_filter(corpus, classifier):
+    kept = 0
+    for category in CATEGORY_KEYWORDS:
+        for result in corpus:
+            body = result.get('body', '')
+            if classifier.matches(body, category):
+                shape(result, extract_date(body))
+                kept += 1
+    return kept
+
+
+def classify_filter(corpus, classifier):
+    """一次遍历：每条结果只转换一次小写，同时得到全部相关分类，日期只解析一次"""
+    kept = 0
+    for result in corpus:
+        body = result.get('body', '')
+        categories = classifier.classify(body)
+        if categories:
+            date = extract_date(body)
+            for _ in categories:
+                shape(result, date)
+            kept += len(categories)
+    return kept
+
+
+def measure(fn, iterations, count):
+    timings = []
+    kept = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        kept = fn()
+        timings.append(time.perf_counter() - start)
+    # 单条结果耗时：每条结果按三个分类各处理一次
+    per_result = statistics.median(timings) / (count * len(CATEGORY_KEYWORDS)) * 1e6
+    return {'median_ms': round(statistics.median(timings) * 1000, 2), 'per_result_us': round(per_result, 3),
+            'kept': kept}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='搜索结果过滤基准')
+    parser.add_argument('--results', type=int, default=5000, help='语料条数（默认5000）')
+    parser.add_argument('--body-words', type=int, default=120, help='每条正文的词数（默认120）')
+    parser.add_argument('--relevant', type=float, default=0.5, help='包含关键词的结果比例（默认0.5）')
+    parser.add_argument('--iterations', type=int, default=5, help='重复次数（默认5）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.results, args.body_words, args.relevant)
+    classifier = KeywordClassifier(CATEGORY_KEYWORDS)
+    results = {
+        'legacy': measure(lambda: legacy_filter(corpus), args.iterations, args.results),
+        'classifier': measure(lambda: classifier_filter(corpus, classifier), args.iterations, args.results),
+        'classify': measure(lambda: classify_filter(corpus, classifier), args.iterations, args.results),
+    }
+    results['speedup'] = round(results['legacy']['per_result_us'] / results['classifier']['per_result_us'], 2)
+    results['classify_speedup'] = round(results['legacy']['per_result_us'] / results['classify']['per_result_us'], 2)
+    results['dated'] = sum(1 for result in corpus if extract_date(result['body']))
+    results['results'] = args.results
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    console = Console()
+    table = Table(show_header=True, title=f"搜索结果过滤（{args.results}条 × 3个分类，正文{args.body_words}词）")
+    for column in ['实现', '中位耗时(ms)', '单条耗时(µs)', '保留条数']:
+        table.add_column(column)
+    for name, label in (('legacy', '旧实现'), ('classifier', '逐分类 matches'), ('classify', '一次遍历 classify')):
+        r = results[name]
+        table.add_row(label, str(r['median_ms']), str(r['per_result_us']), str(r['kept']))
+    console.print(table)
+    console.print(f"加速比: matches {results['speedup']}x，classify {results['classify_speedup']}x，"
+                  f"识别出日期的结果: {results['dated']}/{args.results}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""冷启动基准：导入耗时与首个响应耗时，每次测量都在新的Python进程中进行
+
+自动扩容的实例从进程启动到返回第一个响应的时间直接计入用户等待。测量项：
+- import app：导入耗时，以及导入后是否已经加载了应按需导入的重型依赖（openai、duckduckgo_search、playwright）
+- 首个响应：进程内用 Flask 测试客户端依次请求首页、第一次 /search（未命中缓存，含OpenAI客户端初始化）
+  和第二次 /search（其他区域，客户端已初始化），差值即为按需初始化的开销
+- 进程启动到首个 /search 响应的总耗时（含解释器启动）
+- 服务启动：以 Procfile 的 gunicorn 和 uvicorn 命令启动服务，测量到 /ready 返回200以及第一次 /search 的耗时
+- app 直接导入的模块中累计耗时最多的几个（python -X importtime）
+
+OpenAI请求发往本地替身服务，不产生API费用；检索增强关闭，不访问DuckDuckGo。
+--max-import-ms 或重型依赖在导入时被加载时以非零状态退出，可在CI中发现冷启动回归。
+
+用法：
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --servers threaded --json
+    python benchmarks/bench_startup.py --max-import-ms 500 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from rich.console import Console
+from rich.table import Table
+
+from loadtest import SERVER_COMMANDS, free_port
+from stub_openai import start_stub_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只在用到时才应导入的重型依赖
+LAZY_MODULES = ('openai', 'duckduckgo_search', 'playwright')
+
+# 在子进程中执行：导入 app 并依次发出首批请求，结果写入 argv[1] 指定的文件（app 的日志会写到标准输出）
+CHILD_SCRIPT = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - start) * 1000
+eager = [name for name in %(lazy)r if name in sys.modules]
+
+client = app.app.test_client()
+
+def timed(fn):
+    t = time.perf_counter()
+    response = fn()
+    return (time.perf_counter() - t) * 1000, response.status_code
+
+first_page_ms, page_status = timed(lambda: client.get('/'))
+first_search_ms, first_status = timed(lambda: client.post('/search', json={'suburb': 'point cook'}))
+first_response_at = time.time()
+second_search_ms, second_status = timed(lambda: client.post('/search', json={'suburb': 'werribee'}))
+with open(sys.argv[1], 'w') as f:
+    json.dump({'import_ms': import_ms, 'eager_modules': eager, 'first_page_ms': first_page_ms,
+               'first_search_ms': first_search_ms, 'second_search_ms': second_search_ms,
+               'first_response_at': first_response_at,
+               'statuses': [page_status, first_status, second_status]}, f)
+''' % {'lazy': LAZY_MODULES}
+
+
+def child_env(workdir, stub_url, prewarm):
+    """子进程的环境变量：缓存、使用量和锁文件都写入临时目录"""
+    env = dict(os.environ)
+    env.update({
+        'OPENAI_API_KEY': 'sk-startup-0000',
+        'OPENAI_BASE_URL': stub_url,
+        'REPORT_CACHE_DIR': os.path.join(workdir, 'reports'),
+        'USAGE_DB_DIR': os.path.join(workdir, 'usage'),
+        'SINGLE_FLIGHT_LOCK_DIR': os.path.join(workdir, 'locks'),
+        'RATE_LIMIT_DB': os.path.join(workdir, 'rate_limits.db'),
+        'LISTING_STORE_DB': os.path.join(workdir, 'listing_store.db'),
+        'RETRIEVAL_ENABLED': 'false',  # 不访问DuckDuckGo
+        'RATE_LIMIT_ENABLED': 'false',
+        'WARMER_ENABLED': 'false',
+        'PREWARM_ON_START': 'true' if prewarm else 'false',
+        'PYTHONPATH': REPO_ROOT,
+    })
+    return env
+
+
+def summarize(values):
+    """中位数、P95 和最大值（毫秒）"""
+    ordered = sorted(values)
+    return {
+        'median_ms': round(statistics.median(ordered), 1),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        'max_ms': round(ordered[-1], 1),
+    }
+
+
+def run_child(stub_url, prewarm):
+    """在新进程中导入 app 并发出首批请求"""
+    with tempfile.TemporaryDirectory() as workdir:
+        result_path = os.path.join(workdir, 'result.json')
+        spawned_at = time.time()
+        subprocess.run([sys.executable, '-c', CHILD_SCRIPT, result_path], cwd=workdir,
+                       env=child_env(workdir, stub_url, prewarm),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, timeout=120)
+        with open(result_path) as f:
+            result = json.load(f)
+    result['process_to_first_response_ms'] = (result.pop('first_response_at') - spawned_at) * 1000
+    return result
+
+
+def bench_in_process(runs, stub_url, prewarm):
+    results = [run_child(stub_url, prewarm) for _ in range(runs)]
+    summary = {
+        name: summarize([r[name] for r in results])
+        for name in ('import_ms', 'first_page_ms', 'first_search_ms', 'second_search_ms',
+                     'process_to_first_response_ms')
+    }
+    summary['eager_modules'] = sorted({name for r in results for name in r['eager_modules']})
+    summary['errors'] = sum(1 for r in results for status in r['statuses'] if status != 200)
+    return summary
+
+
+def post_search(url, suburb):
+    req = urllib.request.Request(url, data=json.dumps({'suburb': suburb}).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        resp.read()
+        return resp.status
+
+
+def run_server(mode, stub_url, prewarm, timeout=60):
+    """启动服务，轮询 /ready 直到返回200，再请求一次 /search"""
+    port = free_port()
+    cmd = list(SERVER_COMMANDS[mode])
+    cmd += ['--bind', f'127.0.0.1:{port}'] if mode == 'threaded' else ['--host', '127.0.0.1', '--port', str(port)]
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=workdir, env=child_env(workdir, stub_url, prewarm),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            ready_ms = None
+            while time.perf_counter() - start < timeout:
+                try:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}/ready', timeout=1) as resp:
+                        resp.read()
+                    ready_ms = (time.perf_counter() - start) * 1000
+                    break
+                except (urllib.error.URLError, ConnectionError, OSError):
+                    if proc.poll() is not None:
+                        raise RuntimeError(f"{mode} 服务启动失败")
+                    time.sleep(0.01)
+            if ready_ms is None:
+                raise RuntimeError(f"{mode} 服务在{timeout}秒内未就绪")
+            status = post_search(f'http://127.0.0.1:{port}/search', 'point cook')
+            first_search_ms = (time.perf_counter() - start) * 1000
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+    return {'ready_ms': ready_ms, 'first_search_ms': first_search_ms, 'status': status}
+
+
+def bench_server(mode, runs, stub_url, prewarm):
+    executable = SERVER_COMMANDS[mode][0]
+    if shutil.which(executable) is None:
+        return {'skipped': True, 'reason': f'未安装 {executable}'}
+    results = [run_server(mode, stub_url, prewarm) for _ in range(runs)]
+    return {
+        'skipped': False,
+        'ready_ms': summarize([r['ready_ms'] for r in results]),
+        'first_search_ms': summarize([r['first_search_ms'] for r in results]),
+        'errors': sum(1 for r in results if r['status'] != 200),
+    }
+
+
+def import_profile(stub_url, top):
+    """python -X importtime 中 app 直接导入的模块，按累计耗时降序"""
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=workdir,
+                              env=child_env(workdir, stub_url, False), capture_output=True, text=True,
+                              timeout=120)
+    # 输出按导入完成的顺序排列，子模块在父模块之前；模块名前的缩进每层两个空格
+    modules, children = [], []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == 'app':
+                modules = children
+            children = []
+        elif depth == 1:
+            children.append({'module': name.strip(), 'cumulative_ms': round(int(cumulative) / 1000, 1)})
+    modules.sort(key=lambda item: item['cumulative_ms'], reverse=True)
+    return modules[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='冷启动基准（导入耗时与首个响应耗时）')
+    parser.add_argument('--runs', type=int, default=5, help='每项测试启动的进程数（默认5）')
+    parser.add_argument('--servers', default='threaded,async',
+                        help='测量服务启动的模式，逗号分隔（threaded、async，默认两者；为空时跳过）')
+    parser.add_argument('--prewarm', action='store_true', help='启用 PREWARM_ON_START（默认关闭，测量按需初始化的开销）')
+    parser.add_argument('--top', type=int, default=10, help="列出 app 直接导入的模块中耗时最多的前N个（默认10）")
+    parser.add_argument('--max-import-ms', type=float, help='import app 的中位耗时超过该值时以非零状态退出')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    parser.add_argument('--output', help='将JSON结果写入文件')
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.servers.split(',') if mode.strip()]
+    stub = start_stub_server(delay=0.0)
+    try:
+        in_process = bench_in_process(args.runs, stub.base_url, args.prewarm)
+        servers = {mode: bench_server(mode, args.runs, stub.base_url, args.prewarm) for mode in modes}
+        imports = import_profile(stub.base_url, args.top)
+    finally:
+        stub.shutdown()
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': {'runs': args.runs, 'prewarm': args.prewarm},
+        'in_process': in_process,
+        'servers': servers,
+        'slowest_imports': imports,
+    }
+    failures = []
+    if in_process['eager_modules']:
+        failures.append(f"导入 app 时加载了应按需导入的模块: {', '.join(in_process['eager_modules'])}")
+    if args.max_import_ms is not None and in_process['import_ms']['median_ms'] > args.max_import_ms:
+        failures.append(f"import app 中位耗时 {in_process['import_ms']['median_ms']}ms 超过 {args.max_import_ms}ms")
+    results['failures'] = failures
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return 1 if failures else 0
+
+    console = Console()
+    table = Table(show_header=True, title=f"冷启动（{args.runs}个新进程）")
+    for column in ['测试项', '中位(ms)', 'P95(ms)', '最慢(ms)']:
+        table.add_column(column)
+    rows = [
+        ('import app', in_process['import_ms']),
+        ('首次请求首页', in_process['first_page_ms']),
+        ('首次 /search（按需初始化）', in_process['first_search_ms']),
+        ('第二次 /search', in_process['second_search_ms']),
+        ('进程启动到首个 /search 响应', in_process['process_to_first_response_ms']),
+    ]
+    for mode, server in servers.items():
+        if not server['skipped']:
+            rows += [(f'{mode} 启动到 /ready', server['ready_ms']),
+                     (f'{mode} 启动到首个 /search', server['first_search_ms'])]
+    for name, r in rows:
+        table.add_row(name, str(r['median_ms']), str(r['p95_ms']), str(r['max_ms']))
+    console.print(table)
+    for mode, server in servers.items():
+        if server['skipped']:
+            console.print(f"{mode}：跳过，{server['reason']}")
+
+    imports_table = Table(show_header=True, title="app 直接导入的模块（累计耗时）")
+    imports_table.add_column('模块')
+    imports_table.add_column('累计(ms)')
+    for item in imports:
+        imports_table.add_row(item['module'], str(item['cumulative_ms']))
+    console.print(imports_table)
+
+    errors = in_process['errors'] + sum(s.get('errors', 0) for s in servers.values())
+    console.print(f"失败请求 {errors} 个")
+    for failure in failures:
+        console.print(f"[red]{failure}[/red]")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""本地压测：对比线程模式（gunicorn + Flask）与异步模式（uvicorn + ASGI）的吞吐量
+
+OpenAI请求被替换为本地替身服务（stub_openai.py），不产生任何API费用。
+每个请求使用不同的区域名，保证都会穿透报告缓存。
+
+用法：
+    python benchmarks/loadtest.py --requests 200 --concurrency 50 --delay 2
+    python benchmarks/loadtest.py --modes async --requests 2000 --concurrency 1000
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from rich.console import Console
+from rich.table import Table
+
+from stub_openai import start_stub_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_COMMANDS = {
+    # 与 Procfile 保持一致
+    'threaded': ['gunicorn', 'app:app', '--timeout', '30', '--workers', '1', '--threads', '2'],
+    'async': ['uvicorn', 'asgi_app:app', '--log-level', 'warning'],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port, stub_url, workdir):
+    """在子进程中启动待测服务"""
+    cmd = list(SERVER_COMMANDS[mode])
+    if mode == 'threaded':
+        cmd += ['--bind', f'127.0.0.1:{port}']
+    else:
+        cmd += ['--host', '127.0.0.1', '--port', str(port)]
+    env = dict(os.environ)
+    env.update({
+        'OPENAI_API_KEY': 'sk-loadtest-0000',
+        'OPENAI_BASE_URL': stub_url,
+        'REPORT_CACHE_DIR': os.path.join(workdir, 'reports'),
+        'RATE_LIMIT_ENABLED': 'false',  # 测量服务本身的吞吐，不受上游配额限制
+        'WARMER_ENABLED': 'false',  # 压测产生的热度不应触发后台预热
+        'PYTHONPATH': REPO_ROOT,
+    })
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/usage', timeout=1)
+            return proc
+        except Exception:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{mode} 服务启动失败")
+
+
+def post_search(url, suburb, timeout):
+    start = time.perf_counter()
+    req = urllib.request.Request(
+        url, data=json.dumps({'suburb': suburb}).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 'timeout'
+    return status, time.perf_counter() - start
+
+
+def run_load(mode, total, concurrency, stub_url, timeout):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server(mode, port, stub_url, workdir)
+        try:
+            url = f'http://127.0.0.1:{port}/search'
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(
+                    lambda i: post_search(url, f'loadtest-{mode}-{i}', timeout), range(total)
+                ))
+            elapsed = time.perf_counter() - start
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    ok_latencies = sorted(lat for status, lat in results if status == 200)
+    errors = sum(1 for status, _ in results if status != 200)
+
+    def pct(p):
+        if not ok_latencies:
+            return None
+        return round(ok_latencies[min(len(ok_latencies) - 1, int(len(ok_latencies) * p))], 3)
+
+    return {
+        'mode': mode,
+        'requests': total,
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(ok_latencies) / elapsed, 2) if elapsed else 0,
+        'ok': len(ok_latencies),
+        'errors': errors,
+        'p50_s': round(statistics.median(ok_latencies), 3) if ok_latencies else None,
+        'p95_s': pct(0.95),
+        'p99_s': pct(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='线程模式与异步模式的本地压测对比')
+    parser.add_argument('--requests', type=int, default=100, help='请求总数（默认100）')
+    parser.add_argument('--concurrency', type=int, default=50, help='并发客户端数（默认50）')
+    parser.add_argument('--delay', type=float, default=2.0, help='替身OpenAI的模拟生成耗时（秒）')
+    parser.add_argument('--timeout', type=float, default=60.0, help='单个请求的客户端超时（秒）')
+    parser.add_argument('--modes', nargs='+', choices=list(SERVER_COMMANDS), default=list(SERVER_COMMANDS))
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    stub = start_stub_server(delay=args.delay)
+    results = [run_load(mode, args.requests, args.concurrency, stub.base_url, args.timeout) for mode in args.modes]
+    stub.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    console = Console()
+    table = Table(show_header=True)
+    for column in ['模式', '请求数', '并发', '总耗时(s)', '吞吐(req/s)', '成功', '失败', 'P50(s)', 'P95(s)', 'P99(s)']:
+        table.add_column(column)
+    for r in results:
+        table.add_row(r['mode'], str(r['requests']), str(r['concurrency']), str(r['elapsed_s']),
+                      str(r['throughput_rps']), str(r['ok']), str(r['errors']),
+                      str(r['p50_s']), str(r['p95_s']), str(r['p99_s']))
+    console.print(table)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""录制的上游响应回放：DuckDuckGo搜索结果、OpenAI补全和 realestate.com.au 列表页
+
+fixtures/ 下的数据录制自真实请求（Point Cook 3030），基准测试用它们替换网络调用，
+结果不受网络波动影响，也不产生API费用：
+
+- ddgs_results.json：search_suburb 三个分类的原始DDGS结果（含真实出现的URL/正文重复）
+- openai_completions.json：各报告分段和整篇报告的补全内容及 token 用量
+- realestate_list.html：房源列表页
+"""
+import copy
+import json
+import os
+import time
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixture(name):
+    path = os.path.join(FIXTURE_DIR, name)
+    if name.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class ReplayDDGS:
+    """DDGS 的替身：按搜索词（去掉区域名后的部分）返回录制的结果，可模拟每次请求的网络延迟
+
+    安装方式：engine._session = ReplayDDGS()，PropertySearchEngine 的其余逻辑照常执行。
+    """
+
+    def __init__(self, fixture=None, latency=0.0):
+        fixture = fixture or load_fixture('ddgs_results.json')
+        suburb = fixture['suburb']
+        # 录制的搜索词以区域名开头，回放时按剩余部分匹配，任何区域都能命中
+        self.pages = {
+            entry['query'][len(suburb):].strip(): entry['results']
+            for entry in fixture['queries'].values()
+        }
+        self.latency = latency
+        self.calls = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    def text(self, query, max_results=10, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        for suffix, results in self.pages.items():
+            if query.endswith(suffix):
+                # 返回副本，调用方修改结果不影响后续回放
+                return copy.deepcopy(results[:max_results])
+        return []
+
+
+def completion_responder(sections, fixture=None):
+    """生成 stub_openai 的 responder：按系统提示词中的一级标题回放对应分段的补全，整篇请求回放整篇报告"""
+    fixture = fixture or load_fixture('openai_completions.json')
+    markers = [(f"# {section['titles'][0]}", fixture['sections'][section['name']])
+               for section in sections if section['name'] in fixture['sections']]
+    report = fixture['report']
+
+    def respond(body):
+        system = next((m.get('content', '') for m in body.get('messages', []) if m.get('role') == 'system'), '')
+        matched = [(system.find(marker), recorded) for marker, recorded in markers if marker in system]
+        # 整篇报告的提示词包含所有标题，只含部分标题的是分段请求
+        if not matched or len(matched) == len(markers):
+            return report['content'], report['usage']
+        recorded = min(matched, key=lambda item: item[0])[1]
+        return recorded['content'], recorded['usage']
+
+    return respond
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""本地OpenAI接口替身：按固定延迟返回预设的 chat completion，供压测与基准测试使用"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONTENT = "# 公共设施与政府基建\n## 关键项目与拨款\n压测用的模拟报告内容。\n"
+DEFAULT_USAGE = {'prompt_tokens': 100, 'completion_tokens': 100}
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+
+        time.sleep(server.delay)
+        content, usage = server.respond(body)
+        usage = dict(usage, total_tokens=usage['prompt_tokens'] + usage['completion_tokens'])
+
+        if body.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for piece in content.splitlines(keepends=True):
+                chunk = {
+                    'id': 'stub', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                    'model': body.get('model', 'stub'),
+                    'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            final = {
+                'id': 'stub', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': body.get('model', 'stub'), 'choices': [], 'usage': usage
+            }
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+            self.close_connection = True
+            return
+
+        payload = json.dumps({
+            'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': body.get('model', 'stub'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': usage
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, delay=2.0, content=DEFAULT_CONTENT, responder=None):
+        super().__init__(address, StubOpenAIHandler)
+        self.delay = delay
+        self.content = content
+        # responder(请求体) -> (内容, usage)，用于按请求回放录制的响应；未指定时总是返回 content
+        self.responder = responder
+        self.lock = threading.Lock()
+        self.request_count = 0
+
+    def respond(self, body):
+        if self.responder is not None:
+            return self.responder(body)
+        return self.content, DEFAULT_USAGE
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_stub_server(delay=2.0, content=DEFAULT_CONTENT, port=0, responder=None):
+    """在后台线程启动替身服务，返回 server 对象（通过 server.base_url 获取地址）"""
+    server = StubOpenAIServer(('127.0.0.1', port), delay=delay, content=content, responder=responder)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地OpenAI接口替身')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口（默认8765）')
+    parser.add_argument('--delay', type=float, default=2.0, help='每次请求的模拟生成耗时（秒）')
+    args = parser.parse_args()
+
+    server = StubOpenAIServer(('127.0.0.1', args.port), delay=args.delay)
+    print(f"OpenAI替身服务已启动: {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""多区域、多页爬取：按区域和邮编构建列表URL，并发翻页直到最后一页，
+以稳定的房源键跨页、跨运行去重，重复爬取时只处理新增或变化的房源
+
+用法：
+    python crawler.py "Point Cook 3030" "Werribee 3030"
+    python crawler.py "Point Cook 3030" --max-pages 20 -o changes.jsonl
+    python crawler.py "Point Cook 3030" --full   # 不提前停止，完整遍历所有页
+    python crawler.py "Point Cook 3030" --full-interval-days 3   # 距上次完整遍历超过3天时自动完整遍历
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urljoin
+
+from listing_store import DEFAULT_DB_PATH as DEFAULT_STORE_PATH, ListingStore
+from web_scraper import DEFAULT_ALLOWED_RESOURCES, ScraperService, build_search_url, display_results
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join('cache', 'listings.db')
+SITE_ROOT = 'https://www.realestate.com.au'
+
+# 按上架时间倒序，增量爬取时遇到整页无变化即可停止
+NEWEST_FIRST = 'list-date'
+
+# 距上次完整遍历超过此时长（秒）时，下一次爬取改为完整遍历，发现较早上架房源的价格和详情变化
+DEFAULT_FULL_INTERVAL = 7 * 24 * 3600
+
+# 房源链接末尾的数字ID，例如 /property-house-vic-point+cook-143960912
+LISTING_ID_PATTERN = re.compile(r'-(\d{6,})(?:[/?#]|$)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    key TEXT PRIMARY KEY,
+    suburb TEXT NOT NULL,
+    url TEXT,
+    price TEXT,
+    address TEXT,
+    details TEXT,
+    content_hash TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    last_changed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_listings_suburb ON listings (suburb);
+CREATE TABLE IF NOT EXISTS full_crawls (
+    suburb TEXT PRIMARY KEY,
+    finished_at REAL NOT NULL
+);
+"""
+
+
+def normalize_address(address: str) -> str:
+    """地址归一化：小写、去标点、合并空白"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', (address or '').lower()).split())
+
+
+def listing_key(listing: Dict) -> Optional[str]:
+    """房源的稳定键：优先使用链接中的房源ID，否则使用归一化地址"""
+    match = LISTING_ID_PATTERN.search(listing.get('link') or '')
+    if match:
+        return f"id:{match.group(1)}"
+    address = normalize_address(listing.get('address'))
+    if address and address != '地址未知':
+        return f"addr:{address}"
+    return None
+
+
+def content_hash(listing: Dict) -> str:
+    """房源内容摘要，价格、地址或详情变化时改变"""
+    content = '\x1f'.join(listing.get(field) or '' for field in ('price', 'address', 'details'))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class ListingIndex:
+    """已见房源索引（SQLite），记录每个房源的内容摘要和首次/最近出现时间"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def known_count(self, suburb: str) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM listings WHERE suburb = ?', (suburb,)).fetchone()[0]
+
+    def last_full_crawl(self, suburb: str) -> Optional[float]:
+        """该区域最近一次完整遍历的完成时间，从未完整遍历时返回None"""
+        row = self._conn.execute('SELECT finished_at FROM full_crawls WHERE suburb = ?', (suburb,)).fetchone()
+        return row[0] if row else None
+
+    def mark_full_crawl(self, suburb: str, finished_at: Optional[float] = None):
+        self._conn.execute('INSERT OR REPLACE INTO full_crawls (suburb, finished_at) VALUES (?, ?)',
+                           (suburb, finished_at or time.time()))
+
+    def record(self, suburb: str, listings: List[Dict]) -> List[str]:
+        """在单个事务中写入一页房源，返回每个房源的状态：new、changed 或 unchanged"""
+        now = time.time()
+        statuses = []
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            for listing in listings:
+                digest = content_hash(listing)
+                row = self._conn.execute(
+                    'SELECT content_hash FROM listings WHERE key = ?', (listing['key'],)
+                ).fetchone()
+                if row is None:
+                    status = 'new'
+                    self._conn.execute(
+                        'INSERT INTO listings (key, suburb, url, price, address, details, content_hash, '
+                        'first_seen, last_seen, last_changed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (listing['key'], suburb, listing.get('url'), listing.get('price'), listing.get('address'),
+                         listing.get('details'), digest, now, now, now)
+                    )
+                elif row[0] != digest:
+                    status = 'changed'
+                    self._conn.execute(
+                        'UPDATE listings SET url = ?, price = ?, address = ?, details = ?, content_hash = ?, '
+                        'last_seen = ?, last_changed = ? WHERE key = ?',
+                        (listing.get('url'), listing.get('price'), listing.get('address'), listing.get('details'),
+                         digest, now, now, listing['key'])
+                    )
+                else:
+                    status = 'unchanged'
+                    self._conn.execute('UPDATE listings SET last_seen = ? WHERE key = ?', (now, listing['key']))
+                statuses.append(status)
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        return statuses
+
+
+class Crawler:
+    """基于 ScraperService 的翻页爬虫
+
+    每个区域按 parallelism 页为一批并发抓取 list-N 页，遇到空页视为已到最后一页。
+    同一次运行内重复出现的房源（如置顶推荐）只处理一次。incremental 为True且该区域
+    之前爬取过时，按上架时间倒序抓取，一页中没有任何新增或变化的房源即停止翻页，
+    因此重复爬取的耗时与变化量成正比，而不是与房源总量成正比。
+
+    取舍：列表只能按上架时间排序，较早上架的房源改价或修改详情后位置不变，增量爬取在
+    前面的无变化页就停止了，发现不了这类变化。因此距上次完整遍历超过 full_interval 秒
+    （或从未完整遍历）时，本次改为完整遍历；较早房源的变化最多延迟 full_interval 才被发现，
+    代价是每个周期多一次完整遍历。有页面抓取失败的完整遍历不算完成，下次爬取会重新完整遍历。full_interval 为None或0时不做周期性完整遍历。
+    """
+
+    def __init__(self, service: ScraperService, index: ListingIndex, max_pages: int = 50,
+                 incremental: bool = True, window: Optional[int] = None,
+                 full_interval: Optional[float] = DEFAULT_FULL_INTERVAL):
+        self.service = service
+        self.index = index
+        self.max_pages = max(1, max_pages)
+        self.incremental = incremental
+        self.window = max(1, window or service.parallelism)
+        self.full_interval = full_interval
+
+    def full_crawl_due(self, suburb: str, now: Optional[float] = None) -> bool:
+        """是否需要周期性完整遍历"""
+        if not self.full_interval:
+            return False
+        last_full = self.index.last_full_crawl(suburb)
+        return last_full is None or (now or time.time()) - last_full >= self.full_interval
+
+    async def crawl_suburb(self, suburb: str, postcode: Optional[str] = None) -> Dict:
+        """爬取单个区域，返回统计和新增/变化的房源"""
+        start_time = time.perf_counter()
+        incremental = self.incremental and self.index.known_count(suburb) > 0
+        if incremental and self.full_crawl_due(suburb):
+            logger.info(f"{suburb} 距上次完整遍历已超过 {self.full_interval / 3600:.0f} 小时，本次完整遍历")
+            incremental = False
+        sort = NEWEST_FIRST if incremental else None
+        summary = {
+            'suburb': suburb, 'incremental': incremental, 'pages': 0, 'errors': 0,
+            'new': 0, 'changed': 0, 'unchanged': 0, 'duplicates': 0, 'stop_reason': 'max_pages',
+            'listings': []
+        }
+        seen = set()
+        next_page = 1
+
+        while next_page <= self.max_pages:
+            pages = range(next_page, min(next_page + self.window, self.max_pages + 1))
+            next_page = pages[-1] + 1
+            outcomes = await self.service.scrape_many([
+                (suburb, page_number, build_search_url(suburb, page_number, postcode, sort))
+                for page_number in pages
+            ])
+
+            stop_reason = None
+            # 按页码顺序处理，遇到终止条件时忽略同批中更靠后的页
+            for outcome in outcomes:
+                summary['pages'] += 1
+                if outcome['error']:
+                    summary['errors'] += 1
+                    continue
+                if not outcome['results']:
+                    stop_reason = 'end'
+                    break
+                changed = self._process_page(suburb, outcome['results'], seen, summary)
+                if incremental and not changed:
+                    stop_reason = 'unchanged'
+                    break
+
+            if stop_reason:
+                summary['stop_reason'] = stop_reason
+                break
+            if all(outcome['error'] for outcome in outcomes):
+                summary['stop_reason'] = 'errors'
+                break
+
+        # 遍历到最后一页（或页数上限）且没有失败页才算一次完整遍历；有失败页时不记录，
+        # 下次爬取仍为完整遍历，失败页上的房源不会被拖到下一个周期才检查
+        if not incremental and summary['stop_reason'] in ('end', 'max_pages') and not summary['errors']:
+            self.index.mark_full_crawl(suburb)
+        summary['elapsed'] = round(time.perf_counter() - start_time, 3)
+        logger.info(f"{suburb} 爬取完成：{summary['pages']}页，新增 {summary['new']}，变化 {summary['changed']}，"
+                    f"未变 {summary['unchanged']}，停止原因 {summary['stop_reason']}")
+        return summary
+
+    def _process_page(self, suburb: str, results: List[Dict], seen: set, summary: Dict) -> int:
+        """去重并写入索引，返回本页新增和变化的房源数"""
+        listings = []
+        for result in results:
+            key = listing_key(result)
+            if key is None or key in seen:
+                summary['duplicates'] += 1
+                continue
+            seen.add(key)
+            listing = dict(result, key=key, suburb=suburb)
+            listing['url'] = urljoin(SITE_ROOT, result['link']) if result.get('link') else None
+            listings.append(listing)
+
+        count = 0
+        for listing, status in zip(listings, self.index.record(suburb, listings)):
+            summary[status] += 1
+            if status != 'unchanged':
+                listing['status'] = status
+                summary['listings'].append(listing)
+                count += 1
+        return count
+
+    async def crawl(self, suburbs: List[str]) -> List[Dict]:
+        """并发爬取多个区域，页面总并发由 ScraperService 的工作协程数限制"""
+        return await asyncio.gather(*(self.crawl_suburb(suburb) for suburb in suburbs))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='多区域翻页爬取房产列表，增量去重')
+    parser.add_argument('suburbs', nargs='+', help='区域名称，可带邮编（例如："Point Cook 3030"），可指定多个')
+    parser.add_argument('--max-pages', type=int, default=50, help='每个区域最多抓取的列表页数（默认50）')
+    parser.add_argument('--parallel', type=int, default=4, help='并发页面数（默认4）')
+    parser.add_argument('--contexts', type=int, default=2, help='浏览器上下文数（默认2）')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help=f'已见房源索引路径（默认{DEFAULT_DB_PATH}）')
+    parser.add_argument('--full', action='store_true', help='完整遍历所有页，不因整页无变化提前停止')
+    parser.add_argument('--full-interval-days', type=float, default=DEFAULT_FULL_INTERVAL / 86400,
+                        help=f'距上次完整遍历超过该天数时自动完整遍历（默认{DEFAULT_FULL_INTERVAL // 86400}，0表示不自动）')
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH,
+                        help=f'新增和变化的房源写入的房源存储（默认{DEFAULT_STORE_PATH}）')
+    parser.add_argument('--no-store', action='store_true', help='不写入房源存储')
+    parser.add_argument('-o', '--output', help='将新增和变化的房源以JSONL格式追加写入文件')
+    parser.add_argument('--headful', action='store_true', help='显示浏览器窗口，便于调试')
+    parser.add_argument('--full-load', action='store_true', help='加载全部资源并等待networkidle（旧行为）')
+    args = parser.parse_args()
+
+    index = ListingIndex(args.db)
+    try:
+        async with ScraperService(parallelism=args.parallel, contexts=args.contexts, headless=not args.headful,
+                                  fast_load=not args.full_load,
+                                  allowed_resources=DEFAULT_ALLOWED_RESOURCES) as service:
+            crawler = Crawler(service, index, max_pages=args.max_pages, incremental=not args.full,
+                              full_interval=args.full_interval_days * 86400)
+            summaries = await crawler.crawl(args.suburbs)
+    finally:
+        index.close()
+
+    for summary in summaries:
+        print(f"\n{summary['suburb']}：{summary['pages']}页（{summary['elapsed']}秒），新增 {summary['new']}，"
+              f"变化 {summary['changed']}，未变 {summary['unchanged']}，重复 {summary['duplicates']}，"
+              f"失败页 {summary['errors']}，停止原因 {summary['stop_reason']}")
+        if summary['listings']:
+            display_results(summary['listings'])
+
+    if not args.no_store:
+        store = ListingStore(args.store)
+        count = sum(store.upsert(summary['listings']) for summary in summaries)
+        print(f"已写入 {count} 条房源到 {args.store}")
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            for summary in summaries:
+                for listing in summary['listings']:
+                    f.write(json.dumps(listing, ensure_ascii=False) + '\n')
+        print(f"新增和变化的房源已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
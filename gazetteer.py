@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""维州区域/邮编索引：精确查找、前缀补全、模糊匹配和邮编解析
+
+数据来自 data/vic_suburbs.csv（suburb,postcode 两列，同一区域有多个邮编时分多行），收录维州全部地区（locality）：
+墨尔本都市区及近年新设立的区域排在前面，其余取自 GeoNames 邮编数据（CC BY 4.0），不含邮政信箱专用邮编。
+区域名的规范形式为小写全名（如 "point cook"），用作报告缓存键，
+因此拼写错误、别名和带邮编的输入都会归并到同一个键。
+
+用法：
+    python gazetteer.py "point cok"
+    python gazetteer.py --suggest "hopp"
+"""
+import argparse
+import bisect
+import csv
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'vic_suburbs.csv')
+
+# 常见的整词别名
+ALIASES = {
+    'cbd': 'melbourne',
+    'melbourne cbd': 'melbourne',
+    'city': 'melbourne',
+    'melbourne city': 'melbourne',
+}
+
+# 缩写展开为数据文件中的写法
+WORD_ALIASES = {
+    'saint': 'st',
+    'mt': 'mount',
+    'nth': 'north',
+    'sth': 'south',
+    'sthn': 'south',
+    'e': 'east',
+    'w': 'west',
+}
+
+MAX_NODE_SUGGESTIONS = 20  # 前缀树每个节点保留的候选数
+FUZZY_THRESHOLD = 0.5  # 自动补全中模糊候选的三元组相似度下限
+CORRECTION_CANDIDATE_THRESHOLD = 0.3  # 自动纠错时先按三元组相似度取候选，再检查编辑距离
+
+POSTCODE_PATTERN = re.compile(r'\b(\d{4})\b')
+
+
+def normalize(text: str) -> str:
+    """小写、去标点、合并空白并展开常见缩写"""
+    words = re.sub(r"[^\w\s]", ' ', (text or '').lower()).split()
+    return ' '.join(WORD_ALIASES.get(word, word) for word in words)
+
+
+def split_postcode(text: str) -> Tuple[str, Optional[str]]:
+    """把输入拆分为 (规范化区域名, 邮编)，如 "Point Cook, VIC 3030" -> ("point cook", "3030")"""
+    match = POSTCODE_PATTERN.search(text or '')
+    postcode = match.group(1) if match else None
+    name = normalize(POSTCODE_PATTERN.sub(' ', text or ''))
+    # 去掉地址中常见的州名后缀
+    name = re.sub(r'\b(vic|victoria)$', '', name).strip()
+    return name, postcode
+
+
+def max_corrections(length: int) -> int:
+    """自动纠错允许的编辑距离：短名称不纠错，9个字符以上允许两处错误
+
+    相似度高不等于拼写错误：数据中没有的真实区域常与另一个区域相近（Bannockburn 与 Blackburn），
+    只有编辑距离很小时才视为拼错，否则宁可不纠正。
+    """
+    if length < 4:
+        return 0
+    return 1 if length <= 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein 距离（相邻字符交换算一次编辑），超过 limit 时提前返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """内存中的区域索引
+
+    - 精确查找：规范名 -> 条目 的字典，O(1)
+    - 前缀补全：按字符建立的前缀树，每个节点预先保存排好序的候选，查询只需沿输入走一遍；
+      区域名中每个单词的开头都会插入，"cook" 也能补全出 "Point Cook"
+    - 模糊匹配：三元组倒排索引，按 Dice 相似度排序，用于纠正拼写错误
+    - 邮编解析：邮编 -> 区域列表，数据文件中排在前面的区域优先
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]]):
+        self._names: List[str] = []
+        self._keys: List[str] = []
+        self._postcodes: List[List[str]] = []
+        self._by_key: Dict[str, int] = {}
+        self._by_postcode: Dict[str, List[int]] = defaultdict(list)
+        self._trie: Dict = {}
+        self._trigrams: Dict[str, List[int]] = defaultdict(list)
+        self._gram_counts: List[int] = []
+
+        for name, postcode in entries:
+            key = normalize(name)
+            if not key:
+                continue
+            index = self._by_key.get(key)
+            if index is None:
+                index = len(self._keys)
+                self._by_key[key] = index
+                self._names.append(name.strip())
+                self._keys.append(key)
+                self._postcodes.append([])
+                grams = trigrams(key)
+                self._gram_counts.append(len(grams))
+                for gram in grams:
+                    self._trigrams[gram].append(index)
+                self._insert(key, index)
+            if postcode and postcode not in self._postcodes[index]:
+                self._postcodes[index].append(postcode)
+                self._by_postcode[postcode].append(index)
+
+        self._sorted_postcodes = sorted(self._by_postcode)
+        self._finalize(self._trie)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_DATA_FILE) -> 'Gazetteer':
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            return cls((row['suburb'], row['postcode'].strip()) for row in csv.DictReader(f))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _insert(self, key: str, index: int):
+        starts = [0] + [m.end() for m in re.finditer(r' ', key)]
+        for start in starts:
+            # 整名前缀优先于词首前缀，其次名称越短越靠前
+            rank = (start > 0, len(key), key)
+            node = self._trie
+            for char in key[start:]:
+                node = node.setdefault(char, {})
+                node.setdefault('', []).append((rank, index))
+
+    def _finalize(self, node: Dict):
+        for char, child in node.items():
+            if char == '':
+                continue
+            candidates = sorted(child[''])
+            seen = set()
+            child[''] = []
+            for _, index in candidates:
+                if index not in seen:
+                    seen.add(index)
+                    child[''].append(index)
+                    if len(child['']) >= MAX_NODE_SUGGESTIONS:
+                        break
+            self._finalize(child)
+
+    def entry(self, index: int) -> Dict:
+        return {'suburb': self._names[index], 'key': self._keys[index], 'postcodes': list(self._postcodes[index])}
+
+    def lookup(self, name: str) -> Optional[Dict]:
+        """精确查找，返回条目或None"""
+        key = normalize(name)
+        index = self._by_key.get(ALIASES.get(key, key))
+        return self.entry(index) if index is not None else None
+
+    def suburbs_for_postcode(self, postcode: str) -> List[Dict]:
+        return [self.entry(index) for index in self._by_postcode.get(postcode, [])]
+
+    def prefix(self, text: str, limit: int = 10) -> List[int]:
+        node = self._trie
+        for char in normalize(text):
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get('', [])[:limit]
+
+    def fuzzy(self, text: str, limit: int = 10, threshold: float = FUZZY_THRESHOLD) -> List[Tuple[float, int]]:
+        """按三元组 Dice 相似度返回 (得分, 条目) 列表"""
+        key = normalize(text)
+        grams = trigrams(key)
+        shared = defaultdict(int)
+        for gram in grams:
+            for index in self._trigrams.get(gram, ()):
+                shared[index] += 1
+        scored = []
+        for index, count in shared.items():
+            score = 2 * count / (len(grams) + self._gram_counts[index])
+            if score >= threshold:
+                scored.append((round(score, 3), index))
+        scored.sort(key=lambda item: (-item[0], len(self._keys[item[1]])))
+        return scored[:limit]
+
+    def resolve(self, text: str) -> Optional[str]:
+        """把用户输入规范化为区域键，无法识别时返回None
+
+        依次尝试：别名/精确匹配、仅邮编（取该邮编的首个区域）、拼写纠错（编辑距离不超过 max_corrections，
+        距离最小者优先，有邮编时优先同邮编的区域）。相近但差别较大的输入不纠正，返回None。
+        """
+        name, postcode = split_postcode(text)
+        name = ALIASES.get(name, name)
+        if name in self._by_key:
+            return name
+        if not name:
+            indexes = self._by_postcode.get(postcode) if postcode else None
+            return self._keys[indexes[0]] if indexes else None
+        limit = max_corrections(len(name))
+        if not limit:
+            return None
+        candidates = []
+        for score, index in self.fuzzy(name, limit=10, threshold=CORRECTION_CANDIDATE_THRESHOLD):
+            distance = edit_distance(name, self._keys[index], limit)
+            if distance <= limit:
+                candidates.append((postcode is not None and postcode not in self._postcodes[index],
+                                   distance, -score, index))
+        return self._keys[min(candidates)[3]] if candidates else None
+
+    def suggest(self, text: str, limit: int = 10) -> List[Dict]:
+        """自动补全：邮编前缀、区域名前缀，不足时用模糊匹配补充"""
+        name, postcode = split_postcode(text)
+        digits = normalize(text)
+        indexes = []
+        if digits.isdigit():
+            # 只输入了邮编（或邮编前缀）
+            start = bisect.bisect_left(self._sorted_postcodes, digits)
+            for code in self._sorted_postcodes[start:]:
+                if not code.startswith(digits) or len(indexes) >= limit:
+                    break
+                indexes.extend(self._by_postcode[code])
+        elif name:
+            indexes = list(self.prefix(ALIASES.get(name, name), MAX_NODE_SUGGESTIONS))
+            if len(indexes) < limit and len(name) >= 3:
+                indexes += [index for _, index in self.fuzzy(name, limit) if index not in indexes]
+            if postcode:
+                indexes = [index for index in indexes if postcode in self._postcodes[index]] or indexes
+
+        suggestions = []
+        for index in indexes[:limit]:
+            for code in self._postcodes[index] or [None]:
+                if postcode and code != postcode and postcode in self._postcodes[index]:
+                    continue
+                suggestions.append({'suburb': self._names[index], 'postcode': code, 'key': self._keys[index]})
+        return suggestions[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='维州区域/邮编索引')
+    parser.add_argument('text', help='区域名、邮编或二者组合')
+    parser.add_argument('--suggest', action='store_true', help='输出自动补全候选')
+    parser.add_argument('--data', default=DEFAULT_DATA_FILE, help='区域数据文件（CSV）')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    gazetteer = Gazetteer.load(args.data)
+    load_ms = (time.perf_counter() - start_time) * 1000
+
+    start_time = time.perf_counter()
+    result = gazetteer.suggest(args.text) if args.suggest else gazetteer.resolve(args.text)
+    query_ms = (time.perf_counter() - start_time) * 1000
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(f"加载 {len(gazetteer)} 个区域用时 {load_ms:.1f}ms，查询用时 {query_ms:.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
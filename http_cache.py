@@ -0,0 +1,206 @@
+"""响应压缩、强ETag与条件请求，Flask 与 ASGI 服务共用
+
+- negotiate_encoding：按 Accept-Encoding 选择 br（安装了 brotli 时）、gzip 或不压缩
+- 强ETag按响应体内容计算；不同压缩编码的字节不同，ETag 加上编码后缀（如 "abc-gzip"），比较时忽略后缀
+- 压缩结果按 (ETag, 编码) 缓存在进程内LRU中，同一份报告只压缩一次
+- StaticAssets：静态文件的内容哈希URL（/static/style.css?v=<哈希>），版本号匹配的请求可被浏览器永久缓存
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只提供 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MIN_COMPRESS_BYTES = 512  # 更小的响应压缩后节省的字节抵不过开销
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # 11 压缩率最高但慢上百倍，5 与 gzip 速度相当、体积更小
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """按客户端的 Accept-Encoding（含q值）选择压缩编码，同等优先时 br 优于 gzip"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    wildcard = accepted.get('*', 0.0)
+    candidates = (['br'] if brotli else []) + ['gzip']
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime 固定为0，相同内容的压缩结果逐字节相同
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def make_etag(body: bytes) -> str:
+    """强ETag：响应体的SHA-256前20位"""
+    return '"' + hashlib.sha256(body).hexdigest()[:20] + '"'
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    return etag if not encoding else f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 中是否有与 etag 对应同一内容的标签（忽略弱标记和编码后缀）"""
+    if not if_none_match:
+        return False
+    base = etag.strip('"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate == base or candidate.rsplit('-', 1)[0] == base:
+            return True
+    return False
+
+
+class CompressionCache:
+    """压缩结果的进程内LRU，键为 (ETag, 编码)"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get(self, body: bytes, etag: str, encoding: str) -> bytes:
+        key = (etag, encoding)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return data
+            self._stats['misses'] += 1
+        data = compress(body, encoding)
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+compression_cache = CompressionCache()
+
+
+def build_response(body: bytes, content_type: str, accept_encoding: str = '', if_none_match: Optional[str] = None,
+                   conditional: bool = True, cache_control: str = 'no-cache',
+                   etag: Optional[str] = None) -> Tuple[int, Dict[str, str], bytes]:
+    """生成带ETag、按需压缩的响应，返回 (状态码, 响应头, 响应体)
+
+    conditional 为True（GET/HEAD）且 If-None-Match 命中时返回304和空响应体。
+    """
+    etag = etag or make_etag(body)
+    encoding = None
+    if len(body) >= MIN_COMPRESS_BYTES and content_type.startswith(COMPRESSIBLE_TYPES):
+        encoding = negotiate_encoding(accept_encoding)
+    headers = {
+        'ETag': encoded_etag(etag, encoding),
+        'Cache-Control': cache_control,
+        'Vary': 'Accept-Encoding',
+    }
+    if conditional and etag_matches(if_none_match, etag):
+        return 304, headers, b''
+    headers['Content-Type'] = content_type
+    if encoding:
+        body = compression_cache.get(body, etag, encoding)
+        headers['Content-Encoding'] = encoding
+    return 200, headers, body
+
+
+class StaticAssets:
+    """静态文件服务：内容哈希版本号、预压缩和条件请求
+
+    文件内容按修改时间缓存在内存中，开发时修改文件后版本号随之变化，页面引用的URL也随之更新。
+    """
+
+    def __init__(self, directory: str, url_prefix: str = '/static'):
+        self.directory = os.path.abspath(directory)
+        self.url_prefix = url_prefix
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, filename: str) -> Optional[str]:
+        path = os.path.abspath(os.path.join(self.directory, filename))
+        if not path.startswith(self.directory + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def _load(self, filename: str) -> Optional[Dict]:
+        path = self._resolve(filename)
+        if path is None:
+            return None
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._files.get(path)
+        if entry is not None and entry['mtime'] == mtime:
+            return entry
+        with open(path, 'rb') as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        etag = make_etag(body)
+        entry = {'body': body, 'mtime': mtime, 'etag': etag, 'version': etag.strip('"')[:12],
+                 'content_type': content_type}
+        with self._lock:
+            self._files[path] = entry
+        return entry
+
+    def url(self, filename: str) -> str:
+        """带内容哈希的URL；文件不存在时返回不带版本号的URL"""
+        entry = self._load(filename)
+        url = f"{self.url_prefix}/{filename}"
+        return f"{url}?v={entry['version']}" if entry else url
+
+    def response(self, filename: str, version: Optional[str] = None, accept_encoding: str = '',
+                 if_none_match: Optional[str] = None) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        """返回 (状态码, 响应头, 响应体)，文件不存在时返回None
+
+        版本号与当前内容一致时允许浏览器永久缓存；没有版本号或版本号过期时每次重新验证。
+        """
+        entry = self._load(filename)
+        if entry is None:
+            return None
+        cache_control = IMMUTABLE_CACHE_CONTROL if version == entry['version'] else 'no-cache'
+        return build_response(entry['body'], entry['content_type'], accept_encoding, if_none_match,
+                              cache_control=cache_control, etag=entry['etag'])
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""房源数据存储：把爬取到的价格、地址、详情文本解析为类型化的列，存入带索引的SQLite表，
+支持按区域、卧室数等维度快速计算价格中位数，并为分析报告提供本地数据摘要
+
+用法：
+    python listing_store.py import changes.jsonl        # 导入 crawler.py 输出的JSONL
+    python listing_store.py median --by suburb
+    python listing_store.py median --by beds --suburb "point cook"
+    python listing_store.py summary "point cook"
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join('cache', 'listing_store.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    key TEXT PRIMARY KEY,
+    suburb TEXT NOT NULL,
+    postcode TEXT,
+    address TEXT,
+    property_type TEXT,
+    price_min INTEGER,
+    price_max INTEGER,
+    price INTEGER,
+    beds INTEGER,
+    baths INTEGER,
+    cars INTEGER,
+    url TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_listings_suburb_price ON listings (suburb, price);
+CREATE INDEX IF NOT EXISTS idx_listings_price ON listings (price);
+CREATE INDEX IF NOT EXISTS idx_listings_beds_price ON listings (beds, price);
+CREATE INDEX IF NOT EXISTS idx_listings_suburb_beds_price ON listings (suburb, beds, price);
+"""
+
+# 可用于分组统计的列
+GROUP_COLUMNS = ('suburb', 'postcode', 'beds', 'baths', 'cars', 'property_type')
+
+# 金额：数字不能截断（"1.2m" 不会只匹配 "1"），单位紧跟数字且单位之后不能再接字母，
+# 避免 "$650,000 min"、"$550,000 Kitchen" 中的 m/k 被当作单位
+PRICE_NUMBER = r'(\d+(?:[.,]\d+)*)(?![.,]?\d)'
+PRICE_UNIT = r'(k|m|\s*mil(?:lion)?)?(?![a-z])'
+# 价格或价格区间，区间的第二个数字可省略 "$"，如 "$700k-750k"、"$850,000 to $900,000"
+PRICE_PATTERN = re.compile(
+    rf'\$\s*{PRICE_NUMBER}{PRICE_UNIT}(?:\s*(?:-|–|to)\s*\$?\s*{PRICE_NUMBER}{PRICE_UNIT})?',
+    re.IGNORECASE
+)
+POSTCODE_PATTERN = re.compile(r'\b(3\d{3})\b')  # 维州邮编
+FEATURE_PATTERNS = {
+    'beds': re.compile(r'(\d+)\s*(?:beds?|bedrooms?|br)\b', re.IGNORECASE),
+    'baths': re.compile(r'(\d+)\s*(?:baths?|bathrooms?|ba)\b', re.IGNORECASE),
+    'cars': re.compile(r'(\d+)\s*(?:cars?|car ?spaces?|parking|garages?)\b', re.IGNORECASE),
+}
+PROPERTY_TYPES = ('townhouse', 'house', 'apartment', 'unit', 'villa', 'land', 'acreage', 'retirement')
+
+
+def price_value(number: str, unit: str) -> Optional[float]:
+    """金额数字加单位（k、m、million）换算为元，数字为空或无法解析时返回None"""
+    try:
+        value = float(number.replace(',', ''))
+    except ValueError:
+        return None
+    unit = unit.strip().lower()
+    if unit:
+        value *= 1000 if unit == 'k' else 1000000
+    return value
+
+
+def parse_price(text: str) -> Tuple[Optional[int], Optional[int]]:
+    """解析价格文本为 (最低价, 最高价)，例如 "$850,000 - $900,000"、"$700k-750k"、"$1.2m"、"Offers over $600k"
+
+    无法解析（如 "Contact agent"）时返回 (None, None)；单一价格时最低价与最高价相同。
+    """
+    values = []
+    for low, low_unit, high, high_unit in PRICE_PATTERN.findall(text or ''):
+        low_value, high_value = price_value(low, low_unit), price_value(high, high_unit)
+        # "$700-750k" 中第一个数字沿用第二个数字的单位
+        if high_value and not low_unit.strip() and high_unit.strip() and low_value is not None and low_value < 1000:
+            low_value = price_value(low, high_unit)
+        for value in (low_value, high_value):
+            # 小于1万的多为周租金或误识别，不计入售价
+            if value is not None and value >= 10000:
+                values.append(int(value))
+    if not values:
+        return None, None
+    return min(values), max(values)
+
+
+def parse_features(text: str) -> Dict[str, Optional[int]]:
+    """从详情文本中解析卧室、浴室、车位数
+
+    支持 "4 bed 2 bath 2 car" 形式；没有单位时按列表卡片的顺序取前三个数字（卧室 浴室 车位）。
+    """
+    text = text or ''
+    features = {}
+    for name, pattern in FEATURE_PATTERNS.items():
+        match = pattern.search(text)
+        features[name] = int(match.group(1)) if match else None
+    if all(value is None for value in features.values()):
+        numbers = re.findall(r'\b(\d{1,2})\b', text)[:3]
+        for name, number in zip(('beds', 'baths', 'cars'), numbers):
+            features[name] = int(number)
+    return features
+
+
+def parse_property_type(text: str) -> Optional[str]:
+    lowered = (text or '').lower()
+    for property_type in PROPERTY_TYPES:
+        if property_type in lowered:
+            return property_type
+    return None
+
+
+def parse_postcode(*texts: str) -> Optional[str]:
+    for text in texts:
+        match = POSTCODE_PATTERN.search(text or '')
+        if match:
+            return match.group(1)
+    return None
+
+
+def normalize_suburb(suburb: str) -> str:
+    """区域名去掉邮编并转小写，与 app.standardize_suburb 的输出一致"""
+    return ' '.join(re.sub(r'\b\d{4}\b', '', suburb or '').lower().split())
+
+
+def parse_listing(listing: Dict) -> Dict:
+    """把爬虫输出的房源（price/address/details/link 文本字段）解析为类型化的行"""
+    price_min, price_max = parse_price(listing.get('price'))
+    row = {
+        'key': listing.get('key') or listing.get('url') or listing.get('link') or listing.get('address'),
+        'suburb': normalize_suburb(listing.get('suburb', '')),
+        'postcode': parse_postcode(listing.get('address'), listing.get('suburb')),
+        'address': listing.get('address'),
+        'property_type': parse_property_type(listing.get('details')),
+        'price_min': price_min,
+        'price_max': price_max,
+        'price': (price_min + price_max) // 2 if price_min is not None else None,
+        'url': listing.get('url') or listing.get('link'),
+    }
+    row.update(parse_features(listing.get('details')))
+    return row
+
+
+class ListingStore:
+    """类型化的房源存储（SQLite，WAL模式）
+
+    价格区间取中点作为 price 列；(suburb, price)、(beds, price) 与 (suburb, beds, price)
+    上的索引使按区域过滤和按价格排序的中位数计算无需额外排序。
+    """
+
+    COLUMNS = ('key', 'suburb', 'postcode', 'address', 'property_type', 'price_min', 'price_max', 'price',
+               'beds', 'baths', 'cars', 'url', 'updated_at')
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def upsert(self, listings: Iterable[Dict]) -> int:
+        """解析并写入房源（按键覆盖），返回写入的行数"""
+        now = time.time()
+        rows = []
+        for listing in listings:
+            row = parse_listing(listing)
+            if not row['key'] or not row['suburb']:
+                continue
+            row['updated_at'] = now
+            rows.append(tuple(row[column] for column in self.COLUMNS))
+        if not rows:
+            return 0
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO listings ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                rows
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return len(rows)
+
+    def count(self, suburb: Optional[str] = None) -> int:
+        if suburb:
+            return self._connect().execute(
+                'SELECT COUNT(*) FROM listings WHERE suburb = ?', (normalize_suburb(suburb),)
+            ).fetchone()[0]
+        return self._connect().execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+
+    def median_price(self, by: str = 'suburb', suburb: Optional[str] = None) -> List[Dict]:
+        """按 by 列分组计算价格中位数、四分位数和数量，可限定区域
+
+        先用一次分组查询得到每组数量，再在 (分组列, price) 覆盖索引上按偏移直接取第k个价格，
+        无需把整组数据读出排序；30万条房源按区域或卧室数分组约需几十毫秒。
+        """
+        if by not in GROUP_COLUMNS:
+            raise ValueError(f"不支持的分组列: {by}")
+        where = 'price IS NOT NULL'
+        params = ()
+        if suburb:
+            where += ' AND suburb = ?'
+            params = (normalize_suburb(suburb),)
+        conn = self._connect()
+        groups = conn.execute(
+            f'SELECT {by}, COUNT(*), MIN(price), MAX(price) FROM listings WHERE {where} GROUP BY {by} ORDER BY {by}',
+            params
+        ).fetchall()
+
+        def nth(group, k):
+            return conn.execute(
+                f'SELECT price FROM listings WHERE {where} AND {by} IS ? ORDER BY price LIMIT 1 OFFSET ?',
+                params + (group, k)
+            ).fetchone()[0]
+
+        rows = []
+        for group, count, low, high in groups:
+            rows.append({
+                by: group,
+                'count': count,
+                'median': (nth(group, (count - 1) // 2) + nth(group, count // 2)) // 2,
+                'p25': nth(group, (count + 3) // 4 - 1),
+                'p75': nth(group, (3 * count + 3) // 4 - 1),
+                'min': low,
+                'max': high
+            })
+        return rows
+
+    def summary(self, suburb: str) -> Optional[Dict]:
+        """区域数据摘要：房源数、整体价格中位数和按卧室数的中位数；无数据时返回None"""
+        overall = self.median_price('suburb', suburb)
+        if not overall:
+            return None
+        return {
+            'suburb': normalize_suburb(suburb),
+            'listings': self.count(suburb),
+            'price': overall[0],
+            'by_beds': [row for row in self.median_price('beds', suburb) if row['beds'] is not None]
+        }
+
+    def prompt_context(self, suburb: str) -> Optional[str]:
+        """把区域数据摘要格式化为可附加到分析提示中的文本"""
+        summary = self.summary(suburb)
+        if not summary:
+            return None
+        price = summary['price']
+        lines = [
+            f"本地房源数据（{summary['listings']}套在售房源，其中{price['count']}套有标价）：",
+            f"- 价格中位数 ${price['median']:,}，四分位区间 ${price['p25']:,} - ${price['p75']:,}"
+        ]
+        for row in summary['by_beds']:
+            lines.append(f"- {row['beds']}卧室：中位数 ${row['median']:,}（{row['count']}套）")
+        return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='房源数据存储')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help='导入JSONL格式的房源（crawler.py -o 的输出）')
+    import_parser.add_argument('files', nargs='+')
+    median_parser = subparsers.add_parser('median', help='价格中位数')
+    median_parser.add_argument('--by', choices=GROUP_COLUMNS, default='suburb')
+    median_parser.add_argument('--suburb', help='限定区域')
+    summary_parser = subparsers.add_parser('summary', help='区域数据摘要')
+    summary_parser.add_argument('suburb')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help=f'数据库路径（默认{DEFAULT_DB_PATH}）')
+    args = parser.parse_args()
+
+    store = ListingStore(args.db)
+    if args.command == 'import':
+        total = 0
+        for path in args.files:
+            with open(path, 'r', encoding='utf-8') as f:
+                total += store.upsert(json.loads(line) for line in f if line.strip())
+        print(f"已导入 {total} 条房源到 {args.db}")
+    elif args.command == 'median':
+        start_time = time.perf_counter()
+        rows = store.median_price(args.by, args.suburb)
+        print(json.dumps(rows, indent=2, ensure_ascii=False))
+        print(f"用时 {time.perf_counter() - start_time:.3f}秒")
+    else:
+        print(store.prompt_context(args.suburb) or '没有该区域的房源数据')
+
+
+if __name__ == '__main__':
+    main()
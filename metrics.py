@@ -0,0 +1,304 @@
+"""进程内运行指标和请求追踪
+
+- Counter / Gauge / Histogram：带标签的计数器、仪表和直方图，以 Prometheus 文本格式输出（/metrics）
+- 采集器：抓取 /metrics 时才调用的回调，用于导出缓存命中率等已有统计，不增加热路径开销
+- trace ID：每个请求一个ID，写入 contextvars，日志格式中的 %(trace_id)s 自动带上；
+  提交到线程池的任务用 bind_context 包装后同样可以取到
+
+指标只在本进程内累计；gunicorn 多 worker 部署时每个 worker 各自输出，由 Prometheus 按实例汇总。
+每次记录只是一次加锁的字典更新（直方图多一次二分查找），约1微秒；每个HTTP请求的埋点合计约10微秒
+（benchmarks/bench_metrics.py），相对请求本身可以忽略，可在生产环境常开。
+"""
+import bisect
+import contextvars
+import functools
+import logging
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 默认的耗时分桶（秒），覆盖缓存命中的毫秒级到OpenAI生成的一分钟级
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+TRACE_HEADER = 'X-Trace-Id'
+TRACE_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+trace_id_var = contextvars.ContextVar('trace_id', default='-')
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Registry:
+    """指标注册表，render() 输出所有指标和采集器的当前值"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict, float]]]]]):
+        """注册采集器：返回 (指标名, 类型, 说明, [(标签, 值)]) 列表的回调，抓取时调用"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logging.getLogger(__name__).error(f"指标采集失败: {str(e)}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} "
+                                 f"{_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # 标签值按 labelnames 顺序取出作为键（C实现的 itemgetter，比逐个取值快数倍）
+        if len(self.labelnames) > 1:
+            self._getter = itemgetter(*self.labelnames)
+        elif self.labelnames:
+            name = self.labelnames[0]
+            self._getter = lambda labels: (labels[name],)
+        else:
+            self._getter = lambda labels: ()
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        """标签值应为字符串（输出时才转换，2xx 等状态码请先转为字符串，避免同一序列出现两种键）"""
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return self._getter(labels)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS, registry: Optional[Registry] = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各分桶计数（非累计，最后一个为 +Inf）, 总和, 次数]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        lines = self._header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# 应用使用的指标
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP请求数', ('route', 'method', 'status'))
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'HTTP请求耗时（流式响应为完整响应时长）', ('route', 'method'))
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', '正在处理的HTTP请求数', ('route',))
+
+UPSTREAM_REQUESTS = Counter('upstream_requests_total', '上游调用次数（OpenAI、DuckDuckGo、Playwright）',
+                            ('upstream', 'operation', 'outcome'))
+UPSTREAM_LATENCY = Histogram('upstream_request_duration_seconds', '上游调用耗时', ('upstream', 'operation'))
+UPSTREAM_IN_FLIGHT = Gauge('upstream_requests_in_flight', '进行中的上游调用数', ('upstream',))
+UPSTREAM_RETRIES = Counter('upstream_retries_total', '上游限流后的重试次数', ('upstream',))
+
+RATE_LIMIT_WAITING = Gauge('rate_limit_waiting', '正在等待限流配额的调用数（本进程的排队深度）', ('upstream',))
+RATE_LIMIT_WAIT = Histogram('rate_limit_wait_seconds', '等待限流配额的时长', ('upstream',),
+                            buckets=(0, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+OPENAI_TOKENS = Counter('openai_tokens_total', 'OpenAI token用量', ('kind',))
+OPENAI_COST = Counter('openai_cost_dollars_total', 'OpenAI费用（美元）')
+CACHE_REQUESTS = Counter('cache_requests_total', '缓存查询次数', ('cache', 'result'))
+
+
+@contextmanager
+def track_upstream(upstream: str, operation: str):
+    """记录一次上游调用的耗时、结果和并发数；异常原样抛出并计为 error"""
+    UPSTREAM_IN_FLIGHT.inc(upstream=upstream)
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - start, upstream=upstream, operation=operation)
+        UPSTREAM_REQUESTS.inc(upstream=upstream, operation=operation, outcome=outcome)
+        UPSTREAM_IN_FLIGHT.dec(upstream=upstream)
+
+
+def start_request(route: str) -> float:
+    HTTP_IN_FLIGHT.inc(route=route)
+    return time.perf_counter()
+
+
+def finish_request(route: str, method: str, status: int, started_at: float):
+    HTTP_LATENCY.observe(time.perf_counter() - started_at, route=route, method=method)
+    HTTP_REQUESTS.inc(route=route, method=method, status=str(status))
+    HTTP_IN_FLIGHT.dec(route=route)
+
+
+def stats_collector(name: str, documentation: str, get_stats: Callable[[], Optional[Dict]],
+                    counters: Iterable[str] = (), gauges: Iterable[str] = ()):
+    """把 stats() 返回的字典导出为 <name>_<字段>，counters 中的字段为计数器（加 _total），其余为仪表"""
+    counters = tuple(counters)
+    gauges = tuple(gauges)
+
+    def collect():
+        stats = get_stats()
+        if not stats:
+            return []
+        families = []
+        for field in counters:
+            if stats.get(field) is not None:
+                families.append((f"{name}_{field}_total", 'counter', f"{documentation}：{field}", [({}, stats[field])]))
+        for field in gauges:
+            if stats.get(field) is not None:
+                families.append((f"{name}_{field}", 'gauge', f"{documentation}：{field}", [({}, stats[field])]))
+        return families
+
+    return collect
+
+
+def new_trace_id(incoming: Optional[str] = None) -> str:
+    """设置当前请求的 trace ID：沿用上游传入的合法ID，否则生成新ID"""
+    trace_id = incoming if incoming and TRACE_ID_PATTERN.match(incoming) else uuid.uuid4().hex[:16]
+    trace_id_var.set(trace_id)
+    return trace_id
+
+
+def current_trace_id() -> str:
+    return trace_id_var.get()
+
+
+def bind_context(fn: Callable) -> Callable:
+    """在当前上下文的副本中执行 fn，使线程池中的任务也能取到 trace ID"""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def install_trace_logging():
+    """让所有日志记录带上 trace_id 属性（没有请求上下文时为 "-"），可在日志格式中使用 %(trace_id)s"""
+    base_factory = logging.getLogRecordFactory()
+    if getattr(base_factory, 'adds_trace_id', False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = base_factory(*args, **kwargs)
+        record.trace_id = trace_id_var.get()
+        return record
+
+    record_factory.adds_trace_id = True
+    logging.setLogRecordFactory(record_factory)
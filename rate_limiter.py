@@ -0,0 +1,319 @@
+"""上游调用限流：跨线程、跨进程共享的令牌桶，以及遇到限流时的退避重试
+
+- RateLimiter：每个上游一组令牌桶（OpenAI 同时限制每分钟请求数和每分钟token数），状态保存在
+  SQLite（WAL模式）中，同一台机器上的所有线程、gunicorn worker 和命令行工具共用配额。
+  取令牌采用预约方式：在一个短事务里补充令牌并直接预扣（余额可以为负），返回需要等待的秒数，
+  调用方睡眠后再发请求。等待中的调用按预约顺序依次放行，不会在令牌恢复的瞬间一起重试，
+  吞吐量稳定在配额上，而不是超限后集体报错。
+- call_with_backoff：遇到限流（429）时按带抖动的指数退避重试，优先遵循 Retry-After，
+  同时暂停该上游的令牌桶，让所有 worker 一起退让。
+"""
+import asyncio
+import functools
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from metrics import RATE_LIMIT_WAIT, RATE_LIMIT_WAITING, UPSTREAM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join('cache', 'rate_limits.db')
+
+# 默认配额（每分钟），应与账户实际的上游限额一致；DuckDuckGo 没有公开限额，过快会被暂时封禁
+DEFAULT_LIMITS = {
+    'openai': {'requests': 3500, 'tokens': 200000},
+    'ddgs': {'requests': 30},
+}
+
+# 令牌桶容量按多少秒的配额计算：允许短时突发，但不会一次用完整分钟的配额
+BURST_SECONDS = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class RateLimitTimeout(Exception):
+    """预计的排队时间超过调用方允许的上限；retry_after 为预计需要等待的秒数"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} 限流排队需要 {retry_after:.1f} 秒")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """判断是否为上游限流错误（OpenAI 429、DuckDuckGo 限流或本地限流排队超时）"""
+    if isinstance(error, RateLimitTimeout) or getattr(error, 'status_code', None) == 429:
+        return True
+    return type(error).__name__ in ('RateLimitError', 'RatelimitException')
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """读取错误中的 Retry-After（秒）：本地排队超时取预计等待时间，上游错误读响应头"""
+    if isinstance(error, RateLimitTimeout):
+        return error.retry_after
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(error: Exception, attempt: int, base_delay: float, max_delay: float) -> float:
+    """第 attempt 次重试前的等待秒数：有 Retry-After 时遵循它，否则为全抖动的指数退避"""
+    delay = retry_after_seconds(error)
+    if delay is None:
+        delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    return min(delay, max_delay)
+
+
+class RateLimiter:
+    """共享令牌桶限流器
+
+    limits 为 {上游: {'requests': 每分钟请求数, 'tokens': 每分钟token数}}，未配置的上游不限流
+    （limits 为空时所有调用都直接放行，不访问数据库）。
+
+    用法：
+        limiter.acquire('openai', tokens=1500)          # 等到配额可用
+        limiter.settle('openai', 1500, actual_tokens)   # 按实际用量退还或补扣token
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, limits: Optional[Dict[str, Dict[str, float]]] = None,
+                 burst_seconds: float = BURST_SECONDS):
+        self.db_path = db_path
+        self.limits = DEFAULT_LIMITS if limits is None else limits
+        # 桶名 -> (每秒补充速率, 容量)
+        self._buckets = {
+            f"{upstream}:{kind}": (per_minute / 60.0, max(1.0, per_minute / 60.0 * burst_seconds))
+            for upstream, kinds in self.limits.items()
+            for kind, per_minute in kinds.items() if per_minute
+        }
+        self._local = threading.local()
+        if self._buckets:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _amounts(self, upstream: str, requests: float, tokens: float) -> Dict[str, float]:
+        amounts = {f"{upstream}:requests": requests, f"{upstream}:tokens": tokens}
+        return {name: amount for name, amount in amounts.items() if amount and name in self._buckets}
+
+    def _update(self, amounts: Dict[str, float], now: float, max_wait: Optional[float] = None,
+                floor: Optional[float] = None) -> float:
+        """在一个事务中补充并扣减各桶的令牌，返回需要等待的秒数
+
+        floor 不为None时不扣减，而是把余额压到不高于 -速率×floor（暂停 floor 秒）。
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            levels = {}
+            wait = 0.0
+            for name, amount in amounts.items():
+                rate, capacity = self._buckets[name]
+                row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE name = ?', (name,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + rate * max(0.0, now - row[1]))
+                if floor is not None:
+                    levels[name] = min(tokens, -rate * floor)
+                else:
+                    wait = max(wait, (amount - tokens) / rate)
+                    levels[name] = tokens - amount
+            if max_wait is not None and wait > max_wait:
+                conn.execute('ROLLBACK')
+                return wait
+            conn.executemany('INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                             [(name, tokens, now) for name, tokens in levels.items()])
+            conn.execute('COMMIT')
+            return max(0.0, wait)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def reserve(self, upstream: str, requests: float = 1, tokens: float = 0,
+                max_wait: Optional[float] = None) -> float:
+        """预约配额并返回需要等待的秒数（不睡眠）
+
+        预计等待超过 max_wait 时不预约，抛出 RateLimitTimeout。数据库不可用时放行（不因限流组件故障
+        中断业务）。
+        """
+        amounts = self._amounts(upstream, requests, tokens)
+        if not amounts:
+            return 0.0
+        try:
+            wait = self._update(amounts, time.time(), max_wait)
+        except Exception as e:
+            logger.error(f"读写限流状态失败，本次不限流: {str(e)}")
+            return 0.0
+        if max_wait is not None and wait > max_wait:
+            raise RateLimitTimeout(upstream, wait)
+        return wait
+
+    def acquire(self, upstream: str, requests: float = 1, tokens: float = 0, max_wait: Optional[float] = None) -> float:
+        """等到配额可用，返回实际等待的秒数"""
+        if not self._amounts(upstream, requests, tokens):
+            return 0.0
+        wait = self.reserve(upstream, requests, tokens, max_wait)
+        RATE_LIMIT_WAIT.observe(wait, upstream=upstream)
+        if wait > 0:
+            RATE_LIMIT_WAITING.inc(upstream=upstream)
+            try:
+                time.sleep(wait)
+            finally:
+                RATE_LIMIT_WAITING.dec(upstream=upstream)
+        return wait
+
+    async def acquire_async(self, upstream: str, requests: float = 1, tokens: float = 0,
+                            max_wait: Optional[float] = None) -> float:
+        """acquire 的异步版本：数据库事务在线程池中执行，等待期间不占用事件循环"""
+        if not self._amounts(upstream, requests, tokens):
+            return 0.0
+        loop = asyncio.get_running_loop()
+        wait = await loop.run_in_executor(None, functools.partial(self.reserve, upstream, requests, tokens, max_wait))
+        RATE_LIMIT_WAIT.observe(wait, upstream=upstream)
+        if wait > 0:
+            RATE_LIMIT_WAITING.inc(upstream=upstream)
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                RATE_LIMIT_WAITING.dec(upstream=upstream)
+        return wait
+
+    def settle(self, upstream: str, reserved_tokens: float, actual_tokens: float):
+        """按实际用量结算预扣的token：多扣的退还，少扣的补扣（补扣不等待，由后续调用承担）"""
+        name = f"{upstream}:tokens"
+        difference = reserved_tokens - actual_tokens
+        if not difference or name not in self._buckets:
+            return
+        try:
+            self._update({name: -difference}, time.time())
+        except Exception as e:
+            logger.error(f"结算限流配额失败: {str(e)}")
+
+    def pause(self, upstream: str, seconds: float):
+        """上游返回限流时调用：该上游的所有桶在 seconds 秒内不再放行，所有 worker 一起退让"""
+        amounts = self._amounts(upstream, 1, 1)
+        if not amounts or seconds <= 0:
+            return
+        try:
+            self._update(amounts, time.time(), floor=seconds)
+        except Exception as e:
+            logger.error(f"暂停限流配额失败: {str(e)}")
+
+    async def pause_async(self, upstream: str, seconds: float):
+        """pause 的异步版本：数据库事务在线程池中执行，其他 worker 持有锁时不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.pause, upstream, seconds)
+
+    def snapshot(self) -> Dict[str, float]:
+        """各桶当前可用的令牌数（按当前时间补充后，负数表示已预约的积压）"""
+        if not self._buckets:
+            return {}
+        now = time.time()
+        try:
+            rows = self._connect().execute('SELECT name, tokens, updated_at FROM buckets').fetchall()
+        except Exception as e:
+            logger.error(f"读取限流状态失败: {str(e)}")
+            return {}
+        levels = {}
+        for name, tokens, updated_at in rows:
+            if name in self._buckets:
+                rate, capacity = self._buckets[name]
+                levels[name] = round(min(capacity, tokens + rate * max(0.0, now - updated_at)), 3)
+        return levels
+
+    def collect(self):
+        """/metrics 采集器：各桶可用令牌数和预约积压（秒）"""
+        levels = self.snapshot()
+        if not levels:
+            return []
+        available = []
+        backlog = []
+        for name, tokens in sorted(levels.items()):
+            upstream, _, kind = name.partition(':')
+            labels = {'upstream': upstream, 'kind': kind}
+            available.append((labels, tokens))
+            backlog.append((labels, round(max(0.0, -tokens) / self._buckets[name][0], 3)))
+        return [
+            ('rate_limit_tokens_available', 'gauge', '限流令牌桶当前可用量（所有worker共享）', available),
+            ('rate_limit_backlog_seconds', 'gauge', '已预约配额的积压时长（所有worker共享）', backlog),
+        ]
+
+
+def _should_retry(error: Exception, attempt: int, max_retries: int, retry_queue_timeout: bool) -> bool:
+    if attempt == max_retries or not is_rate_limit_error(error):
+        return False
+    return retry_queue_timeout or not isinstance(error, RateLimitTimeout)
+
+
+def call_with_backoff(fn: Callable, *args, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                      limiter: Optional[RateLimiter] = None, upstream: Optional[str] = None,
+                      retry_queue_timeout: bool = True):
+    """调用 fn，遇到限流时按带抖动的指数退避重试，优先遵循 Retry-After
+
+    指定 limiter 和 upstream 时，上游返回的限流同时暂停共享令牌桶（本地排队超时不暂停，
+    那只是配额已被预约满）。retry_queue_timeout 为False时本地排队超时直接抛出，
+    用于有响应时限的交互请求：调用方设定的等待上限已经用完，应尽快返回429。
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if not _should_retry(e, attempt, max_retries, retry_queue_timeout):
+                raise
+            delay = backoff_delay(e, attempt, base_delay, max_delay)
+            _record_retry(delay, attempt, upstream)
+            if _should_pause(e, limiter, upstream):
+                limiter.pause(upstream, delay)
+            time.sleep(delay)
+
+
+async def call_with_backoff_async(coro_fn: Callable, *args, max_retries: int = 5, base_delay: float = 1.0,
+                                  max_delay: float = 60.0, limiter: Optional[RateLimiter] = None,
+                                  upstream: Optional[str] = None, retry_queue_timeout: bool = True):
+    """call_with_backoff 的异步版本，coro_fn 为返回协程的函数"""
+    for attempt in range(max_retries + 1):
+        try:
+            return await coro_fn(*args)
+        except Exception as e:
+            if not _should_retry(e, attempt, max_retries, retry_queue_timeout):
+                raise
+            delay = backoff_delay(e, attempt, base_delay, max_delay)
+            _record_retry(delay, attempt, upstream)
+            if _should_pause(e, limiter, upstream):
+                await limiter.pause_async(upstream, delay)
+            await asyncio.sleep(delay)
+
+
+def _record_retry(delay: float, attempt: int, upstream: Optional[str]):
+    """记录重试日志和指标（不访问限流数据库）"""
+    logger.warning(f"{upstream or '上游'}限流，{delay:.1f}秒后第{attempt + 1}次重试")
+    if upstream:
+        UPSTREAM_RETRIES.inc(upstream=upstream)
+
+
+def _should_pause(error: Exception, limiter: Optional[RateLimiter], upstream: Optional[str]) -> bool:
+    """上游返回的限流需要暂停共享令牌桶，本地排队超时不需要"""
+    return limiter is not None and bool(upstream) and not isinstance(error, RateLimitTimeout)
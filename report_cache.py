@@ -0,0 +1,196 @@
+"""分析报告缓存：进程内LRU + 磁盘持久化两级缓存"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(suburb, system_prompt, model):
+    """根据标准化区域名、系统提示词哈希和模型名生成缓存键"""
+    prompt_hash = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:16]
+    raw = f"{suburb.strip().lower()}|{prompt_hash}|{model}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ReportCache:
+    """两级报告缓存
+
+    - 内存层：OrderedDict实现的LRU，按条目数淘汰
+    - 磁盘层：每个条目一个JSON文件，原子写入，按总字节数淘汰最久未访问的文件
+    两层共用同一个默认TTL（条目写入时可单独指定），过期条目视为未命中并被删除。
+    """
+
+    def __init__(self, cache_dir='cache/reports', ttl=7 * 24 * 3600,
+                 max_memory_entries=128, max_disk_bytes=50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'sets': 0
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _is_expired(self, entry):
+        return time.time() > self.expires_at(entry)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        """读取缓存条目，未命中或已过期返回None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._is_expired(entry):
+                    del self._memory[key]
+                    self._stats['expired'] += 1
+                else:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return entry
+
+        entry = self._read_disk(key)
+        if entry is None:
+            self._count('misses')
+            return None
+        if self._is_expired(entry):
+            self._remove_disk(key)
+            self._count('expired')
+            self._count('misses')
+            return None
+
+        self._count('disk_hits')
+        self._remember(key, entry)
+        return entry
+
+    def set(self, key, value, ttl=None):
+        """写入缓存条目，value为可JSON序列化的字典；ttl 为该条目的有效期（秒），默认使用缓存的TTL"""
+        entry = dict(value)
+        entry.setdefault('created_at', time.time())
+        if ttl is not None:
+            entry['ttl'] = ttl
+        self._remember(key, entry)
+        self._write_disk(key, entry)
+        self._count('sets')
+        self._enforce_disk_limit()
+        return entry
+
+    def peek(self, key):
+        """读取缓存条目但不计入命中统计、不更新访问顺序，过期条目同样返回；供预热检查剩余有效期"""
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is not None:
+            return entry
+        return self._read_disk(key, touch=False)
+
+    def expires_at(self, entry):
+        """条目的过期时间戳"""
+        return entry.get('created_at', 0) + entry.get('ttl', self.ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        self._remove_disk(key)
+
+    def stats(self):
+        """返回命中率等统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        hits = stats['memory_hits'] + stats['disk_hits']
+        total = hits + stats['misses']
+        stats['hit_ratio'] = round(hits / total, 4) if total else 0.0
+        stats['ttl_seconds'] = self.ttl
+        return stats
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _read_disk(self, key, touch=True):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            # 更新访问时间，供磁盘LRU淘汰使用
+            if touch:
+                os.utime(path, None)
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取缓存文件失败 {path}: {str(e)}")
+            return None
+
+    def _write_disk(self, key, entry):
+        """先写临时文件再原子替换，避免并发读到半个文件"""
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            logger.error(f"写入缓存文件失败: {str(e)}")
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _remove_disk(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"删除缓存文件失败: {str(e)}")
+
+    def _enforce_disk_limit(self):
+        """磁盘总大小超出上限时，按访问时间从旧到新删除"""
+        try:
+            files = []
+            total = 0
+            with os.scandir(self.cache_dir) as it:
+                for item in it:
+                    if not item.name.endswith('.json'):
+                        continue
+                    st = item.stat()
+                    files.append((st.st_mtime, st.st_size, item.path))
+                    total += st.st_size
+            if total <= self.max_disk_bytes:
+                return
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    self._count('evictions')
+                except FileNotFoundError:
+                    pass
+        except Exception as e:
+            logger.error(f"清理磁盘缓存失败: {str(e)}")
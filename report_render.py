@@ -0,0 +1,113 @@
+"""报告渲染：服务端把报告markdown渲染成HTML，随缓存条目保存，前端直接使用
+
+只支持报告模板实际用到的语法：一级至三级标题、无序/有序列表、表格、粗体，以及总结中的"优势：/劣势："行。
+所有文本先转义再套标签，模型输出中的HTML、脚本不会原样进入页面。
+渲染按行进行，块级元素在标题处结束，因此各报告分段分别渲染后拼接与整篇渲染的结果相同。
+"""
+import html
+import re
+from typing import List
+
+from report_sections import report_intro
+
+HEADING = re.compile(r'^(#{1,3})\s+(.*)$')
+BULLET = re.compile(r'^[-*•]\s+(.*)$')
+# 有序列表：1. / a. / 一.，序号必须是数字、单个字母或中文数字，且后面有空格，
+# 避免误判 "3.5%"、"e.g. ..."、"St. Albans ..." 这类正文
+ORDERED = re.compile(r'^(?:\d+|[a-zA-Z]|[一二三四五六七八九十]+)\.\s+(.*)$')
+TABLE_SEPARATOR = re.compile(r'^[\s|:\-]+$')
+BOLD = re.compile(r'\*\*(.+?)\*\*')
+PROS_CONS = (('优势', 'advantages'), ('劣势', 'disadvantages'))
+
+HEADING_TAGS = {1: ('h2', 'primary-title'), 2: ('h3', 'secondary-title'), 3: ('h4', 'tertiary-title')}
+
+
+def inline(text: str) -> str:
+    """转义文本并处理粗体"""
+    return BOLD.sub(r'<strong>\1</strong>', html.escape(text.strip(), quote=False))
+
+
+def table_cells(line: str) -> List[str]:
+    cells = line.strip().split('|')
+    # 行首、行尾的竖线两侧是空字符串，不算单元格
+    if cells and not cells[0].strip():
+        cells = cells[1:]
+    if cells and not cells[-1].strip():
+        cells = cells[:-1]
+    return [inline(cell) for cell in cells]
+
+
+def render_table(lines: List[str]) -> str:
+    """连续的表格行渲染为一个表格，第二行是分隔行时第一行为表头"""
+    header = None
+    if len(lines) > 1 and TABLE_SEPARATOR.match(lines[1]):
+        header, lines = lines[0], lines[2:]
+    rows = [line for line in lines if not TABLE_SEPARATOR.match(line)]
+    parts = ['<table class="comparison-table">']
+    if header is not None:
+        parts.append('<thead><tr>' + ''.join(f'<th>{cell}</th>' for cell in table_cells(header)) + '</tr></thead>')
+    parts.append('<tbody>' + ''.join(
+        '<tr>' + ''.join(f'<td>{cell}</td>' for cell in table_cells(row)) + '</tr>' for row in rows
+    ) + '</tbody></table>')
+    return ''.join(parts)
+
+
+def render_pros_cons(label: str, css_class: str, text: str) -> str:
+    items = ''.join(f'<li>{inline(item)}</li>' for item in text.split('，') if item.strip())
+    return f'<div class="{css_class}"><h4>{label}：</h4><ul>{items}</ul></div>'
+
+
+def render_report(markdown: str) -> str:
+    """把报告markdown渲染为HTML片段；内容为空时返回提示段落"""
+    if not markdown or not markdown.strip():
+        return '<p>暂无分析内容</p>'
+    blocks = []
+    list_items = []
+    table_lines = []
+
+    def flush():
+        if list_items:
+            blocks.append('<ul>' + ''.join(f'<li>{item}</li>' for item in list_items) + '</ul>')
+            list_items.clear()
+        if table_lines:
+            blocks.append(render_table(table_lines))
+            table_lines.clear()
+
+    for raw in markdown.split('\n'):
+        line = raw.strip()
+        if not line:
+            continue
+        if '|' in line:
+            if list_items:
+                flush()
+            table_lines.append(line)
+            continue
+        if table_lines:
+            flush()
+
+        heading = HEADING.match(line)
+        if heading:
+            flush()
+            tag, css_class = HEADING_TAGS[len(heading.group(1))]
+            blocks.append(f'<{tag} class="{css_class}">{inline(heading.group(2))}</{tag}>')
+            continue
+        pros_cons = next(((label, css_class) for label, css_class in PROS_CONS
+                          if line.startswith(label + '：') or line.startswith(label + ':')), None)
+        if pros_cons:
+            flush()
+            blocks.append(render_pros_cons(*pros_cons, line[len(pros_cons[0]) + 1:]))
+            continue
+        item = BULLET.match(line) or ORDERED.match(line)
+        if item:
+            list_items.append(inline(item.group(1)))
+            continue
+        flush()
+        blocks.append(f'<p>{inline(line)}</p>')
+
+    flush()
+    return '\n'.join(blocks)
+
+
+def assemble_report_html(intro: str, suburb: str, section_htmls: List[str]) -> str:
+    """拼接各分段已渲染的HTML，结果与整篇报告 render_report(assemble_report(...)) 相同"""
+    return '\n'.join([render_report(report_intro(intro, suburb))] + list(section_htmls))
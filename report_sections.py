@@ -0,0 +1,120 @@
+"""分段生成报告：按系统提示词模板中的一级标题（# ）把报告拆成若干段，
+每段单独生成、单独缓存（各自的TTL），再按模板顺序拼回与整篇生成相同结构的markdown"""
+import re
+from typing import Dict, List, Tuple
+
+DAY = 24 * 3600
+
+# 报告分段：name 用于缓存键和配置，titles 为该段包含的模板一级标题。
+# 变化频率不同的内容使用不同的TTL：房价每月变化，学校和医院很少变化。
+# 总结、建议和参考来源与其他各段并行生成，看不到其他段的内容，只根据同一份参考资料独立归纳；
+# 其中的建议会涉及房价走势，因此TTL与变化最快的房价段一致，保证建议不比房价段更旧。
+# keywords 用于从搜索结果中挑选该段的参考资料，为空时不筛选。
+REPORT_SECTIONS = [
+    {'name': 'infrastructure', 'titles': ['公共设施与政府基建'], 'ttl': 30 * DAY, 'max_tokens': 700,
+     'keywords': ['infrastructure', 'road', 'train', 'station', 'bus', 'council', 'funding', 'project',
+                  'community', 'library', 'park', 'shopping', 'upgrade']},
+    {'name': 'education', 'titles': ['教育资源'], 'ttl': 90 * DAY, 'max_tokens': 600,
+     'keywords': ['school', 'college', 'education', 'primary', 'secondary', 'vce', 'ranking', 'student']},
+    {'name': 'medical', 'titles': ['医疗资源'], 'ttl': 90 * DAY, 'max_tokens': 450,
+     'keywords': ['hospital', 'medical', 'health', 'clinic', 'gp', 'doctor', 'emergency']},
+    {'name': 'safety', 'titles': ['治安状况'], 'ttl': 30 * DAY, 'max_tokens': 500,
+     'keywords': ['crime', 'police', 'safety', 'offence', 'theft', 'burglary', 'assault']},
+    {'name': 'prices', 'titles': ['房价趋势与推动因素'], 'ttl': 7 * DAY, 'max_tokens': 600, 'grounded': True,
+     'keywords': ['price', 'median', 'property', 'house', 'unit', 'growth', 'market', 'rent', 'sale', 'auction']},
+    {'name': 'summary', 'titles': ['总结', '建议', '参考来源'], 'ttl': 7 * DAY, 'max_tokens': 500, 'keywords': []},
+]
+
+TEMPLATE_MARKER = '请按以下模板格式进行分析：'
+
+
+def split_template(system_prompt: str) -> Tuple[str, str, List[Tuple[str, str]]]:
+    """把系统提示词拆分为 (分析要求, 报告开头语, [(一级标题, 该节模板)])"""
+    instructions, _, template = system_prompt.partition(TEMPLATE_MARKER)
+    parts = re.split(r'^# (.+)$', template.strip(), flags=re.MULTILINE)
+    intro = parts[0].strip()
+    sections = [(parts[i].strip(), parts[i + 1].strip()) for i in range(1, len(parts), 2)]
+    return instructions.strip(), intro, sections
+
+
+def plan_sections(system_prompt: str, groups: List[Dict] = REPORT_SECTIONS, ttls: Dict[str, int] = None) -> Dict:
+    """根据系统提示词生成分段计划
+
+    每段得到只包含自身模板的系统提示词；模板中未被任何分段认领的标题并入最后一段，
+    保证拼接结果覆盖完整模板。返回 {'intro': 开头语, 'sections': [分段]}。
+    """
+    instructions, intro, template_sections = split_template(system_prompt)
+    templates = dict(template_sections)
+    order = [title for title, _ in template_sections]
+
+    sections = [dict(group, titles=[t for t in group['titles'] if t in templates]) for group in groups]
+    sections = [section for section in sections if section['titles']]
+    claimed = {title for section in sections for title in section['titles']}
+    unclaimed = [title for title in order if title not in claimed]
+    if unclaimed:
+        sections[-1]['titles'] += unclaimed
+
+    for section in sections:
+        section['titles'].sort(key=order.index)
+        if ttls and section['name'] in ttls:
+            section['ttl'] = ttls[section['name']]
+        body = '\n\n'.join(f"# {title}\n{templates[title]}" for title in section['titles'])
+        section['prompt'] = (
+            f"{instructions}\n\n这是完整报告中的一部分。只输出以下部分，严格按模板格式，"
+            f"以一级标题开头，不要输出开头语或其他部分：\n\n{body}"
+        )
+    sections.sort(key=lambda section: order.index(section['titles'][0]))
+    return {'intro': intro, 'sections': sections}
+
+
+def clean_section(text: str, section: Dict) -> str:
+    """去掉模型在一级标题前多输出的内容，缺少标题时补上"""
+    text = (text or '').strip()
+    match = re.search(r'^# ', text, flags=re.MULTILINE)
+    if match is None:
+        return f"# {section['titles'][0]}\n{text}"
+    return text[match.start():]
+
+
+class SectionCleaner:
+    """clean_section 的流式版本：丢弃一级标题之前的内容，直到流结束仍没有标题时补上
+
+    末尾的空白先暂存，后面还有正文时再输出，流结束时丢弃，与 clean_section 的 strip 一致，
+    保证流式输出与缓存中的分段逐字节相同。
+    """
+
+    def __init__(self, section: Dict):
+        self.section = section
+        self.buffer = ''
+        self.pending = ''
+        self.started = False
+
+    def feed(self, delta: str) -> str:
+        """输入一个分片，返回可以立即输出的文本"""
+        if self.started:
+            text = self.pending + delta
+        else:
+            self.buffer += delta
+            match = re.search(r'^# ', self.buffer, flags=re.MULTILINE)
+            if match is None:
+                return ''
+            self.started = True
+            text = self.buffer[match.start():]
+        stripped = text.rstrip()
+        self.pending = text[len(stripped):]
+        return stripped
+
+    def close(self) -> str:
+        """流结束，返回剩余需要输出的文本（暂存的末尾空白不再输出）"""
+        if self.started or not self.buffer.strip():
+            return ''
+        return clean_section(self.buffer, self.section)
+
+
+def report_intro(intro: str, suburb: str) -> str:
+    return intro.replace('[区域名]', suburb.title())
+
+
+def assemble_report(intro: str, suburb: str, texts: List[str]) -> str:
+    """按模板顺序拼接各段，结构与整篇生成的报告一致"""
+    return '\n\n'.join([report_intro(intro, suburb)] + list(texts))
@@ -0,0 +1,203 @@
+"""检索增强：对 PropertySearchEngine 的搜索结果去重、按相关度排序，
+在严格的token预算内打包成提示词中的参考资料
+
+token数优先使用 tiktoken 在本地精确计数（需要 pip install tiktoken，首次使用会下载并缓存编码表，
+离线部署可通过 TIKTOKEN_CACHE_DIR 指向预先下载的编码表）；tiktoken 不可用时退回按字符估算并记录警告。
+"""
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from dedup import canonical_url
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # 可选依赖
+    tiktoken = None
+
+# 参与检索的搜索结果分类（search_suburb 返回的列表字段）
+SEARCH_CATEGORIES = ('infrastructure', 'crime', 'property')
+
+CONTEXT_HEADER = "以下是网络搜索到的参考资料（按相关度排序），引用时请注明来源："
+
+# 剩余预算小于此值时不再尝试装入更多资料
+MIN_SNIPPET_TOKENS = 24
+
+CJK_PATTERN = re.compile('[\u4e00-\u9fff]')
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+_encoders = {}
+_encoder_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """粗略估算token数：中日韩字符按1个token，其余按4个字符1个token"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk) // 4
+
+
+def get_encoder(model: str):
+    """获取模型对应的 tiktoken 编码器，不可用时返回None（结果按模型缓存）
+
+    首次加载可能需要下载编码表，应在启动预热时调用（见 app.LAZY_COMPONENTS），
+    避免第一个请求在锁内等待下载；model 为None时直接返回None（按字符估算）。
+    """
+    if model is None:
+        return None
+    if model in _encoders:
+        return _encoders[model]
+    with _encoder_lock:
+        if model not in _encoders:
+            _encoders[model] = _load_encoder(model)
+        return _encoders[model]
+
+
+def _load_encoder(model: str):
+    if tiktoken is None:
+        logger.warning("未安装tiktoken，使用估算的token数")
+        return None
+    start_time = time.perf_counter()
+    try:
+        try:
+            encoder = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoder = tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        logger.warning(f"加载tiktoken编码表失败，使用估算的token数: {str(e)}")
+        return None
+    logger.info(f"tiktoken编码表 {encoder.name} 加载完成，用时: {time.perf_counter() - start_time:.2f}秒")
+    return encoder
+
+
+def encoder_loaded(model: str) -> bool:
+    """模型的编码器是否已经加载过（无论成功与否）"""
+    return model in _encoders
+
+
+def count_tokens(text: str, model: str = 'gpt-3.5-turbo') -> int:
+    """计算文本的token数，model 为None时按字符估算"""
+    encoder = get_encoder(model)
+    if encoder is None:
+        return estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def tokenizer_name(model: str = 'gpt-3.5-turbo') -> str:
+    encoder = get_encoder(model)
+    return f"tiktoken:{encoder.name}" if encoder is not None else 'estimate'
+
+
+def _normalize_text(text: str) -> str:
+    return ' '.join(re.sub(r'[^\w\s]', ' ', (text or '').lower()).split())
+
+
+def collect_snippets(search_results: Dict, categories: Iterable[str] = SEARCH_CATEGORIES) -> List[Dict]:
+    """把各分类的搜索结果合并为一个列表，按链接和正文去重；每次检索只需调用一次，各分段共用结果"""
+    snippets = []
+    seen_links = set()
+    seen_texts = set()
+    for category in categories:
+        for result in (search_results or {}).get(category) or []:
+            link = canonical_url(result.get('link', ''))
+            text = _normalize_text(result.get('summary', ''))[:200]
+            if (link and link in seen_links) or (text and text in seen_texts):
+                continue
+            if link:
+                seen_links.add(link)
+            if text:
+                seen_texts.add(text)
+            # 预先计算小写文本和词集合，各分段排序时直接复用
+            lowered = f"{result.get('title', '')} {result.get('summary', '')}".lower()
+            snippets.append(dict(result, category=category, _text=lowered, _words=set(WORD_PATTERN.findall(lowered))))
+    return snippets
+
+
+def score_snippet(text: str, date: str, suburb: str, keyword_hits: int, current_year: int) -> float:
+    """相关度得分：提到区域名、命中的不同关键词数，以及数据年份的新近程度"""
+    score = float(keyword_hits)
+    if suburb and suburb.lower() in text:
+        score += 2.0
+    match = re.search(r'\b(19|20)\d{2}\b', date or '')
+    if match:
+        age = current_year - int(match.group(0))
+        score += max(0.0, 1.0 - 0.25 * max(age, 0))
+    return score
+
+
+def keyword_hits(words: set, keywords: List[str]) -> int:
+    """命中的不同关键词数，关键词的复数形式也算命中"""
+    return sum(1 for keyword in keywords if keyword in words or keyword + 's' in words)
+
+
+def rank_snippets(snippets: List[Dict], suburb: str, keywords: Iterable[str] = ()) -> List[Dict]:
+    """按相关度从高到低排序；指定关键词时只保留至少命中一个关键词的结果"""
+    keywords = [keyword.lower() for keyword in keywords]
+    current_year = datetime.now().year
+    scored = []
+    for index, snippet in enumerate(snippets):
+        text = snippet.get('_text')
+        if text is None:
+            text = f"{snippet.get('title', '')} {snippet.get('summary', '')}".lower()
+        words = snippet.get('_words')
+        if words is None:
+            words = set(WORD_PATTERN.findall(text))
+        hits = keyword_hits(words, keywords)
+        if keywords and not hits:
+            continue
+        score = score_snippet(text, snippet.get('date'), suburb, hits, current_year)
+        scored.append((-score, index, snippet))
+    scored.sort(key=lambda item: item[:2])
+    return [snippet for _, _, snippet in scored]
+
+
+def format_snippet(snippet: Dict) -> str:
+    summary = (snippet.get('summary') or '').strip()
+    if summary.endswith('...'):
+        summary = summary[:-3].rstrip()
+    date = f"（{snippet['date']}）" if snippet.get('date') and snippet['date'] != '未知日期' else ''
+    return f"- {snippet.get('title', '').strip()}{date}：{summary} 来源：{snippet.get('link', '')}"
+
+
+def pack_context(snippets: List[Dict], budget: int, model: str = 'gpt-3.5-turbo',
+                 header: str = CONTEXT_HEADER) -> Dict:
+    """按顺序把资料装入 budget 个token以内，放不下的条目跳过（继续尝试更短的条目）
+
+    每行单独计数后累加（行间换行符也计入），最后对整段文本复核一次，保证总数不超过 budget。
+    返回 {'text': 资料文本（无资料时为空）, 'tokens': token数, 'used': 条数, 'dropped': 条数}
+    """
+    if budget <= 0 or not snippets:
+        return {'text': '', 'tokens': 0, 'used': 0, 'dropped': len(snippets)}
+    total = count_tokens(header, model)
+    newline = count_tokens('\n', model)
+    lines = []
+    dropped = 0
+    for snippet in snippets:
+        if budget - total < MIN_SNIPPET_TOKENS:
+            dropped += 1
+            continue
+        line = format_snippet(snippet)
+        tokens = count_tokens(line, model) + newline
+        if total + tokens > budget:
+            dropped += 1
+            continue
+        lines.append(line)
+        total += tokens
+    while lines:
+        text = '\n'.join([header] + lines)
+        total = count_tokens(text, model)
+        if total <= budget:
+            return {'text': text, 'tokens': total, 'used': len(lines), 'dropped': dropped}
+        lines.pop()
+        dropped += 1
+    return {'text': '', 'tokens': 0, 'used': 0, 'dropped': dropped}
+
+
+def build_context(snippets: List[Dict], suburb: str, keywords: Iterable[str] = (), budget: int = 400,
+                  model: str = 'gpt-3.5-turbo') -> Dict:
+    """对 collect_snippets 的结果按关键词筛选排序并打包，返回 pack_context 的结果"""
+    return pack_context(rank_snippets(snippets, suburb, keywords), budget, model)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""搜索结果缓存：以 (区域, 分类, 搜索词) 为键的SQLite索引存储
+
+用法：
+    python search_cache.py compact           # 将 search_cache.json 合并进索引存储（供 search_cli.py 使用）
+    python search_cache.py compact --remove  # 合并后删除旧文件
+    python search_cache.py stats             # 查看缓存统计
+    python search_cache.py purge             # 删除过期条目
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join('cache', 'search_cache.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    suburb TEXT NOT NULL,
+    category TEXT NOT NULL,
+    query TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    results TEXT NOT NULL,
+    PRIMARY KEY (suburb, category, query)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_accessed_at ON entries (accessed_at);
+"""
+
+
+class SearchCache:
+    """搜索结果缓存
+
+    - 按写入时的时间戳判断TTL，过期条目视为未命中
+    - 每次写入在单个SQLite事务中完成（WAL模式），多线程/多进程并发读写安全
+    - 条目数超过 max_entries 时按最近访问时间淘汰（LRU）
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, ttl: float = 24 * 3600, max_entries: int = 5000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'sets': 0}
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    @staticmethod
+    def _normalize(suburb: str, category: str, query: str):
+        # 搜索引擎不区分大小写，键统一转小写以提高命中率
+        return suburb.strip().lower(), category.strip().lower(), query.strip().lower()
+
+    def get(self, suburb: str, category: str, query: str, max_age: Optional[float] = None) -> Optional[List[Dict]]:
+        """读取缓存的搜索结果，未命中或已过期返回None
+
+        max_age 比TTL更严格时，早于 max_age 秒写入的条目同样视为未命中（预热时提前刷新即将过期的条目）
+        """
+        key = self._normalize(suburb, category, query)
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT timestamp, results FROM entries WHERE suburb = ? AND category = ? AND query = ?', key
+            ).fetchone()
+            if row is None:
+                self._count('misses')
+                return None
+            timestamp, results = row
+            if time.time() - timestamp > (self.ttl if max_age is None else min(self.ttl, max_age)):
+                self._count('expired')
+                self._count('misses')
+                return None
+            conn.execute(
+                'UPDATE entries SET accessed_at = ? WHERE suburb = ? AND category = ? AND query = ?',
+                (time.time(),) + key
+            )
+            self._count('hits')
+            return json.loads(results)
+        except Exception as e:
+            logger.error(f"读取搜索缓存失败: {str(e)}")
+            self._count('misses')
+            return None
+
+    def set(self, suburb: str, category: str, query: str, results: List[Dict], timestamp: Optional[float] = None):
+        """写入搜索结果，超出容量时淘汰最久未访问的条目"""
+        key = self._normalize(suburb, category, query)
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries (suburb, category, query, timestamp, accessed_at, results) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    key + (timestamp or now, now, json.dumps(results, ensure_ascii=False))
+                )
+                evicted = self._evict(conn)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self._count('sets')
+            if evicted:
+                self._count('evictions', evicted)
+        except Exception as e:
+            logger.error(f"写入搜索缓存失败: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        total = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        overflow = total - self.max_entries
+        if overflow <= 0:
+            return 0
+        conn.execute(
+            'DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY accessed_at LIMIT ?)',
+            (overflow,)
+        )
+        return overflow
+
+    def purge_expired(self) -> int:
+        """删除所有过期条目，返回删除数量"""
+        cursor = self._connect().execute('DELETE FROM entries WHERE timestamp < ?', (time.time() - self.ttl,))
+        return cursor.rowcount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / total, 4) if total else 0.0
+        try:
+            stats['entries'] = self._connect().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        except Exception:
+            stats['entries'] = None
+        stats['ttl_seconds'] = self.ttl
+        return stats
+
+    def compact(self, legacy_file: str = 'search_cache.json', remove: bool = False) -> int:
+        """将旧的 search_cache.json（{搜索词: [时间戳, [...]]}）合并进索引存储，返回导入的条目数
+
+        条目以 ('', 'web', 搜索词) 为键，与 search_cli.py 的查询键一致，旧的搜索词可直接命中。
+        cache/<区域>_<分类>.json 不导入：其中是已整理的结果（或资金汇总），分类也与
+        PropertySearchEngine.search_suburb 的分类不对应，无法作为原始搜索结果复用。
+        """
+        if not os.path.exists(legacy_file):
+            logger.info(f"未找到旧缓存文件 {legacy_file}")
+            return 0
+        imported = 0
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for query, (timestamp, results) in data.items():
+                self.set('', 'web', query, results, timestamp=timestamp)
+                imported += 1
+        except Exception as e:
+            logger.error(f"导入缓存文件失败 {legacy_file}: {str(e)}")
+            return imported
+
+        if remove:
+            os.remove(legacy_file)
+        logger.info(f"缓存合并完成，导入 {imported} 条")
+        return imported
+
+def main():
+    parser = argparse.ArgumentParser(description='搜索结果缓存管理')
+    parser.add_argument('command', choices=['compact', 'stats', 'purge'], help='compact: 合并旧缓存文件；stats: 统计；purge: 删除过期条目')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help=f'缓存数据库路径（默认{DEFAULT_DB_PATH}）')
+    parser.add_argument('--legacy-file', default='search_cache.json', help='旧的合并缓存文件（默认search_cache.json）')
+    parser.add_argument('--remove', action='store_true', help='合并后删除旧缓存文件')
+    args = parser.parse_args()
+
+    cache = SearchCache(args.db)
+    if args.command == 'compact':
+        count = cache.compact(args.legacy_file, args.remove)
+        print(f"已合并 {count} 条缓存到 {args.db}")
+    elif args.command == 'purge':
+        print(f"已删除 {cache.purge_expired()} 条过期缓存")
+    else:
+        print(json.dumps(cache.stats(), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
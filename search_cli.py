@@ -1,33 +1,112 @@
 #!/usr/bin/env python3
+"""DuckDuckGo命令行搜索工具
+
+单次搜索：
+    python search_cli.py "point cook schools" -n 10
+批量模式：从文件或标准输入读取搜索词（每行一个），共用一个DDGS会话并发搜索，
+每个搜索词完成后立即输出；结果缓存在 cache/search_cache.db（与 search_cache.py 同一个库）
+    python search_cli.py --file suburbs.txt --workers 8
+    cat suburbs.txt | python search_cli.py --file - --json > results.jsonl
+"""
 import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from duckduckgo_search import DDGS
 from rich.console import Console
 from rich.table import Table
 
+from rate_limiter import DEFAULT_LIMITS, RateLimiter, call_with_backoff
+from search_cache import DEFAULT_DB_PATH, SearchCache
+
+def fetch_results(ddgs, query, search_type='web', max_results=5):
+    """
+    使用给定的DDGS会话搜索，出错时抛出异常
+    """
+    if search_type == 'web':
+        return list(ddgs.text(query, max_results=max_results))
+    if search_type == 'news':
+        return list(ddgs.news(query, max_results=max_results))
+    raise ValueError(f"不支持的搜索类型: {search_type}")
+
 def search_duckduckgo(query, search_type='web', max_results=5):
     """
     使用DuckDuckGo API搜索并返回结果
     """
     try:
         with DDGS() as ddgs:
-            if search_type == 'web':
-                results = list(ddgs.text(query, max_results=max_results))
-            elif search_type == 'news':
-                results = list(ddgs.news(query, max_results=max_results))
-            else:
-                print(f"不支持的搜索类型: {search_type}")
-                return []
-            return results
+            return fetch_results(ddgs, query, search_type, max_results)
     except Exception as e:
         print(f"搜索时发生错误: {str(e)}")
         return []
 
-def display_results(results, search_type='web'):
+def limited_fetch(ddgs, limiter, query, search_type='web', max_results=5):
+    """
+    在共享的DuckDuckGo配额内搜索（与 app.py 共用 cache/rate_limits.db），被限流时退避重试
+    """
+    def fetch():
+        if limiter is not None:
+            limiter.acquire('ddgs')
+        return fetch_results(ddgs, query, search_type, max_results)
+
+    return call_with_backoff(fetch, max_retries=3, limiter=limiter, upstream='ddgs')
+
+def cached_search(ddgs, cache, query, search_type='web', max_results=5, limiter=None):
+    """
+    先查磁盘缓存，未命中时搜索并写入缓存，返回 (结果, 是否命中缓存)
+
+    缓存键为 ('', 搜索类型, 搜索词)，与旧版 search_cache.json 合并进来的条目一致；
+    缓存的结果数少于本次需要的数量时重新搜索。空结果不缓存。
+    """
+    if cache is not None:
+        cached = cache.get('', search_type, query)
+        if cached is not None and len(cached) >= max_results:
+            return cached[:max_results], True
+    results = limited_fetch(ddgs, limiter, query, search_type, max_results)
+    if cache is not None and results:
+        cache.set('', search_type, query, results)
+    return results, False
+
+def read_queries(path):
+    """
+    读取搜索词，每行一个（path 为 "-" 时读标准输入），忽略空行和 # 开头的注释行，重复的只保留一次
+    """
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    queries = (line.strip() for line in lines)
+    return list(dict.fromkeys(query for query in queries if query and not query.startswith('#')))
+
+def run_batch(queries, search_type='web', max_results=5, workers=4, cache=None, limiter=None):
+    """
+    并发执行多个搜索，所有线程共用一个DDGS会话（复用HTTP连接池），最多 workers 个同时进行，
+    请求速率受 limiter 的配额限制
+
+    按完成顺序逐个产出 (序号, 搜索词, 结果, 是否命中缓存, 错误信息)，调用方可以边收边输出
+    """
+    with DDGS() as ddgs, ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='search') as pool:
+        futures = {
+            pool.submit(cached_search, ddgs, cache, query, search_type, max_results, limiter): (index, query)
+            for index, query in enumerate(queries)
+        }
+        for future in as_completed(futures):
+            index, query = futures[future]
+            try:
+                results, cached = future.result()
+                yield index, query, results, cached, None
+            except Exception as e:
+                yield index, query, [], False, str(e)
+
+def display_results(results, search_type='web', title=None):
     """
     使用rich库美化输出搜索结果
     """
     console = Console()
-    table = Table(show_header=True)
+    table = Table(show_header=True, title=title)
     
     if search_type == 'web':
         table.add_column("标题", style="bold cyan", width=40)
@@ -44,7 +123,7 @@ def display_results(results, search_type='web'):
             continue
             
         title = result.get('title', '')
-        link = result.get('link', '')
+        link = result.get('link') or result.get('href', '')
         snippet = result.get('snippet', '')
         if not snippet:
             snippet = result.get('body', '')
@@ -71,17 +150,48 @@ def display_results(results, search_type='web'):
 
 def main():
     parser = argparse.ArgumentParser(description='DuckDuckGo命令行搜索工具')
-    parser.add_argument('query', help='搜索关键词')
+    parser.add_argument('query', nargs='?', help='搜索关键词（使用 --file 批量搜索时省略）')
     parser.add_argument('-t', '--type', choices=['web', 'news'], default='web', help='搜索类型：web(网页) 或 news(新闻)，默认为web')
     parser.add_argument('-n', '--num', type=int, default=5, help='显示结果数量（默认为5）')
+    parser.add_argument('-f', '--file', help='批量模式：从文件读取搜索词，每行一个，"-" 表示标准输入')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='批量模式的并发搜索数（默认4）')
+    parser.add_argument('--json', action='store_true', help='每个搜索词输出一行JSON（JSONL）')
+    parser.add_argument('--cache-db', default=DEFAULT_DB_PATH, help=f'结果缓存数据库（默认{DEFAULT_DB_PATH}）')
+    parser.add_argument('--cache-ttl', type=float, default=24 * 3600, help='缓存有效期（秒，默认24小时）')
+    parser.add_argument('--no-cache', action='store_true', help='不读写结果缓存')
+    parser.add_argument('--rpm', type=int, default=DEFAULT_LIMITS['ddgs']['requests'],
+                        help=f"每分钟最多请求数，与本机其他进程共享（默认{DEFAULT_LIMITS['ddgs']['requests']}，0为不限）")
     
     args = parser.parse_args()
-    
-    results = search_duckduckgo(args.query, args.type, args.num)
-    if results:
-        display_results(results, args.type)
-    else:
-        print("未找到搜索结果")
+    if bool(args.query) == bool(args.file):
+        parser.error('请提供一个搜索关键词，或使用 --file 指定搜索词文件')
+
+    queries = [args.query] if args.query else read_queries(args.file)
+    cache = None if args.no_cache else SearchCache(args.cache_db, ttl=args.cache_ttl)
+    limiter = RateLimiter(limits={'ddgs': {'requests': args.rpm}}) if args.rpm > 0 else None
+    batch = args.file is not None
+
+    start = time.time()
+    hits = 0
+    failed = 0
+    for index, query, results, cached, error in run_batch(queries, args.type, args.num, args.workers, cache, limiter):
+        hits += cached
+        failed += error is not None
+        if args.json:
+            record = {'index': index, 'query': query, 'type': args.type, 'cached': cached,
+                      'results': results, 'error': error}
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+        elif error:
+            print(f"{query}: 搜索时发生错误: {error}")
+        elif results:
+            display_results(results, args.type, title=query if batch else None)
+        else:
+            print(f"{query}: 未找到搜索结果" if batch else "未找到搜索结果")
+
+    if batch:
+        Console(stderr=True).print(f"完成 {len(queries)} 个搜索，缓存命中 {hits} 个，失败 {failed} 个，"
+                                   f"用时 {time.time() - start:.1f}秒")
+    return 1 if failed else 0
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
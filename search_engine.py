@@ -1,114 +1,274 @@
-from duckduckgo_search import DDGS
+from search_cache import SearchCache
+from dedup import dedupe_results
+from metrics import bind_context, track_upstream
+from rate_limiter import RateLimiter, call_with_backoff
 from datetime import datetime
-import asyncio
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+import time
+from typing import Dict, List, Optional, Set
 import re
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 各分类的相关性关键词（子串匹配，不区分大小写）
+CATEGORY_KEYWORDS = {
+    'infrastructure': ['development', 'projects', 'infrastructure', 'railway', 'school', 'hospital', 'road'],
+    'crime': ['crime', 'safety', 'security', 'incident', 'police'],
+    'property': ['property', 'house', 'price', 'market', 'real estate']
+}
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+_MONTH = r'(?P<{}>jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?'
+_YEAR = r'(?P<{}>(?:19|20)\d{{2}})'
+_DAY = r'(?P<{}>\d{{1,2}})'
+
+# 支持的日期格式（按此顺序尝试同一位置的匹配）：
+# 2024-03-12、2024/3/12；12/03/2024、12-03-2024、12.03.2024（澳洲习惯，日在前）；
+# 12 March 2024、12th Mar, 2024；March 12, 2024；March 2024、Mar. 2024
+DATE_PATTERN = re.compile('|'.join([
+    r'\b' + _YEAR.format('iso_year') + r'[-/.]' + _DAY.format('iso_month') + r'[-/.]' + _DAY.format('iso_day') + r'\b',
+    r'\b' + _DAY.format('dmy_day') + r'[-/.]' + _DAY.format('dmy_month') + r'[-/.]' + _YEAR.format('dmy_year') + r'\b',
+    r'\b' + _DAY.format('dm_day') + r'(?:st|nd|rd|th)?\s+' + _MONTH.format('dm_month') + r',?\s+' + _YEAR.format('dm_year') + r'\b',
+    r'\b' + _MONTH.format('md_month') + r'\s+' + _DAY.format('md_day') + r'(?:st|nd|rd|th)?,?\s+' + _YEAR.format('md_year') + r'\b',
+    r'\b' + _MONTH.format('my_month') + r',?\s+' + _YEAR.format('my_year') + r'\b',
+]), re.IGNORECASE)
+
+
+class KeywordClassifier:
+    """多分类关键词匹配（子串匹配，不区分大小写）
+
+    每段文本只转换一次小写，之后的关键词查找都是C层的子串搜索；
+    在CPython中这比合并成一个带 IGNORECASE 的多选正则快一个数量级。
+    """
+
+    def __init__(self, categories: Dict[str, List[str]]):
+        self.categories = {category: tuple(keyword.lower() for keyword in keywords)
+                           for category, keywords in categories.items()}
+
+    def matches(self, text: str, category: str) -> bool:
+        """文本是否与指定分类相关，命中第一个关键词即返回"""
+        lowered = (text or '').lower()
+        return any(keyword in lowered for keyword in self.categories[category])
+
+    def classify(self, text: str) -> Set[str]:
+        """一次遍历返回文本相关的全部分类：只转换一次小写，逐个分类查找关键词"""
+        lowered = (text or '').lower()
+        return {category for category, keywords in self.categories.items()
+                if any(keyword in lowered for keyword in keywords)}
+
+
+def _year_positions(text: str) -> List[int]:
+    """19xx/20xx 年份的起始位置（str.find 在C层查找，比正则逐字符扫描整段文本快得多）"""
+    positions = []
+    for prefix in ('19', '20'):
+        index = text.find(prefix)
+        while index != -1:
+            if text[index + 2:index + 4].isdigit():
+                positions.append(index)
+            index = text.find(prefix, index + 1)
+    positions.sort()
+    return positions
+
+
+def _date_candidates(text: str):
+    """所有日期格式都含四位年份：先定位年份，再只在年份附近匹配完整的日期正则"""
+    for position in _year_positions(text):
+        # 窗口从年份前至少20个字符处的词首开始，足以容纳 "12th September, " 这样的前缀
+        start = text.rfind(' ', 0, max(position - 20, 0)) + 1
+        for match in DATE_PATTERN.finditer(text, start, position + 11):
+            if match.start() <= position < match.end():
+                yield match
+                break
+
+
+def extract_date(text: str) -> str:
+    """提取文本中第一个有效日期，统一为 YYYY-MM-DD（只有年月时为 YYYY-MM），没有时返回空字符串"""
+    for match in _date_candidates(text or ''):
+        # 每个分支的分组名以格式名为前缀，最后闭合的分组即可确定匹配的格式
+        fmt = match.lastgroup.rsplit('_', 1)[0]
+        year = int(match.group(f'{fmt}_year'))
+        month = match.group(f'{fmt}_month')
+        month = int(month) if month.isdigit() else MONTHS[month[:3].lower()]
+        day = int(match.group(f'{fmt}_day')) if fmt != 'my' else None
+        if not 1 <= month <= 12 or (day is not None and not 1 <= day <= 31):
+            continue
+        return f"{year:04d}-{month:02d}-{day:02d}" if day is not None else f"{year:04d}-{month:02d}"
+    return ''
+
+
 class PropertySearchEngine:
-    def __init__(self):
-        self.categories = {
-            'infrastructure': ['development', 'projects', 'infrastructure', 'railway', 'school', 'hospital', 'road'],
-            'crime': ['crime', 'safety', 'security', 'incident', 'police'],
-            'property': ['property', 'house', 'price', 'market', 'real estate']
+    def __init__(self, max_workers: int = 12, category_timeout: float = 15, request_timeout: int = 10,
+                 cache: Optional[SearchCache] = None, use_cache: bool = True, dedup: bool = True,
+                 rate_limiter: Optional[RateLimiter] = None, max_retries: int = 2):
+        self.categories = {category: list(keywords) for category, keywords in CATEGORY_KEYWORDS.items()}
+        self.classifier = KeywordClassifier(self.categories)
+        # 各分类的搜索方法，并发执行
+        self.category_searches = {
+            'infrastructure': self._search_infrastructure,
+            'crime': self._search_crime_stats,
+            'property': self._search_property_trends
         }
-    
-    def search_suburb(self, suburb: str) -> Dict:
-        """执行综合搜索并返回结果"""
+        self.category_timeout = category_timeout
+        self.request_timeout = request_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ddgs')
+        self._session = None
+        self._session_lock = threading.Lock()
+        # 搜索结果缓存，新鲜的结果直接返回，不再访问DuckDuckGo
+        self.cache = (cache or SearchCache()) if use_cache else None
+        # 合并各分类结果中URL相同、正文相同或近似的重复结果
+        self.dedup = dedup
+        # DuckDuckGo请求配额（与其他worker、search_cli.py共享），None时不限流；被限流时最多重试 max_retries 次
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+
+    def _get_session(self):
+        """所有分类共用一个DDGS会话（底层HTTP连接池可复用）
+
+        duckduckgo_search 在第一次搜索时才导入，只读缓存的进程不承担导入开销。
+        """
+        with self._session_lock:
+            if self._session is None:
+                from duckduckgo_search import DDGS
+                self._session = DDGS(timeout=self.request_timeout)
+            return self._session
+
+    def warm_up(self):
+        """提前导入 duckduckgo_search 并创建会话，不发起搜索请求"""
+        self._get_session()
+
+    @property
+    def ready(self) -> bool:
+        """DDGS会话是否已创建"""
+        return self._session is not None
+
+    def close(self):
+        """关闭线程池和HTTP会话"""
+        self._executor.shutdown(wait=False)
+        with self._session_lock:
+            if self._session is not None:
+                self._session.__exit__(None, None, None)
+                self._session = None
+
+    def search_suburb(self, suburb: str, timeout: Optional[float] = None, max_age: Optional[float] = None) -> Dict:
+        """并发搜索各分类并返回结果
+
+        每个分类最多等待 timeout 秒（默认 category_timeout），超时或出错的分类返回空列表，
+        并记录在 errors 中，不影响其他分类的结果。max_age 不为空时，缓存中早于 max_age 秒的结果重新搜索。
+        """
         logger.info(f"开始搜索区域: {suburb}")
-        results = {
-            'infrastructure': self._search_infrastructure(suburb),
-            'crime': self._search_crime_stats(suburb),
-            'property': self._search_property_trends(suburb),
-            'timestamp': datetime.now().isoformat(),
-            'suburb': suburb
+        timeout = self.category_timeout if timeout is None else timeout
+        start_time = time.time()
+        futures = {
+            name: self._executor.submit(bind_context(search), suburb, max_age)
+            for name, search in self.category_searches.items()
         }
-        logger.info(f"搜索完成，结果统计：")
+        wait(futures.values(), timeout=timeout)
+
+        results = {}
+        errors = {}
+        for name, future in futures.items():
+            if not future.done():
+                future.cancel()
+                logger.warning(f"{name} 搜索超时（{timeout}秒），返回部分结果")
+                errors[name] = 'timeout'
+                results[name] = []
+            elif future.exception() is not None:
+                logger.error(f"{name} 搜索失败: {str(future.exception())}")
+                errors[name] = str(future.exception())
+                results[name] = []
+            else:
+                results[name] = future.result()
+
+        duplicates = 0
+        if self.dedup:
+            deduped, stats = dedupe_results(results, self.category_searches)
+            results.update(deduped)
+            duplicates = stats['url'] + stats['exact'] + stats['near']
+            if duplicates:
+                logger.info(f"去重移除 {duplicates} 条结果（URL {stats['url']}，正文 {stats['exact']}，近似 {stats['near']}）")
+
+        results.update({
+            'timestamp': datetime.now().isoformat(),
+            'suburb': suburb,
+            'partial': bool(errors),
+            'errors': errors,
+            'duplicates': duplicates
+        })
+        logger.info(f"搜索完成，用时: {time.time() - start_time:.2f}秒，结果统计：")
         logger.info(f"- 基础设施相关: {len(results['infrastructure'])} 条")
         logger.info(f"- 治安相关: {len(results['crime'])} 条")
         logger.info(f"- 房产相关: {len(results['property'])} 条")
         return results
+
+    def _text_search(self, suburb: str, category: str, query: str, max_results: int = 10,
+                     max_age: Optional[float] = None) -> List[Dict]:
+        """带缓存的DuckDuckGo文本搜索，缓存原始结果以便过滤规则变化后仍可复用"""
+        if self.cache:
+            cached = self.cache.get(suburb, category, query, max_age)
+            if cached is not None:
+                logger.info(f"搜索缓存命中: {query}")
+                return cached
+
+        def search():
+            # 排队时间超过分类超时的请求没有意义，直接放弃
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire('ddgs', max_wait=self.category_timeout)
+            with track_upstream('ddgs', category):
+                return list(self._get_session().text(query, max_results=max_results))
+
+        search_results = call_with_backoff(search, max_retries=self.max_retries, max_delay=self.category_timeout,
+                                           limiter=self.rate_limiter, upstream='ddgs', retry_queue_timeout=False)
+        if self.cache:
+            self.cache.set(suburb, category, query, search_results)
+        return search_results
+
+    def search_suburbs(self, suburbs: List[str], max_concurrent: int = 4, timeout: Optional[float] = None) -> Dict[str, Dict]:
+        """同时搜索多个区域，返回 {区域: 结果}"""
+        # 外层使用独立线程池，避免与分类搜索争用同一个线程池造成死锁
+        with ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='suburb') as pool:
+            futures = {suburb: pool.submit(self.search_suburb, suburb, timeout) for suburb in suburbs}
+            return {suburb: future.result() for suburb, future in futures.items()}
     
-    def _search_infrastructure(self, suburb: str) -> List[Dict]:
-        """搜索基础设施发展项目"""
+    def _search_category(self, suburb: str, category: str, query: str, label: str,
+                         max_age: Optional[float] = None) -> List[Dict]:
+        """执行一个分类的搜索，只保留与该分类相关的结果并整理成统一格式
+
+        每条结果一次性按全部分类打分，categories 记录该结果相关的所有分类
+        """
+        logger.info(f"{label}搜索词: {query}")
+        search_results = self._text_search(suburb, category, query, max_age=max_age)
+        logger.info(f"{label}原始结果数: {len(search_results)}")
         results = []
-        with DDGS() as ddgs:
-            query = f"{suburb} Melbourne schools education ranking performance"
-            logger.info(f"基础设施搜索词: {query}")
-            search_results = list(ddgs.text(query, max_results=10))
-            logger.info(f"基础设施原始结果数: {len(search_results)}")
-            
-            for result in search_results:
-                if self._is_relevant_infrastructure(result.get('body', '')):
-                    results.append({
-                        'title': result.get('title', ''),
-                        'link': result.get('link', ''),
-                        'summary': result.get('body', '')[:500] + '...',
-                        'date': self._extract_date(result.get('body', ''))
-                    })
-            logger.info(f"基础设施过滤后结果数: {len(results)}")
+        for result in search_results:
+            body = result.get('body', '')
+            categories = self.classifier.classify(body)
+            if category in categories:
+                results.append({
+                    'title': result.get('title', ''),
+                    'link': result.get('href') or result.get('link', ''),
+                    'summary': body[:500] + '...',
+                    'date': extract_date(body),
+                    'categories': sorted(categories)
+                })
+        logger.info(f"{label}过滤后结果数: {len(results)}")
         return results
-    
-    def _search_crime_stats(self, suburb: str) -> List[Dict]:
+
+    def _search_infrastructure(self, suburb: str, max_age: Optional[float] = None) -> List[Dict]:
+        """搜索基础设施发展项目"""
+        return self._search_category(suburb, 'infrastructure',
+                                     f"{suburb} Melbourne schools education ranking performance", '基础设施', max_age)
+
+    def _search_crime_stats(self, suburb: str, max_age: Optional[float] = None) -> List[Dict]:
         """搜索犯罪率统计"""
-        results = []
-        with DDGS() as ddgs:
-            query = f"{suburb} Melbourne crime statistics police report safety data"
-            logger.info(f"治安搜索词: {query}")
-            search_results = list(ddgs.text(query, max_results=10))
-            logger.info(f"治安原始结果数: {len(search_results)}")
-            
-            for result in search_results:
-                if self._is_relevant_crime(result.get('body', '')):
-                    results.append({
-                        'title': result.get('title', ''),
-                        'link': result.get('link', ''),
-                        'summary': result.get('body', '')[:500] + '...',
-                        'date': self._extract_date(result.get('body', ''))
-                    })
-            logger.info(f"治安过滤后结果数: {len(results)}")
-        return results
-    
-    def _search_property_trends(self, suburb: str) -> List[Dict]:
+        return self._search_category(suburb, 'crime',
+                                     f"{suburb} Melbourne crime statistics police report safety data", '治安', max_age)
+
+    def _search_property_trends(self, suburb: str, max_age: Optional[float] = None) -> List[Dict]:
         """搜索房价走势"""
-        results = []
-        with DDGS() as ddgs:
-            query = f"{suburb} Melbourne hospital medical centre healthcare facilities"
-            logger.info(f"医疗搜索词: {query}")
-            search_results = list(ddgs.text(query, max_results=10))
-            logger.info(f"医疗原始结果数: {len(search_results)}")
-            
-            for result in search_results:
-                if self._is_relevant_property(result.get('body', '')):
-                    results.append({
-                        'title': result.get('title', ''),
-                        'link': result.get('link', ''),
-                        'summary': result.get('body', '')[:500] + '...',
-                        'date': self._extract_date(result.get('body', ''))
-                    })
-            logger.info(f"医疗过滤后结果数: {len(results)}")
-        return results
-    
-    def _is_relevant_infrastructure(self, text: str) -> bool:
-        """检查是否为相关的基础设施信息"""
-        keywords = self.categories['infrastructure']
-        return any(keyword.lower() in text.lower() for keyword in keywords)
-    
-    def _is_relevant_crime(self, text: str) -> bool:
-        """检查是否为相关的犯罪统计信息"""
-        keywords = self.categories['crime']
-        return any(keyword.lower() in text.lower() for keyword in keywords)
-    
-    def _is_relevant_property(self, text: str) -> bool:
-        """检查是否为相关的房产信息"""
-        keywords = self.categories['property']
-        return any(keyword.lower() in text.lower() for keyword in keywords)
-    
-    def _extract_date(self, text: str) -> str:
-        """从文本中提取日期"""
-        # 简单的日期提取示例
-        date_pattern = r'\d{4}[-/]\d{1,2}[-/]\d{1,2}'
-        match = re.search(date_pattern, text)
-        return match.group(0) if match else '' 
\ No newline at end of file
+        return self._search_category(suburb, 'property',
+                                     f"{suburb} Melbourne hospital medical centre healthcare facilities", '医疗', max_age)
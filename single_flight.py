@@ -0,0 +1,216 @@
+"""请求合并（single-flight）：相同key的并发请求只执行一次，其余请求共享结果"""
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只能使用进程内合并
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """一次正在进行中的调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """相同key的并发调用合并为一次
+
+    - 进程内：同一进程的多个线程等待同一个 _Call
+    - 跨进程（lock_dir 不为空）：领头线程再通过文件锁与同一主机上的其他
+      gunicorn worker 协调，拿到锁后先执行 recheck()（通常是查缓存），
+      若其他进程已经生成结果则直接复用
+    """
+
+    def __init__(self, lock_dir=None, timeout=120, poll_interval=0.05):
+        self.lock_dir = lock_dir if fcntl else None
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'leaders': 0, 'shared': 0, 'cross_process_hits': 0}
+        if lock_dir and not fcntl:
+            logger.warning("当前平台不支持文件锁，仅启用进程内请求合并")
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key, fn, recheck=None):
+        """执行 fn 或等待正在进行的同key调用，返回 (结果, 是否为共享结果)"""
+        call, leader = self.begin(key)
+        if not leader:
+            return self.wait(key, call), True
+
+        result = error = None
+        try:
+            result = self._run_leader(key, fn, recheck)
+        except Exception as e:
+            error = e
+        finally:
+            self.finish(key, call, result, error)
+
+        if error is not None:
+            raise error
+        return result, False
+
+    def begin(self, key):
+        """登记一次调用，返回 (call, 是否为领头调用)
+
+        供无法包装成单个函数的场景（如流式生成）使用，领头方必须调用 finish()
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['shared'] += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self._stats['leaders'] += 1
+            return call, True
+
+    def wait(self, key, call):
+        """等待领头调用完成并返回其结果"""
+        if not call.event.wait(self.timeout):
+            raise TimeoutError(f"等待合并请求超时: {key}")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def finish(self, key, call, result=None, error=None):
+        """领头调用完成，唤醒所有等待者"""
+        call.result = result
+        call.error = error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.event.set()
+
+    def in_flight(self):
+        """当前正在进行中的调用数"""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+    def _run_leader(self, key, fn, recheck):
+        if not self.lock_dir:
+            if recheck:
+                result = recheck()
+                if result is not None:
+                    return result
+            return fn()
+
+        lock_path = os.path.join(self.lock_dir, f"{key}.lock")
+        with open(lock_path, 'a') as lock_file:
+            locked = self._acquire_file_lock(lock_file)
+            try:
+                if recheck:
+                    result = recheck()
+                    if result is not None:
+                        with self._lock:
+                            self._stats['cross_process_hits'] += 1
+                        return result
+                return fn()
+            finally:
+                if locked:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _acquire_file_lock(self, lock_file):
+        """非阻塞轮询获取文件锁，超时后不再等待直接执行"""
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    logger.warning(f"获取文件锁超时，直接执行: {lock_file.name}")
+                    return False
+                time.sleep(self.poll_interval)
+
+
+class AsyncSingleFlight:
+    """asyncio 版本的请求合并，同一事件循环内相同key的协程共享一次调用"""
+
+    def __init__(self, timeout=120):
+        self.timeout = timeout
+        self._futures = {}
+        self._stats = {'leaders': 0, 'shared': 0}
+
+    async def do(self, key, coro_fn, recheck=None):
+        """执行 coro_fn() 或等待正在进行的同key调用，返回 (结果, 是否为共享结果)
+
+        recheck 可以是普通函数或返回 awaitable 的函数（如 run_blocking 包装的缓存查询）
+        """
+        future, leader = self.begin(key)
+        if not leader:
+            return await self.wait(key, future), True
+
+        try:
+            result = recheck() if recheck else None
+            if inspect.isawaitable(result):
+                result = await result
+            if result is None:
+                result = await coro_fn()
+        except asyncio.CancelledError:
+            self.finish(key, future, cancelled=True)
+            raise
+        except Exception as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result, False
+
+    def begin(self, key):
+        """登记一次调用，返回 (future, 是否为领头调用)
+
+        供无法包装成单个协程的场景（如流式生成）使用，领头方必须调用 finish()
+        """
+        future = self._futures.get(key)
+        if future is not None:
+            self._stats['shared'] += 1
+            return future, False
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        self._stats['leaders'] += 1
+        return future, True
+
+    async def wait(self, key, future):
+        """等待领头调用完成并返回其结果"""
+        # shield 防止某个等待者超时取消时连带取消领头调用
+        return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+
+    def finish(self, key, future, result=None, error=None, cancelled=False):
+        """领头调用完成，唤醒所有等待者"""
+        if self._futures.get(key) is future:
+            del self._futures[key]
+        if future.done():
+            return
+        if cancelled:
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+        else:
+            future.set_result(result)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['in_flight'] = len(self._futures)
+        return stats
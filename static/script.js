@@ -24,7 +24,20 @@ document.addEventListener('DOMContentLoaded', function() {
         const startTime = new Date();
 
         try {
-            const response = await fetch('/search', {
+            // 先读取已缓存的报告：浏览器自动带上 If-None-Match，内容未变时服务器只返回304
+            const cachedResponse = await fetch(`/search?suburb=${encodeURIComponent(suburb)}`);
+            if (cachedResponse.ok) {
+                const data = await cachedResponse.json();
+                const analysisTime = ((new Date() - startTime) / 1000).toFixed(1);
+                hideLoading();
+                startReport(suburb);
+                finishReport(data.analysis, analysisTime, data.html);
+                updateAPIUsage();
+                return;
+            }
+
+            // 尚未缓存（404）时流式生成
+            const response = await fetch('/search/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -33,13 +46,37 @@ document.addEventListener('DOMContentLoaded', function() {
             });
 
             if (!response.ok) {
-                throw new Error('服务器响应错误');
+                // 流式开始前的错误（参数错误、超出预算等）以JSON返回
+                const data = await response.json().catch(() => ({}));
+                showError(data.error || '服务器响应错误');
+                return;
             }
 
-            const data = await response.json();
-            
-            if (data.error) {
-                showError(data.error);
+            let analysis = '';
+            let html = null;
+            let started = false;
+            let failed = false;
+
+            await readEventStream(response, (event, data) => {
+                if (event === 'delta') {
+                    if (!started) {
+                        // 收到首个片段即隐藏加载动画并开始渲染
+                        hideLoading();
+                        startReport(suburb);
+                        started = true;
+                    }
+                    analysis += data.text;
+                    scheduleRender(analysis);
+                } else if (event === 'done') {
+                    // 服务端渲染并转义过的HTML，替换流式阶段的临时渲染
+                    html = data.html || null;
+                } else if (event === 'error') {
+                    failed = true;
+                    showError(data.error);
+                }
+            });
+
+            if (failed) {
                 return;
             }
 
@@ -47,7 +84,10 @@ document.addEventListener('DOMContentLoaded', function() {
             const endTime = new Date();
             const analysisTime = ((endTime - startTime) / 1000).toFixed(1);
 
-            displayReport(suburb, data.analysis, analysisTime);
+            if (!started) {
+                startReport(suburb);
+            }
+            finishReport(analysis, analysisTime, html);
             // 搜索完成后立即更新API使用量
             updateAPIUsage();
 
@@ -59,6 +99,34 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    // 区域名自动补全
+    const suggestionList = document.getElementById('suburbSuggestions');
+    let suggestTimer = null;
+    searchInput.addEventListener('input', function() {
+        clearTimeout(suggestTimer);
+        const query = searchInput.value.trim();
+        if (query.length < 2) {
+            return;
+        }
+        suggestTimer = setTimeout(async () => {
+            try {
+                const response = await fetch(`/suggest?q=${encodeURIComponent(query)}`);
+                if (!response.ok) {
+                    return;
+                }
+                const data = await response.json();
+                suggestionList.innerHTML = '';
+                data.suggestions.forEach(item => {
+                    const option = document.createElement('option');
+                    option.value = item.postcode ? `${item.suburb} ${item.postcode}` : item.suburb;
+                    suggestionList.appendChild(option);
+                });
+            } catch (error) {
+                console.error('获取区域补全失败:', error);
+            }
+        }, 150);
+    });
+
     function showLoading() {
         loadingContainer.style.display = 'flex';
         loadingContainer.innerHTML = `
@@ -86,7 +154,65 @@ document.addEventListener('DOMContentLoaded', function() {
         reportSection.style.display = 'none';
     }
 
-    function displayReport(suburb, analysis, analysisTime) {
+    // 逐条解析Server-Sent Events，每条消息回调 onEvent(event, data)
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                message.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) {
+                        event = line.substring(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.substring(6);
+                    }
+                });
+                if (data) {
+                    onEvent(event, JSON.parse(data));
+                }
+            }
+        }
+    }
+
+    // 每帧最多渲染一次，避免每个token都重排整个报告
+    let pendingAnalysis = null;
+    function scheduleRender(analysis) {
+        const shouldSchedule = pendingAnalysis === null;
+        pendingAnalysis = analysis;
+        if (shouldSchedule) {
+            requestAnimationFrame(() => {
+                // finishReport 可能已经完成最终渲染
+                if (pendingAnalysis !== null) {
+                    renderAnalysis(pendingAnalysis);
+                    pendingAnalysis = null;
+                }
+            });
+        }
+    }
+
+    // html 为服务端渲染的报告，没有时（流式生成过程中）在前端临时渲染
+    function renderAnalysis(analysis, html) {
+        const content = reportSection.querySelector('.report-content');
+        if (content) {
+            content.innerHTML = html || formatAnalysis(analysis);
+        }
+    }
+
+    function startReport(suburb) {
         const currentDate = new Date().toLocaleDateString('zh-CN', {
             year: 'numeric',
             month: 'long',
@@ -98,22 +224,28 @@ document.addEventListener('DOMContentLoaded', function() {
             <div class="report-header">
                 <h2>${suburb} 区域分析报告</h2>
                 <p class="report-date">生成日期：${currentDate}</p>
-                <p class="analysis-time">分析耗时：${analysisTime} 秒</p>
+                <p class="analysis-time">正在生成...</p>
                 <p class="disclaimer">注意：本报告中的数据仅供参考，具体信息请以官方发布为准。</p>
             </div>
-            <div class="report-content">
-                ${formatAnalysis(analysis)}
-            </div>
+            <div class="report-content"></div>
+        `;
+
+        // 滚动到报告部分
+        reportSection.scrollIntoView({ behavior: 'smooth', block: 'start' });
+    }
+
+    function finishReport(analysis, analysisTime, html) {
+        pendingAnalysis = null;
+        renderAnalysis(analysis, html);
+        reportSection.querySelector('.analysis-time').textContent = `分析耗时：${analysisTime} 秒`;
+        reportSection.insertAdjacentHTML('beforeend', `
             <button class="print-button" onclick="downloadPDF()">
                 <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke="currentColor">
                     <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M12 10v6m0 0l-3-3m3 3l3-3m2 8H7a2 2 0 01-2-2V5a2 2 0 012-2h5.586a1 1 0 01.707.293l5.414 5.414a1 1 0 01.293.707V19a2 2 0 01-2 2z" />
                 </svg>
                 下载PDF
             </button>
-        `;
-
-        // 滚动到报告部分
-        reportSection.scrollIntoView({ behavior: 'smooth', block: 'start' });
+        `);
     }
 
     function downloadPDF() {
@@ -196,8 +328,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (trimmedLine.startsWith('- ')) {
                     return `<li>${trimmedLine.substring(2)}</li>\n`;
                 }
-                if (trimmedLine.match(/^[a-zA-Z\u4e00-\u9fa5]\d*\./)) {
-                    return `<li>${trimmedLine.substring(trimmedLine.indexOf('.') + 1).trim()}</li>\n`;
+                // 序号为数字、单个字母或中文数字且后跟空格，与服务端 report_render.ORDERED 一致（不误判 "e.g."、"St."）
+                const ordered = trimmedLine.match(/^(?:\d+|[a-zA-Z]|[一二三四五六七八九十]+)\.\s+(.*)$/);
+                if (ordered) {
+                    return `<li>${ordered[1]}</li>\n`;
                 }
 
                 // 普通段落
@@ -0,0 +1,75 @@
+import asyncio
+
+from crawler import Crawler, ListingIndex
+
+
+class FakeService:
+    """按页码返回固定房源的 ScraperService 替身，记录抓取的页数"""
+    parallelism = 2
+
+    def __init__(self, pages, failing=()):
+        self.pages = pages
+        self.failing = set(failing)
+        self.requests = 0
+
+    async def scrape_many(self, jobs):
+        self.requests += len(jobs)
+        return [{'error': 'timeout', 'results': []} if page_number in self.failing
+                else {'error': None, 'results': self.pages.get(page_number, [])}
+                for _, page_number, _ in jobs]
+
+
+def listing(listing_id, price):
+    return {'link': f'/property-house-vic-point+cook-{listing_id}', 'price': price,
+            'address': f'{listing_id} Main St', 'details': '3 bed'}
+
+
+def crawl(crawler, suburb='point cook'):
+    return asyncio.run(crawler.crawl_suburb(suburb))
+
+
+def test_incremental_stops_on_unchanged_page_until_full_pass_is_due(tmp_path):
+    pages = {1: [listing(1000001, '$700k')], 2: [listing(1000002, '$650k')]}
+    service = FakeService(pages)
+    index = ListingIndex(str(tmp_path / 'listings.db'))
+    crawler = Crawler(service, index, max_pages=5, full_interval=3600)
+
+    first = crawl(crawler)
+    assert not first['incremental'] and first['new'] == 2
+    assert index.last_full_crawl('point cook') is not None
+
+    # 较早上架的房源改价：增量爬取在第1页无变化时停止，发现不了
+    pages[2] = [listing(1000002, '$620k')]
+    second = crawl(crawler)
+    assert second['incremental'] and second['stop_reason'] == 'unchanged' and second['changed'] == 0
+
+    # 上次完整遍历已超过 full_interval，本次完整遍历并发现变化
+    index.mark_full_crawl('point cook', 1)
+    third = crawl(crawler)
+    assert not third['incremental'] and third['stop_reason'] == 'end' and third['changed'] == 1
+    index.close()
+
+
+def test_full_interval_disabled(tmp_path):
+    index = ListingIndex(str(tmp_path / 'listings.db'))
+    crawler = Crawler(FakeService({}), index, full_interval=0)
+    assert not crawler.full_crawl_due('point cook')
+    index.close()
+
+
+def test_full_pass_with_failed_pages_is_not_recorded(tmp_path):
+    pages = {1: [listing(1000001, '$700k')], 2: [listing(1000002, '$650k')]}
+    service = FakeService(pages, failing={2})
+    index = ListingIndex(str(tmp_path / 'listings.db'))
+    crawler = Crawler(service, index, max_pages=5, full_interval=3600)
+
+    first = crawl(crawler)
+    assert first['errors'] == 1 and first['stop_reason'] == 'end'
+    assert index.last_full_crawl('point cook') is None
+
+    # 失败页恢复后，下次爬取仍为完整遍历并补上失败页的房源
+    service.failing.clear()
+    second = crawl(crawler)
+    assert not second['incremental'] and second['new'] == 1
+    assert index.last_full_crawl('point cook') is not None
+    index.close()
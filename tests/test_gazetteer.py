@@ -0,0 +1,56 @@
+import pytest
+
+from gazetteer import Gazetteer, edit_distance
+
+
+@pytest.fixture(scope='module')
+def gazetteer():
+    return Gazetteer.load()
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Bannockburn', 'bannockburn'),
+    ('Beaconsfield Upper', 'beaconsfield upper'),
+    ('Strathmore Heights', 'strathmore heights'),
+    ('Blackburn', 'blackburn'),
+    ('Point Cook, VIC 3030', 'point cook'),
+    ('3030', 'point cook'),
+    ('cbd', 'melbourne'),
+])
+def test_resolves_real_suburbs(gazetteer, text, expected):
+    assert gazetteer.resolve(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('point cok', 'point cook'),
+    ('hopers crosing', 'hoppers crossing'),
+    ('werribe', 'werribee'),
+    ('glen waverly', 'glen waverley'),
+    ('pont cook 3030', 'point cook'),
+])
+def test_corrects_small_typos(gazetteer, text, expected):
+    assert gazetteer.resolve(text) == expected
+
+
+@pytest.mark.parametrize('text', ['east', 'north', 'xyzzy'])
+def test_does_not_guess_from_fragments(gazetteer, text):
+    assert gazetteer.resolve(text) is None
+
+
+@pytest.mark.parametrize('text', ['Bannockburn', 'Beaconsfield Upper', 'Strathmore Heights', 'east'])
+def test_missing_suburb_is_not_corrected_to_a_neighbour(text):
+    """数据中没有的真实区域不应被"纠正"成名称相近的另一个区域"""
+    small = Gazetteer([('Blackburn', '3130'), ('Beaconsfield', '3807'), ('Strathmore', '3041'), ('Kew East', '3102')])
+    assert small.resolve(text) is None
+
+
+def test_bundles_full_state():
+    gazetteer = Gazetteer.load()
+    assert len(gazetteer) > 3000
+    assert gazetteer.suburbs_for_postcode('3331')
+
+
+def test_edit_distance():
+    assert edit_distance('blackbrun', 'blackburn', 2) == 1
+    assert edit_distance('kitten', 'sitting', 5) == 3
+    assert edit_distance('bannockburn', 'blackburn', 2) == 3
@@ -0,0 +1,27 @@
+import pytest
+
+from listing_store import parse_price
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('$650,000 min', (650000, 650000)),
+    ('$550,000 Kitchen reno', (550000, 550000)),
+    ('$700k-750k', (700000, 750000)),
+    ('$700-750k', (700000, 750000)),
+    ('$850,000 - 900k', (850000, 900000)),
+    ('$850,000 - $900,000', (850000, 900000)),
+    ('$600k to $650k', (600000, 650000)),
+    ('$1.2m', (1200000, 1200000)),
+    ('$1.2 million', (1200000, 1200000)),
+    ('$1.2m - $1.3m', (1200000, 1300000)),
+    ('Offers over $600k', (600000, 600000)),
+    ('$1,050,000', (1050000, 1050000)),
+    ('$850,000, 4 bed', (850000, 850000)),
+])
+def test_parse_price(text, expected):
+    assert parse_price(text) == expected
+
+
+@pytest.mark.parametrize('text', ['Contact agent', '$450 per week', '', None])
+def test_parse_price_without_sale_price(text):
+    assert parse_price(text) == (None, None)
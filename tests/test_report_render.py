@@ -0,0 +1,21 @@
+import pytest
+
+from report_render import render_report
+
+
+@pytest.mark.parametrize('line', [
+    'e.g. 学校排名以 2024 年数据为准',
+    'St. Albans 与 Point Cook 的房价相近',
+    '3.5% 的年增长率',
+])
+def test_sentences_with_dots_are_paragraphs(line):
+    assert render_report(line) == f'<p>{line}</p>'
+
+
+@pytest.mark.parametrize('line, item', [
+    ('1. 交通便利', '交通便利'),
+    ('a. 学校较多', '学校较多'),
+    ('一. 房价稳定', '房价稳定'),
+])
+def test_ordered_items(line, item):
+    assert f'<li>{item}</li>' in render_report(line)
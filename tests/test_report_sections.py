@@ -0,0 +1,26 @@
+import pytest
+
+from report_sections import SectionCleaner, clean_section
+
+SECTION = {'name': 'prices', 'titles': ['房价趋势与推动因素']}
+
+
+@pytest.mark.parametrize('deltas', [
+    ['# 房价', '趋势与推动因素\n', '中位价上涨'],
+    ['好的，以下是分析：\n', '#', ' 房价趋势与推动因素\n中位价上涨'],
+    ['中位价', '上涨'],
+    ['\n\n', '# 房价趋势与推动因素\n## 中位价\n上涨'],
+    ['# 房价趋势与推动因素\n中位价上涨\n', '\n'],
+    ['# 房价趋势与推动因素\n中位价 ', ' \n\n', '上涨  \n'],
+    ['中位价上涨 \n'],
+])
+def test_section_cleaner_matches_clean_section(deltas):
+    cleaner = SectionCleaner(SECTION)
+    streamed = ''.join(cleaner.feed(delta) for delta in deltas) + cleaner.close()
+    assert streamed == clean_section(''.join(deltas), SECTION)
+
+
+def test_section_cleaner_empty_stream():
+    cleaner = SectionCleaner(SECTION)
+    assert cleaner.feed('') == ''
+    assert cleaner.close() == ''
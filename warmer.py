@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""缓存预热（refresh-ahead）：热门区域的报告和搜索结果在过期前由后台重新生成
+
+缓存过期后的第一个用户要等待完整的生成时间（10~30秒）。预热器按区域的请求次数取前N个热门区域，
+在报告分段和搜索结果过期之前重新生成，热门区域始终命中缓存：
+
+- 热度：最近若干天内的请求次数（含缓存命中），由 APIUsageTracker 记录在使用量数据库中
+- 提前量：在下一轮预热之前会过期的条目本轮就刷新；配置了时间窗口时，"下一轮"为下一个窗口内的预热
+- 时间窗口：只在低峰时段（如 01:00-06:00）运行，不与用户请求争抢OpenAI配额
+- 预算：预热的费用单独统计，不超过月度预算的一定比例，也不会使总费用超过月度预算
+- 多个 gunicorn worker 各自启动预热器时，通过文件锁保证同一时间只有一个在执行
+
+用法：
+    python warmer.py --dry-run   # 列出热门区域及即将过期的报告分段
+    python warmer.py --once      # 立即执行一轮预热（忽略时间窗口，适合由cron调度）
+    python warmer.py             # 常驻运行，按间隔和时间窗口调度
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，多进程部署时只应在一个进程中启用预热
+    fcntl = None
+
+from rate_limiter import is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+
+def parse_windows(spec: str) -> List[Tuple[int, int]]:
+    """解析时间窗口，如 "01:00-06:00,22:30-23:30"，返回 [(开始分钟, 结束分钟)]
+
+    结束早于开始表示跨越午夜；空字符串表示不限时间。
+    """
+    windows = []
+    for part in (spec or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            start, end = (datetime.strptime(value.strip(), '%H:%M') for value in part.split('-'))
+        except ValueError:
+            raise ValueError(f"无效的时间窗口: {part}（格式为 HH:MM-HH:MM）")
+        windows.append((start.hour * 60 + start.minute, end.hour * 60 + end.minute))
+    return windows
+
+
+def in_windows(windows: Sequence[Tuple[int, int]], when: datetime) -> bool:
+    """when 是否落在任一时间窗口内；没有配置窗口时总是返回True"""
+    if not windows:
+        return True
+    minute = when.hour * 60 + when.minute
+    for start, end in windows:
+        if start <= end:
+            if start <= minute < end:
+                return True
+        elif minute >= start or minute < end:
+            return True
+    return False
+
+
+def next_window_start(windows: Sequence[Tuple[int, int]], when: datetime) -> datetime:
+    """when 之后（含）第一个落在时间窗口内的时刻"""
+    if in_windows(windows, when):
+        return when
+    base = when.replace(second=0, microsecond=0)
+    candidates = []
+    for start, _ in windows:
+        candidate = base.replace(hour=start // 60, minute=start % 60)
+        if candidate < when:
+            candidate += timedelta(days=1)
+        candidates.append(candidate)
+    return min(candidates)
+
+
+class RefreshAheadWarmer:
+    """后台预热调度
+
+    popular(limit) 返回按请求次数降序的 [(区域, 次数)]；stale(suburb, horizon) 返回在时间戳 horizon
+    之前会过期或尚未缓存的报告分段名；refresh(suburb, sections) 重新生成这些分段；
+    refresh_search(suburb, horizon)（可选）刷新在 horizon 之前会过期的搜索结果；
+    budget_check() 在每次调用OpenAI前检查预热预算，返回False时本轮只刷新搜索结果。
+    """
+
+    def __init__(self, popular: Callable[[int], List[Tuple[str, int]]],
+                 stale: Callable[[str, float], List[str]],
+                 refresh: Callable[[str, List[str]], object],
+                 refresh_search: Optional[Callable[[str, float], object]] = None,
+                 budget_check: Optional[Callable[[], bool]] = None,
+                 top_n: int = 20, interval: float = 900, lead_time: float = 600,
+                 windows: Sequence[Tuple[int, int]] = (), lock_path: Optional[str] = None):
+        self.popular = popular
+        self.stale = stale
+        self.refresh = refresh
+        self.refresh_search = refresh_search
+        self.budget_check = budget_check
+        self.top_n = top_n
+        self.interval = interval
+        self.lead_time = lead_time
+        self.windows = list(windows)
+        self.lock_path = lock_path if fcntl else None
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'passes': 0,
+            'refreshed_suburbs': 0,
+            'refreshed_sections': 0,
+            'searched_suburbs': 0,
+            'budget_skips': 0,
+            'failures': 0,
+            'last_run': None,
+            'last_duration': None
+        }
+        if self.lock_path:
+            os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+
+    def horizon(self, now: Optional[datetime] = None) -> float:
+        """本轮需要覆盖的时间点：下一轮预热开始的时刻加上提前量（生成本身也需要时间）"""
+        now = now or datetime.now()
+        next_run = now + timedelta(seconds=self.interval)
+        if self.windows:
+            next_run = next_window_start(self.windows, next_run)
+        return next_run.timestamp() + self.lead_time
+
+    def plan(self, now: Optional[datetime] = None) -> List[Dict]:
+        """列出热门区域及其在 horizon 之前会过期的报告分段"""
+        horizon = self.horizon(now)
+        return [
+            {'suburb': suburb, 'requests': requests, 'sections': self.stale(suburb, horizon)}
+            for suburb, requests in self.popular(self.top_n)
+        ]
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict:
+        """执行一轮预热，返回本轮统计；另一个进程或线程正在预热时直接跳过"""
+        if not self._run_lock.acquire(blocking=False):
+            return {'skipped': 'running'}
+        try:
+            lock_file = self._acquire_file_lock()
+            if lock_file is False:
+                return {'skipped': 'locked'}
+            try:
+                return self._run(now)
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                    lock_file.close()
+        finally:
+            self._run_lock.release()
+
+    def _run(self, now):
+        start_time = time.time()
+        horizon = self.horizon(now)
+        summary = {'suburbs': 0, 'refreshed': 0, 'sections': 0, 'searches': 0, 'budget_skips': 0, 'failures': 0}
+        for suburb, requests in self.popular(self.top_n):
+            if self._stop.is_set():
+                break
+            summary['suburbs'] += 1
+            try:
+                # 先刷新搜索结果，随后重新生成的分段直接使用新结果
+                if self.refresh_search:
+                    self.refresh_search(suburb, horizon)
+                    summary['searches'] += 1
+                sections = self.stale(suburb, horizon)
+                if not sections:
+                    continue
+                if self.budget_check and not self.budget_check():
+                    summary['budget_skips'] += 1
+                    continue
+                logger.info(f"预热 {suburb}（{requests}次请求）: {', '.join(sections)}")
+                self.refresh(suburb, sections)
+                summary['refreshed'] += 1
+                summary['sections'] += len(sections)
+            except Exception as e:
+                summary['failures'] += 1
+                if is_rate_limit_error(e):
+                    # 配额已被用户请求占满，剩余区域留到下一轮
+                    logger.warning(f"预热 {suburb} 时遇到限流，结束本轮预热")
+                    break
+                logger.error(f"预热 {suburb} 失败: {str(e)}")
+
+        elapsed = time.time() - start_time
+        if summary['budget_skips']:
+            logger.warning(f"预热预算已用完，{summary['budget_skips']} 个区域未刷新")
+        logger.info(f"预热完成，用时: {elapsed:.2f}秒，{summary['suburbs']} 个热门区域，"
+                    f"刷新 {summary['refreshed']} 个区域的 {summary['sections']} 个分段")
+        with self._stats_lock:
+            self._stats['passes'] += 1
+            self._stats['refreshed_suburbs'] += summary['refreshed']
+            self._stats['refreshed_sections'] += summary['sections']
+            self._stats['searched_suburbs'] += summary['searches']
+            self._stats['budget_skips'] += summary['budget_skips']
+            self._stats['failures'] += summary['failures']
+            self._stats['last_run'] = datetime.fromtimestamp(start_time).isoformat(timespec='seconds')
+            self._stats['last_duration'] = round(elapsed, 3)
+        summary['elapsed'] = round(elapsed, 3)
+        return summary
+
+    def _acquire_file_lock(self):
+        """非阻塞获取跨进程文件锁：未配置时返回None，已被其他进程持有时返回False"""
+        if not self.lock_path:
+            return None
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except BlockingIOError:
+            lock_file.close()
+            return False
+
+    def serve(self):
+        """按间隔循环预热，时间窗口之外只等待，直到 stop() 被调用"""
+        logger.info(f"预热器已启动：每{self.interval:.0f}秒检查前{self.top_n}个热门区域")
+        while not self._stop.is_set():
+            if in_windows(self.windows, datetime.now()):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error(f"预热失败: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """在后台守护线程中运行 serve()，重复调用不会启动多个线程"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.serve, name='warmer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='热门区域缓存预热')
+    parser.add_argument('--once', action='store_true', help='立即执行一轮预热后退出（忽略时间窗口）')
+    parser.add_argument('--dry-run', action='store_true', help='只列出热门区域及即将过期的报告分段')
+    parser.add_argument('--top', type=int, help='预热的热门区域数（默认取 WARMER_TOP_N）')
+    args = parser.parse_args()
+
+    # 延迟导入，避免仅查看帮助时也初始化OpenAI客户端
+    import app
+
+    warmer = app.warmer
+    if args.top:
+        warmer.top_n = args.top
+
+    if args.dry_run:
+        plan = warmer.plan()
+        if not plan:
+            print("没有达到热度门槛的区域")
+        for item in plan:
+            sections = ', '.join(item['sections']) or '无需刷新'
+            print(f"{item['suburb']}（{item['requests']}次请求）: {sections}")
+        return 0
+
+    if args.once:
+        summary = warmer.run_once()
+        if summary.get('skipped'):
+            print("另一个进程正在预热，本次跳过")
+            return 0
+        print(f"完成：{summary['suburbs']} 个热门区域，刷新 {summary['refreshed']} 个区域的 "
+              f"{summary['sections']} 个分段，失败 {summary['failures']} 个")
+        if summary['budget_skips']:
+            print(f"预热预算已用完，{summary['budget_skips']} 个区域未刷新")
+        return 0 if summary['failures'] == 0 else 1
+
+    try:
+        warmer.serve()
+    except KeyboardInterrupt:
+        warmer.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
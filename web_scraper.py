@@ -2,140 +2,394 @@
 
 import asyncio
 import argparse
-from playwright.async_api import async_playwright
+import logging
+import statistics
+import time
+from urllib.parse import quote_plus
 from rich.console import Console
 from rich.table import Table
 import re
 from datetime import datetime
 
-async def fetch_property_data(suburb: str, context) -> dict:
+from metrics import track_upstream
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+BASE_URL = 'https://www.realestate.com.au/buy'
+
+# 房产卡片的候选选择器，按优先级排列
+LISTING_CARD_SELECTORS = [
+    '[data-testid="residential-card"]',
+    '.residential-card',
+    '.property-card',
+    '.property-listing'
+]
+
+# 房产卡片字段提取规则：字段 -> 按顺序尝试的选择器，"选择器@属性" 表示读取属性而不是文本
+LISTING_SPEC = {
+    'price': ['.property-price', '[data-testid="listing-price"]', '.price'],
+    'address': ['.property-address', '[data-testid="address"]', '.address'],
+    'details': ['.property-features', '[data-testid="property-features"]', '.features'],
+    'link': ['a.details-link@href', 'a[href*="/property-"]@href']
+}
+
+# 在页面内一次性执行：找到房产卡片后按规则提取所有卡片的所有字段
+EXTRACT_SCRIPT = """
+([cardSelectors, spec]) => {
+    let cards = [];
+    for (const selector of cardSelectors) {
+        cards = document.querySelectorAll(selector);
+        if (cards.length) break;
+    }
+    const read = (card, selectors) => {
+        for (const rule of selectors) {
+            const [css, attr] = rule.split('@');
+            const el = card.querySelector(css);
+            if (!el) continue;
+            const value = attr ? (attr === 'href' ? el.href : el.getAttribute(attr)) : el.innerText;
+            if (value) return value.trim();
+        }
+        return '';
+    };
+    return Array.from(cards, card => {
+        const record = {};
+        for (const [field, selectors] of Object.entries(spec)) {
+            record[field] = read(card, selectors);
+        }
+        return record;
+    });
+}
+"""
+
+# 快速加载模式默认只放行这些资源类型（页面由脚本渲染，脚本和接口请求必须保留）
+DEFAULT_ALLOWED_RESOURCES = ('document', 'script', 'xhr', 'fetch')
+
+# 无论资源类型如何都拦截的广告和统计请求
+BLOCKED_URL_PATTERNS = (
+    'doubleclick.net', 'googlesyndication.com', 'googletagmanager.com', 'google-analytics.com',
+    'facebook.net', 'hotjar.com', 'newrelic.com', 'nr-data.net', 'adnxs.com', 'criteo',
+    '/ads/', '/analytics/', '/beacon'
+)
+
+
+def build_search_url(suburb: str, page: int = 1, postcode: str = None, sort: str = None) -> str:
+    """构建realestate.com.au的搜索列表URL，例如 "Point Cook 3030" -> in-point+cook,+vic+3030/list-1
+
+    postcode 未指定时从 suburb 中提取；sort 例如 list-date（最新上架优先）
+    """
+    match = re.search(r'\b(\d{4})\b', suburb)
+    postcode = postcode or (match.group(1) if match else None)
+    name = re.sub(r'\b\d{4}\b', '', suburb).strip().lower()
+    location = quote_plus(name)
+    if postcode:
+        location += f",+vic+{postcode}"
+    url = f"{BASE_URL}/in-{location}/list-{page}"
+    if sort:
+        url += f"?activeSort={sort}"
+    return url
+
+
+async def enable_fast_load(target, allowed_resources=DEFAULT_ALLOWED_RESOURCES):
+    """在页面或浏览器上下文上拦截非必要资源（图片、字体、样式、媒体、广告统计等）"""
+    allowed = frozenset(allowed_resources)
+
+    async def handle_route(route):
+        request = route.request
+        if request.resource_type not in allowed or any(p in request.url for p in BLOCKED_URL_PATTERNS):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await target.route('**/*', handle_route)
+
+
+async def scrape_listing_page(page, url: str, fast_load: bool = False) -> list:
+    """在已打开的页面上加载搜索列表并提取房产信息
+
+    fast_load 为True时只等到DOM解析完成、房产卡片出现即开始提取，
+    不再等待两次 networkidle（资源拦截由 enable_fast_load 负责）
+    """
+    print(f"正在获取 {url} 的数据...")
+
+    with track_upstream('playwright', 'page_load'):
+        if fast_load:
+            await page.goto(url, wait_until='domcontentloaded', timeout=30000)
+            try:
+                await page.wait_for_selector(', '.join(LISTING_CARD_SELECTORS), timeout=15000)
+            except Exception:
+                print("等待房产卡片超时")
+        else:
+            # 设置更长的超时时间
+            await page.goto(url, wait_until='networkidle', timeout=30000)
+
+            # 等待页面加载完成
+            await page.wait_for_load_state('networkidle')
+
+    # 打印页面标题，用于调试
+    title = await page.title()
+    print(f"页面标题: {title}")
+
+    # 在页面内一次性提取所有卡片，不再逐个元素往返
+    records = await extract_listings(page)
+    if not records:
+        print("未能找到任何房产信息，可能需要更新选择器")
+        return []
+    print(f"找到 {len(records)} 个房产信息")
+
+    results = []
+    for record in records:
+        if record.get('price') or record.get('address') or record.get('details'):
+            results.append({
+                "price": record.get('price') or "价格未公布",
+                "address": record.get('address') or "地址未知",
+                "details": record.get('details') or "详情未知",
+                "link": record.get('link', '')
+            })
+
+    return results
+
+
+async def extract_listings(page, spec: dict = LISTING_SPEC, card_selectors: list = LISTING_CARD_SELECTORS) -> list:
+    """按声明式规则在一次页面脚本调用中提取所有房产卡片，返回字段字典列表"""
+    return await page.evaluate(EXTRACT_SCRIPT, [card_selectors, spec])
+
+
+async def fetch_property_data(suburb: str, context, page_number: int = 1, fast_load: bool = False,
+                              allowed_resources=DEFAULT_ALLOWED_RESOURCES) -> list:
     """抓取特定区域的房产数据"""
     page = await context.new_page()
     try:
-        # 构建搜索URL
-        url = f"https://www.realestate.com.au/buy/in-point+cook,+vic+3030/list-1"
-        print(f"正在获取 {url} 的数据...")
-        
-        # 设置更长的超时时间
-        await page.goto(url, wait_until='networkidle', timeout=30000)
-        
-        # 等待页面加载完成
-        await page.wait_for_load_state('networkidle')
-        
-        # 打印页面标题，用于调试
-        title = await page.title()
-        print(f"页面标题: {title}")
-        
-        # 获取房产列表
-        # 尝试多个可能的选择器
-        selectors = [
-            '[data-testid="residential-card"]',
-            '.residential-card',
-            '.property-card',
-            '.property-listing'
-        ]
-        
-        properties = []
-        for selector in selectors:
-            try:
-                print(f"尝试使用选择器: {selector}")
-                properties = await page.query_selector_all(selector)
-                if properties:
-                    print(f"找到 {len(properties)} 个房产信息")
-                                break
-            except Exception as e:
-                print(f"选择器 {selector} 失败: {str(e)}")
-                continue
-        
-        if not properties:
-            print("未能找到任何房产信息，可能需要更新选择器")
-            return []
-        
-        results = []
-        for prop in properties[:10]:  # 只获取前10个结果
-            try:
-                # 获取价格
-                price = ""
-                for price_selector in ['.property-price', '[data-testid="listing-price"]', '.price']:
-                    price_elem = await prop.query_selector(price_selector)
-                    if price_elem:
-                        price = await price_elem.inner_text()
-                        break
-                
-                # 获取地址
-                address = ""
-                for addr_selector in ['.property-address', '[data-testid="address"]', '.address']:
-                    addr_elem = await prop.query_selector(addr_selector)
-                    if addr_elem:
-                        address = await addr_elem.inner_text()
-                        break
-                
-                # 获取详情
-                details = ""
-                for details_selector in ['.property-features', '[data-testid="property-features"]', '.features']:
-                    details_elem = await prop.query_selector(details_selector)
-                    if details_elem:
-                        details = await details_elem.inner_text()
-                        break
-                
-                if price or address or details:
-                    results.append({
-                        "price": price or "价格未公布",
-                        "address": address or "地址未知",
-                        "details": details or "详情未知"
-                    })
-                    
-            except Exception as e:
-                print(f"处理房产信息时出错: {str(e)}")
-                continue
-        
-        return results
+        if fast_load:
+            await enable_fast_load(page, allowed_resources)
+        return await scrape_listing_page(page, build_search_url(suburb, page_number), fast_load)
     except Exception as e:
         print(f"获取数据时出错: {str(e)}")
         return []
     finally:
         await page.close()
 
+
+class ScraperService:
+    """常驻爬虫服务
+
+    浏览器只启动一次（无头模式），维护一组浏览器上下文，每个工作协程在其上下文中
+    保持一个常开的页面。抓取任务放入队列，由 parallelism 个工作协程并发处理，
+    每个任务记录排队时间和抓取耗时。fast_load 为True时在上下文上拦截
+    allowed_resources 以外的资源。
+
+    用法：
+        async with ScraperService(parallelism=4) as service:
+            results = await service.scrape_many([("Point Cook 3030", 1), ("Werribee 3030", 1)])
+    """
+
+    def __init__(self, parallelism: int = 4, contexts: int = 2, headless: bool = True, user_agent: str = USER_AGENT,
+                 fast_load: bool = True, allowed_resources=DEFAULT_ALLOWED_RESOURCES):
+        self.parallelism = max(1, parallelism)
+        self.fast_load = fast_load
+        self.allowed_resources = allowed_resources
+        self.context_count = max(1, min(contexts, self.parallelism))
+        self.headless = headless
+        self.user_agent = user_agent
+        self._playwright = None
+        self._browser = None
+        self._contexts = []
+        self._queue = None
+        self._workers = []
+        self._latencies = []
+        self._failures = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def start(self):
+        """启动浏览器、上下文池和工作协程"""
+        # playwright 只在启动浏览器时导入，导入本模块（如 crawler.py 的只读命令）不承担其开销
+        from playwright.async_api import async_playwright
+
+        start_time = time.perf_counter()
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        self._contexts = [
+            await self._browser.new_context(user_agent=self.user_agent)
+            for _ in range(self.context_count)
+        ]
+        if self.fast_load:
+            for context in self._contexts:
+                await enable_fast_load(context, self.allowed_resources)
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(self._contexts[i % self.context_count]))
+            for i in range(self.parallelism)
+        ]
+        print(f"爬虫服务已启动，浏览器启动耗时 {time.perf_counter() - start_time:.2f}秒，并发页面数 {self.parallelism}")
+
+    async def stop(self):
+        """停止工作协程并关闭浏览器"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._browser:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def submit(self, suburb: str, page_number: int = 1, url: str = None) -> asyncio.Future:
+        """提交抓取任务，返回在任务完成时得到结果的Future；url 为空时按区域和页码构建"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait({
+            'suburb': suburb,
+            'page': page_number,
+            'url': url or build_search_url(suburb, page_number),
+            'submitted_at': time.perf_counter(),
+            'future': future
+        })
+        return future
+
+    async def scrape_many(self, jobs) -> list:
+        """并发处理多个 (区域, 页码) 或 (区域, 页码, URL) 任务，按提交顺序返回结果"""
+        return await asyncio.gather(*(self.submit(*job) for job in jobs))
+
+    async def _new_page(self, context):
+        """创建工作页面，失败时返回None，由下一个任务重试创建"""
+        try:
+            return await context.new_page()
+        except Exception as e:
+            logger.error(f"创建页面失败: {str(e)}")
+            return None
+
+    async def _close_page(self, page):
+        try:
+            await page.close()
+        except Exception as e:
+            logger.warning(f"关闭页面失败: {str(e)}")
+
+    async def _worker(self, context):
+        page = await self._new_page(context)
+        try:
+            while True:
+                job = await self._queue.get()
+                started_at = time.perf_counter()
+                result = {
+                    'suburb': job['suburb'],
+                    'page': job['page'],
+                    'url': job['url'],
+                    'results': [],
+                    'error': None,
+                    'queue_wait': round(started_at - job['submitted_at'], 3)
+                }
+                try:
+                    if page is None:
+                        page = await context.new_page()
+                    result['results'] = await scrape_listing_page(page, job['url'], self.fast_load)
+                except Exception as e:
+                    logger.error(f"获取数据时出错: {job['url']}: {str(e)}")
+                    result['error'] = str(e)
+                    self._failures += 1
+                result['latency'] = round(time.perf_counter() - started_at, 3)
+                self._latencies.append(result['latency'])
+                # 先交付结果再重建页面，重建失败也不会让 scrape_many 一直等待
+                if not job['future'].done():
+                    job['future'].set_result(result)
+                self._queue.task_done()
+                if result['error'] and page is not None:
+                    # 页面可能已崩溃，换一个新页面继续；创建失败时由下一个任务重试
+                    await self._close_page(page)
+                    page = await self._new_page(context)
+        finally:
+            if page is not None:
+                await self._close_page(page)
+
+    def stats(self) -> dict:
+        """返回已完成任务的耗时统计（秒）"""
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return {'jobs': 0, 'failures': self._failures}
+        return {
+            'jobs': len(latencies),
+            'failures': self._failures,
+            'avg': round(statistics.mean(latencies), 3),
+            'p50': round(statistics.median(latencies), 3),
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'max': latencies[-1]
+        }
+
+
 def display_results(results: list):
     """显示房产搜索结果"""
     console = Console()
     table = Table(show_header=True)
-    
+
     table.add_column("价格", style="bold cyan", width=30)
     table.add_column("地址", style="blue", width=40)
     table.add_column("详情", style="green", width=50)
-    
+
     for result in results:
         table.add_row(
             result.get("price", "N/A"),
             result.get("address", "N/A"),
             result.get("details", "N/A")
         )
-    
+
+    console.print(table)
+
+
+def display_job_stats(jobs: list, summary: dict):
+    """显示每个抓取任务的耗时"""
+    console = Console()
+    table = Table(show_header=True, title="任务耗时")
+
+    table.add_column("区域", style="bold cyan", width=30)
+    table.add_column("页码", width=6)
+    table.add_column("房产数", width=8)
+    table.add_column("排队(秒)", width=10)
+    table.add_column("抓取(秒)", width=10)
+    table.add_column("状态", width=20)
+
+    for job in jobs:
+        table.add_row(
+            job['suburb'], str(job['page']), str(len(job['results'])),
+            str(job['queue_wait']), str(job['latency']), job['error'] or "成功"
+        )
+
     console.print(table)
+    console.print(f"共 {summary.get('jobs', 0)} 个任务，失败 {summary.get('failures', 0)} 个，"
+                  f"平均 {summary.get('avg', 0)}秒，P50 {summary.get('p50', 0)}秒，P95 {summary.get('p95', 0)}秒")
+
 
 async def main():
     parser = argparse.ArgumentParser(description='获取特定区域的房产信息')
-    parser.add_argument('suburb', help='区域名称（例如：Point Cook）')
-    
+    parser.add_argument('suburbs', nargs='+', help='区域名称，可带邮编（例如："Point Cook 3030"），可指定多个')
+    parser.add_argument('--pages', type=int, default=1, help='每个区域抓取的列表页数（默认1）')
+    parser.add_argument('--parallel', type=int, default=4, help='并发页面数（默认4）')
+    parser.add_argument('--contexts', type=int, default=2, help='浏览器上下文数（默认2）')
+    parser.add_argument('--headful', action='store_true', help='显示浏览器窗口，便于调试')
+    parser.add_argument('--full-load', action='store_true', help='加载全部资源并等待networkidle（旧行为）')
+    parser.add_argument('--allow', nargs='+', default=list(DEFAULT_ALLOWED_RESOURCES),
+                        help=f"快速加载模式放行的资源类型（默认：{' '.join(DEFAULT_ALLOWED_RESOURCES)}）")
+
     args = parser.parse_args()
-    
-    async with async_playwright() as p:
-        # 启动浏览器，设置为有头模式以便调试
-        browser = await p.chromium.launch(headless=False)
-        try:
-            # 创建新的上下文并设置用户代理
-            context = await browser.new_context(
-                user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            )
-            results = await fetch_property_data(args.suburb, context)
-            if results:
-                print(f"\n{args.suburb}区域的房产信息：")
-                display_results(results)
+
+    jobs = [(suburb, page_number) for suburb in args.suburbs for page_number in range(1, args.pages + 1)]
+    async with ScraperService(parallelism=args.parallel, contexts=args.contexts, headless=not args.headful,
+                              fast_load=not args.full_load, allowed_resources=args.allow) as service:
+        outcomes = await service.scrape_many(jobs)
+        summary = service.stats()
+
+    for outcome in outcomes:
+        if outcome['results']:
+            print(f"\n{outcome['suburb']}区域第{outcome['page']}页的房产信息：")
+            display_results(outcome['results'])
         else:
-                print("未找到房产信息")
-        finally:
-            await browser.close()
+            print(f"\n{outcome['suburb']}区域第{outcome['page']}页未找到房产信息")
+    display_job_stats(outcomes, summary)
 
 if __name__ == '__main__':
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())